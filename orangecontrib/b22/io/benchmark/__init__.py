@@ -0,0 +1,310 @@
+"""Throughput benchmarks of the b22 readers.
+
+Synthetic files (see 'synthetic') are generated in a temporary
+directory and each is read in a fresh process, which reports the read
+time and its peak resident memory. Results are appended to a JSON lines
+file with the commit they were measured at, so that runs can be
+compared across commits::
+
+    python -m orangecontrib.b22.io.benchmark --size medium
+    python -m orangecontrib.b22.io.benchmark --size medium --compare 1a2b3c4
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from orangecontrib.b22.io import Nea2Reader, GWYReader, PerkinElmerReader
+from orangecontrib.b22.io.perkinelmer import read_sp_batch
+from orangecontrib.b22.io.utils import spectra_cache
+from orangecontrib.b22.io.benchmark import synthetic
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+
+
+# (columns, rows) of pixels, points per spectrum and channels per pixel.
+SIZES = {
+    "small"  : ((16, 16), 128, 4),
+    "medium" : ((64, 64), 256, 4),
+    "large"  : ((128, 128), 512, 6),
+}
+
+CASES = ["nea_v1", "nea_v2", "nea_v2_interferogram", "gsf", "sp", "fsm"]
+
+RESULTS_FILE = "b22-benchmarks.jsonl"
+
+
+
+
+def generate(case, directory, shape, points, channels):
+    """Write the synthetic file(s) of a case; return the path to read."""
+    path = os.path.join(directory, case)
+
+    if case == "nea_v1":
+        synthetic.write_nea_v1(path + ".txt", shape, points, channels)
+        return path + ".txt"
+
+    if case == "nea_v2":
+        synthetic.write_nea_v2(path + ".txt", shape, points, channels)
+        return path + ".txt"
+
+    if case == "nea_v2_interferogram":
+        synthetic.write_nea_v2(path + ".txt", shape, points, channels,
+                               interferogram=True, runs=2)
+        return path + ".txt"
+
+    if case == "gsf":
+        synthetic.write_gsf(path + ".gsf", shape)
+        return path + ".gsf"
+
+    if case == "sp":
+        # One file per pixel, read as a folder.
+        synthetic.write_sp_folder(path, shape[0] * shape[1], points)
+        return path
+
+    if case == "fsm":
+        synthetic.write_fsm(path + ".fsm", shape, points)
+        return path + ".fsm"
+
+    raise ValueError(f"Unknown benchmark case '{case}'.")
+
+
+def read(case, path):
+    """Read a case's file(s) as the reader does; return the triplet."""
+    if case == "sp":
+        return read_sp_batch(path)
+
+    if case == "gsf":
+        return GWYReader(path).read_spectra()
+
+    if case == "fsm":
+        return PerkinElmerReader(path).read_spectra()
+
+    return Nea2Reader(path).read_spectra()
+
+
+def file_size(path):
+    if os.path.isdir(path):
+        return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+    return os.path.getsize(path)
+
+
+def peak_rss():
+    """Return the peak resident memory of this process (bytes), or None."""
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Kilobytes on Linux, bytes on macOS.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def measure(case, path):
+    """Read a case once in this process.
+
+    Returns
+    -------
+    tuple
+        The read time (s), the peak memory before and after reading
+        (bytes, or None) and the shape of the spectra.
+    """
+    spectra_cache.disable()
+    before = peak_rss()
+
+    start = time.perf_counter()
+    _, X, _ = read(case, path)
+    # Memory-mapped spectra are only read from disk when used.
+    np.asarray(X).sum()
+    seconds = time.perf_counter() - start
+
+    return seconds, before, peak_rss(), X.shape
+
+
+def measure_fresh(case, path):
+    """As 'measure', in a new process, so the peak memory is the read's own."""
+    context = multiprocessing.get_context("spawn")
+
+    with ProcessPoolExecutor(1, mp_context=context) as executor:
+        return executor.submit(measure, case, path).result()
+
+
+def commit():
+    """Return the short hash of the checked-out commit, or None."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(cases=None, size="small", shape=None, points=None, channels=None, repeat=3,
+        label=None):
+    """Benchmark the readers on synthetic files.
+
+    Parameters
+    ----------
+    cases : list | None
+        The cases (see 'CASES') to run; all if None.
+    size : str
+        A preset of 'SIZES'; 'shape', 'points' and 'channels' override
+        its values.
+    repeat : int
+        The number of reads of each file. The fastest read time and
+        the largest peak memory are reported.
+    label : str | None
+        A label stored with the results.
+
+    Returns
+    -------
+    list
+        A dict of results for each case.
+    """
+    default_shape, default_points, default_channels = SIZES[size]
+    shape = shape or default_shape
+    points = points or default_points
+    channels = channels or default_channels
+
+    info = {
+        "commit": commit(),
+        "label": label,
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+    results = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        for case in cases or CASES:
+            path = generate(case, directory, shape, points, channels)
+            n_bytes = file_size(path)
+
+            runs = [measure_fresh(case, path) for _ in range(repeat)]
+            seconds = min(r[0] for r in runs)
+            _, before, after, X_shape = max(runs, key=lambda r: r[2] or 0)
+
+            n_pixels = shape[0] * shape[1]
+
+            results.append(dict(info, **{
+                "case": case,
+                "pixels": n_pixels,
+                "points": points,
+                "channels": channels,
+                "rows": X_shape[0],
+                "columns": X_shape[1],
+                "bytes": n_bytes,
+                "seconds": seconds,
+                "mb_per_s": n_bytes / 1024**2 / seconds,
+                "us_per_pixel": seconds / n_pixels * 1e6,
+                "peak_rss_mb": None if after is None else after / 1024**2,
+                "read_rss_mb": None if after is None else (after - before) / 1024**2,
+            }))
+
+    return results
+
+
+def save(results, path=RESULTS_FILE):
+    with open(path, "a", encoding="utf-8") as f:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
+
+
+def load(path=RESULTS_FILE):
+    if not os.path.exists(path):
+        return []
+
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _key(result):
+    return result["case"], result["pixels"], result["points"], result["channels"]
+
+
+def report(results, previous=None):
+    """Format results as a table, with the time relative to 'previous'.
+
+    'previous' is a list of earlier results; the latest one of the same
+    case and size is compared with each result.
+    """
+    latest = {_key(result): result for result in previous or []}
+
+    header = f"{'case':<22}{'pixels':>8}{'points':>8}{'MB':>9}{'MB/s':>9}" \
+             f"{'us/pixel':>10}{'peak MB':>9}{'read MB':>9}"
+    if previous is not None:
+        header += f"{'vs ref':>8}"
+
+    def number(value, fmt):
+        return "-" if value is None else format(value, fmt)
+
+    lines = [header]
+    for result in results:
+        line = f"{result['case']:<22}{result['pixels']:>8}{result['columns']:>8}" \
+               f"{result['bytes'] / 1024**2:>9.1f}{result['mb_per_s']:>9.1f}" \
+               f"{result['us_per_pixel']:>10.1f}{number(result['peak_rss_mb'], '>9.1f')}" \
+               f"{number(result['read_rss_mb'], '>9.1f')}"
+
+        if previous is not None:
+            reference = latest.get(_key(result))
+            ratio = None if reference is None else result["seconds"] / reference["seconds"]
+            line += f"{'-':>8}" if ratio is None else f"{ratio:>7.2f}x"
+
+        lines.append(line)
+
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m orangecontrib.b22.io.benchmark",
+                                     description="Benchmark the b22 readers on synthetic files.")
+    parser.add_argument("--case", action="append", choices=CASES,
+                        help="a case to run (repeatable; default: all)")
+    parser.add_argument("--size", choices=list(SIZES), default="small")
+    parser.add_argument("--pixels", help="columns x rows, e.g. 64x32")
+    parser.add_argument("--points", type=int)
+    parser.add_argument("--channels", type=int)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--label", help="a label stored with the results")
+    parser.add_argument("--output", default=RESULTS_FILE,
+                        help=f"the results file (default: {RESULTS_FILE})")
+    parser.add_argument("--compare", metavar="REF",
+                        help="compare with the results of a commit or label")
+    parser.add_argument("--no-save", action="store_true", help="do not store the results")
+    args = parser.parse_args(argv)
+
+    shape = None
+    if args.pixels:
+        shape = tuple(int(n) for n in args.pixels.lower().split("x"))
+
+    results = run(args.case, args.size, shape, args.points, args.channels,
+                  args.repeat, args.label)
+
+    previous = None
+    if args.compare:
+        previous = [result for result in load(args.output)
+                    if args.compare in (result.get("commit"), result.get("label"))]
+
+    print(report(results, previous))
+
+    if not args.no_save:
+        save(results, args.output)
@@ -0,0 +1,5 @@
+from orangecontrib.b22.io.benchmark import main
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Writers of synthetic files in the formats read by the b22 readers.
+
+The files are made locally from random data, at any size, for the
+reader benchmarks. Large bodies are formatted by numpy rather than line
+by line, so that generating a file takes a fraction of reading it.
+"""
+
+import os
+import struct
+
+import numpy as np
+
+
+
+
+NEA_HEADER = [
+    "# www.neaspec.com",
+    "# Scan:\tSynthetic",
+    "# Project:\tBenchmark",
+    "# Scanner Center Position (X, Y):\t[µm]\t0.0\t0.0",
+    "# Rotation:\t[°]\t0.0",
+    "# Scan Area (X, Y, Z):\t[µm]\t{x}\t{y}\t0.0",
+    "# Pixel Area (X, Y, Z):\t[px]\t{x}\t{y}\t{z}",
+]
+
+
+def nea_channels(channels):
+    """Return 'channels' names of NeaSPEC O<n>A/O<n>P channels."""
+    return [f"O{n // 2}{'AP'[n % 2]}" for n in range(channels)]
+
+
+def write_nea_v1(path, shape, points, channels, runs=2, seed=0):
+    """Write a legacy NeaSPEC interferogram export.
+
+    Each pixel has an M (mirror position) channel and the O<n>A/O<n>P
+    channels of 'channels' // 2 harmonics (at least one) for each run.
+    """
+    rng = np.random.default_rng(seed)
+    names = ["M"] + nea_channels(max(2, channels - channels % 2))
+
+    cols, rows = shape
+    keys = np.array([(row, col, run) for row in range(rows) for col in range(cols)
+                     for run in range(runs)], dtype=float)
+
+    # One savetxt "row" holds all channels of a pixel and run.
+    values = rng.random((len(keys), len(names), points))
+    values[:, 0] = np.linspace(0, 10, points)
+
+    record = np.concatenate([np.repeat(keys[:, None], len(names), axis=1), values], axis=2)
+    fmt = "\n".join(f"%d\t%d\t%d\t{name}\t" + "\t".join(["%.6g"] * points) for name in names)
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("Row\tColumn\tRun\tChannel\t" + "\t".join(str(i) for i in range(points)) + "\n")
+        np.savetxt(f, record.reshape(len(keys), -1), fmt=fmt)
+
+
+def write_nea_v2(path, shape, points, channels, interferogram=False, runs=1, seed=0):
+    """Write a NeaSPEC (version 2) export of spectra or interferograms."""
+    rng = np.random.default_rng(seed)
+    names = nea_channels(channels)
+
+    cols, rows = shape
+
+    if interferogram:
+        columns = ["Row", "Column", "Run", "Depth"]
+        n_blocks = rows * cols * runs
+    else:
+        columns = ["Row", "Column", "Omega", "Wavenumber"]
+        n_blocks = rows * cols
+
+    body = np.empty((n_blocks, points, len(columns) + len(names)))
+    blocks = np.array([(row, col, run) for row in range(rows) for col in range(cols)
+                       for run in range(runs if interferogram else 1)], dtype=float)
+
+    body[:, :, 0] = blocks[:, None, 0]
+    body[:, :, 1] = blocks[:, None, 1]
+
+    if interferogram:
+        body[:, :, 2] = blocks[:, None, 2]
+        body[:, :, 3] = np.arange(points)
+    else:
+        body[:, :, 2] = np.arange(points)
+        body[:, :, 3] = np.linspace(1000.0, 2000.0, points)
+
+    body[:, :, len(columns):] = rng.random((n_blocks, points, len(names)))
+
+    fmt = ["%d"] * 3 + ["%.6g"] * (1 + len(names))
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(NEA_HEADER).format(x=cols, y=rows, z=points) + "\n")
+        f.write("\t".join(columns + names) + "\n")
+        # The exports end each line with a tab.
+        np.savetxt(f, body.reshape(-1, body.shape[2]), fmt=fmt, delimiter="\t", newline="\t\n")
+
+
+def write_gsf(path, shape, seed=0):
+    """Write a Gwyddion Simple Field of random heights."""
+    cols, rows = shape
+    field = np.random.default_rng(seed).random((rows, cols), dtype=np.float32)
+
+    header = ("Gwyddion Simple Field 1.0\n"
+              f"XRes = {cols}\n"
+              f"YRes = {rows}\n"
+              f"XReal = {float(cols)}\n"
+              f"YReal = {float(rows)}\n"
+              "Title = Synthetic\n").encode("utf-8")
+
+    with open(path, "wb") as f:
+        f.write(header)
+        f.write(b"\x00" * (4 - len(header) % 4))
+        f.write(field.astype("<f4").tobytes())
+
+
+def _block(block_id, payload):
+    return struct.pack("<Hi", block_id, len(payload)) + payload
+
+
+def _payload5104(values):
+    # The tagged strings and integers of the PerkinElmer metadata block.
+    data = b""
+
+    for value in values:
+        data += b"\x01"
+
+        if isinstance(value, str):
+            encoded = value.encode("utf-8")
+            data += b"#u" + struct.pack("<h", len(encoded)) + encoded + b"\x00" * 6
+        else:
+            data += b"$u" + struct.pack("<h", value) + b"\x00" * 6
+
+    return data + b"\x00\x00"
+
+
+PE_META = ["analyst", 1, "2024-01-02", 2, "image", "model", "serial", "software",
+           8, 16, 10, "detector", "source", "splitter", 14, "apodization"]
+
+
+def write_sp(path, points, seed=0, min_w=4000.0, max_w=400.0):
+    """Write a PerkinElmer .sp spectrum of random values."""
+    spectrum = np.random.default_rng(seed).random(points)
+
+    body = _block(121, _block(122, _payload5104(PE_META)))
+    body += _block(25739, struct.pack("<HH", 29987, 4) + b"C:/x")
+    body += _block(35698, struct.pack("<Hdd", 29981, min_w, max_w))
+    body += _block(35699, struct.pack("<Hdd", 29981, spectrum.min(), spectrum.max()))
+    body += _block(35700, struct.pack("<Hd", 29979, (max_w - min_w) / (points - 1)))
+    body += _block(35701, struct.pack("<HI", 29995, points))
+    body += _block(35708, struct.pack("<HI", 29974, 8 * points)
+                   + spectrum.astype("<f8").tobytes())
+
+    with open(path, "wb") as f:
+        f.write(b"PEPE" + b"spectrum".ljust(40, b" "))
+        f.write(_block(120, body))
+
+
+def write_sp_folder(directory, n_files, points):
+    """Write 'n_files' .sp spectra into 'directory'."""
+    os.makedirs(directory, exist_ok=True)
+
+    for i in range(n_files):
+        write_sp(os.path.join(directory, f"spectrum{i:06d}.sp"), points, seed=i)
+
+
+def write_fsm(path, shape, points, seed=0, z_start=4000.0, z_delta=-2.0):
+    """Write a PerkinElmer .fsm image of random spectra."""
+    cols, rows = shape
+    z_end = z_start + z_delta * (points - 1)
+    name = b"map"
+
+    header = struct.pack("<ddddddddddiiihBhBhBhB",
+                         1.5, 2.5, z_delta, z_start, z_end, 0, 0, 10.0, 20.0, 0,
+                         cols, rows, points, 0, 1, 0, 2, 4, 3, 5, 6)
+
+    # The 5105 blocks of the spectra, written at once.
+    spectra = np.zeros(cols * rows, dtype=[("id", "<u2"), ("size", "<i4"),
+                                           ("data", "<f4", points)])
+    spectra["id"] = 5105
+    spectra["size"] = 4 * points
+    spectra["data"] = np.random.default_rng(seed).random((cols * rows, points))
+
+    with open(path, "wb") as f:
+        f.write(b"PEFE" + b"image".ljust(40, b" "))
+        f.write(_block(5100, struct.pack("<h", len(name)) + name + header))
+        f.write(_block(5104, _payload5104(PE_META)))
+        f.write(spectra.tobytes())
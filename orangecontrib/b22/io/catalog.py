@@ -0,0 +1,279 @@
+import json
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from Orange.misc.environ import cache_dir
+
+from orangecontrib.b22.io.gwyddion import gsf_geometry
+from orangecontrib.b22.io.scan import header_reader, read_header, scan_paths
+
+
+
+
+def _extent(center_x, center_y, width, height, theta=0.0):
+    # Bounding box of a (possibly rotated) scan area.
+    theta = np.radians(theta)
+    half_x = (abs(np.cos(theta)) * width + abs(np.sin(theta)) * height) / 2
+    half_y = (abs(np.sin(theta)) * width + abs(np.cos(theta)) * height) / 2
+
+    return center_x - half_x, center_y - half_y, center_x + half_x, center_y + half_y
+
+
+# Formats of the dates in PerkinElmer headers, which Spectrum writes as
+# text: C-style, and day-first numeric or with month names.
+PERKINELMER_DATES = (
+    "%a %b %d %H:%M:%S %Y",
+    "%d/%m/%Y %H:%M:%S",
+    "%d/%m/%Y %H:%M",
+    "%d/%m/%Y",
+    "%d %B %Y %H:%M:%S",
+    "%d %b %Y %H:%M:%S",
+    "%d-%b-%Y %H:%M:%S",
+    "%d %B %Y",
+    "%d %b %Y",
+)
+
+
+def _iso_date(value, formats=()):
+    # ISO format, or None if 'value' is neither ISO nor in 'formats'.
+    if isinstance(value, datetime):
+        return value.isoformat()
+
+    if isinstance(value, str):
+        value = value.strip()
+
+        try:
+            return datetime.fromisoformat(value).isoformat()
+        except ValueError:
+            pass
+
+        for date_format in formats:
+            try:
+                return datetime.strptime(value, date_format).isoformat()
+            except ValueError:
+                pass
+
+    return None
+
+
+def header_record(reader, header):
+    """Return the project, date and stage extent of a file's header.
+
+    The extent is an (x_min, y_min, x_max, y_max) tuple, or None if the
+    header has no position; the project and the date (ISO format) may
+    be None too. The date as written stays in the stored header.
+    """
+    extent = None
+    project = header.get("Project")
+    formats = PERKINELMER_DATES if reader == "PerkinElmerReader" else ()
+    date = _iso_date(header.get("Date", header.get("date")), formats)
+
+    if reader == "GWYReader":
+        header = gsf_geometry(header)
+
+    if "Real Center" in header and "Real Area" in header:
+        center, area = header["Real Center"], header["Real Area"]
+        extent = _extent(center["X"], center["Y"], area["X"], area["Y"],
+                         header.get("Angle", {}).get("Theta", 0.0))
+
+    elif "x_init" in header and header.get("n_x"):
+        x = header["x_init"], header["x_init"] + header["x_delta"] * (header["n_x"] - 1)
+        y = header["y_init"], header["y_init"] + header["y_delta"] * (header["n_y"] - 1)
+        extent = min(x), min(y), max(x), max(y)
+
+    return project, date, extent
+
+
+
+
+class MetadataCatalog:
+    """A persistent SQLite index of the headers of spectral data files.
+
+    The catalog records every file with a reader (see 'io.scan') in its
+    folders, with the project, date and stage extent taken from the file
+    headers. 'update' only reads the headers of files that are new or
+    whose size or mtime changed, and drops files that no longer exist,
+    so queries never need to open the raw files.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS folders (
+            path TEXT PRIMARY KEY,
+            recursive INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY,
+            folder TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime INTEGER NOT NULL,
+            reader TEXT NOT NULL,
+            project TEXT,
+            date TEXT,
+            x_min REAL,
+            y_min REAL,
+            x_max REAL,
+            y_max REAL,
+            header TEXT
+        );
+        CREATE INDEX IF NOT EXISTS files_folder ON files (folder);
+        CREATE INDEX IF NOT EXISTS files_project ON files (project, date);
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(cache_dir(), "b22-catalog.sqlite")
+
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(MetadataCatalog.SCHEMA)
+
+
+    def close(self):
+        self.connection.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def add_folder(self, path, recursive=True):
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO folders VALUES (?, ?)",
+                                    (os.path.abspath(path), int(recursive)))
+
+
+    def remove_folder(self, path):
+        path = os.path.abspath(path)
+
+        with self.connection:
+            self.connection.execute("DELETE FROM folders WHERE path = ?", (path,))
+            self.connection.execute("DELETE FROM files WHERE folder = ?", (path,))
+
+
+    def folders(self):
+        return [path for path, in self.connection.execute(
+            "SELECT path FROM folders ORDER BY path")]
+
+
+    def update(self, max_workers=None):
+        """Bring the catalog up to date with its folders.
+
+        Returns
+        -------
+        tuple
+            The number of (indexed, removed) files.
+        """
+        known = {path: (folder, size, mtime) for path, folder, size, mtime in
+                 self.connection.execute("SELECT path, folder, size, mtime FROM files")}
+
+        changed = []
+        present = set()
+
+        for folder, recursive in self.connection.execute(
+                "SELECT path, recursive FROM folders").fetchall():
+            if not os.path.isdir(folder):
+                # Keep the files of folders that are (maybe only
+                # temporarily) unavailable, e.g. unmounted.
+                present.update(path for path, (f, _, _) in known.items() if f == folder)
+                continue
+
+            for file_path in scan_paths(folder, recursive=bool(recursive)):
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    continue
+
+                present.add(file_path)
+
+                if known.get(file_path, (None,))[1:] != (stat.st_size, stat.st_mtime_ns):
+                    changed.append((file_path, folder, stat))
+
+        def load(file_path):
+            try:
+                return read_header(file_path)
+            except Exception:  # pylint: disable=broad-except
+                return None
+
+        with ThreadPoolExecutor(max_workers) as executor:
+            headers = list(executor.map(load, [file_path for file_path, _, _ in changed]))
+
+        rows = []
+        for (file_path, folder, stat), header in zip(changed, headers):
+            reader = header_reader(file_path).__name__
+            project, date, extent = header_record(reader, header or {})
+
+            rows.append((file_path, folder, stat.st_size, stat.st_mtime_ns, reader,
+                         project, date, *(extent or (None,) * 4),
+                         None if header is None else json.dumps(header, default=str)))
+
+        removed = [(path,) for path in known if path not in present]
+
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows)
+            self.connection.executemany("DELETE FROM files WHERE path = ?", removed)
+
+        return len(rows), len(removed)
+
+
+    def query(self, project=None, region=None, after=None, before=None, reader=None):
+        """Return the paths of the files that match all given conditions.
+
+        Parameters
+        ----------
+        project : str | None
+            The project, as in the NeaSPEC "Project" header.
+        region : tuple | None
+            An (x_min, y_min, x_max, y_max) stage region that the scan
+            area must overlap.
+        after, before : datetime | str | None
+            Bounds (inclusive) on the acquisition date.
+        reader : str | None
+            The name of the reader class, e.g. "Nea2Reader".
+        """
+        conditions, parameters = [], []
+
+        if project is not None:
+            conditions.append("project = ?")
+            parameters.append(project)
+
+        if region is not None:
+            conditions.append("x_min <= ? AND x_max >= ? AND y_min <= ? AND y_max >= ?")
+            parameters.extend([region[2], region[0], region[3], region[1]])
+
+        if after is not None:
+            conditions.append("date >= ?")
+            parameters.append(_iso_date(after) or after)
+
+        if before is not None:
+            conditions.append("date <= ?")
+            parameters.append(_iso_date(before) or before)
+
+        if reader is not None:
+            conditions.append("reader = ?")
+            parameters.append(reader)
+
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+
+        return [path for path, in self.connection.execute(
+            "SELECT path FROM files" + where + " ORDER BY path", parameters)]
+
+
+    def header(self, path):
+        """Return the stored header of a file, or None."""
+        row = self.connection.execute("SELECT header FROM files WHERE path = ?",
+                                      (os.path.abspath(path),)).fetchone()
+
+        if row is None or row[0] is None:
+            return None
+
+        return json.loads(row[0])
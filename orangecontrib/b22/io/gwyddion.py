@@ -1,91 +1,275 @@
+import glob
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 
-from Orange.data import FileFormat
+from Orange.data import FileFormat, Table, Domain, ContinuousVariable
+from Orange.data.util import get_unique_names_duplicates
 
 from orangecontrib.spectroscopy.io.util import SpectralFileFormat, _spectra_from_image
 
-from orangecontrib.b22.io.utils import transform_row_col
+from orangecontrib.b22.io.utils import transform_row_col, cached_spectra, build_spec_table, \
+    grid_descriptor, table_from_numpy, spectra_dtype, iter_triplet, CHUNK_ROWS
 
 
 
 
 
-def reader_gsf(file_path):
+def read_gsf_header(f):
+    """Read the text header of an open GSF file.
 
-    with open(file_path, "rb") as f:
-        if not f.readline() == b'Gwyddion Simple Field 1.0\n':
-            raise ValueError('Not a correct GSF file, wrong header.')
+    Leaves 'f' positioned at the start of the (padded) data field.
+    """
+    if not f.readline() == b'Gwyddion Simple Field 1.0\n':
+        raise ValueError('Not a correct GSF file, wrong header.')
+
+    meta = {}
+
+    term = False #there are mandatory fileds
+    while term != b'\x00':
+        l = f.readline().decode('utf-8')
+        name, value = l.split("=")
+        name = name.strip()
+        value = value.strip()
+        meta[name] = value
+        term = f.read(1)
+        f.seek(-1, 1)
 
-        meta = {}
+    f.read(4 - f.tell() % 4)
 
-        term = False #there are mandatory fileds
-        while term != b'\x00':
-            l = f.readline().decode('utf-8')
-            name, value = l.split("=")
-            name = name.strip()
-            value = value.strip()
-            meta[name] = value
-            term = f.read(1)
-            f.seek(-1, 1)
+    meta["XRes"] = int(meta["XRes"])
+    meta["YRes"] = int(meta["YRes"])
+    meta["XReal"] = float(meta.get("XReal", 1))
+    meta["YReal"] = float(meta.get("YReal", 1))
+    meta["XOffset"] = float(meta.get("XOffset", 0))
+    meta["YOffset"] = float(meta.get("YOffset", 0))
+    meta["Title"] = meta.get("Title", None)
+    meta["XYUnits"] = meta.get("XYUnits", None)
+    meta["ZUnits"] = meta.get("ZUnits", None)
 
-        f.read(4 - f.tell() % 4)
+    return meta
 
-        meta["XRes"] = XR = int(meta["XRes"])
-        meta["YRes"] = YR = int(meta["YRes"])
-        meta["XReal"] = float(meta.get("XReal", 1))
-        meta["YReal"] = float(meta.get("YReal", 1))
-        meta["XOffset"] = float(meta.get("XOffset", 0))
-        meta["YOffset"] = float(meta.get("YOffset", 0))
-        meta["Title"] = meta.get("Title", None)
-        meta["XYUnits"] = meta.get("XYUnits", None)
-        meta["ZUnits"] = meta.get("ZUnits", None)
 
-        X = np.fromfile(f, dtype='float32', count=XR*YR).reshape(XR, YR)
+def reader_gsf(file_path, region=None):
+    """Read a GSF file as a memory-mapped float32 field.
+
+    Parameters
+    ----------
+    file_path : str
+        The path of the GSF file.
+    region : tuple | None
+        An (x0, y0, x1, y1) pixel rectangle (end exclusive) to load, or
+        None to load the whole field.
+
+    Returns
+    -------
+    tuple
+        The (YRes, XRes, 1) field (a view of the file, nothing is read
+        until it is used), the x and y pixel indices and the header.
+    """
+    with open(file_path, "rb") as f:
+        meta = read_gsf_header(f)
+        offset = f.tell()
+
+    XR, YR = meta["XRes"], meta["YRes"]
 
-        XRr = np.arange(XR)
-        YRr = np.arange(YR)
+    # Copy-on-write, so the field can be modified without touching the file.
+    X = np.memmap(file_path, dtype='<f4', mode='c', offset=offset, shape=(YR, XR))
 
-        X = X.reshape((meta["YRes"], meta["XRes"]) + (1,))
+    x0, y0, x1, y1 = (0, 0, XR, YR) if region is None else region
 
+    if not (0 <= x0 < x1 <= XR and 0 <= y0 < y1 <= YR):
+        raise ValueError(f"Region {region} is outside of the {XR}x{YR} field.")
+
+    X = X[y0:y1, x0:x1, np.newaxis]
+
+    XRr = np.arange(x0, x1)
+    YRr = np.arange(y0, y1)
 
     return X, XRr, YRr, meta
 
 
+def gsf_stack_paths(path):
+    """Return the sorted GSF files in a directory or matching a glob."""
+    if os.path.isdir(path):
+        path = os.path.join(path, "*.gsf")
+
+    return sorted(glob.glob(path))
+
+
+def read_gsf_stack(path, max_workers=None):
+    """Read a stack of GSF files (one per channel) of the same scan.
+
+    Parameters
+    ----------
+    path : str
+        A directory (all of its GSF files are read) or a glob pattern.
+    max_workers : int | None
+        The number of threads used to read the channels.
+
+    Returns
+    -------
+    tuple
+        The (YRes, XRes, channels) float32 field, the x and y pixel
+        indices, the header of each file and the file paths.
+    """
+    paths = gsf_stack_paths(path)
+
+    if not paths:
+        raise ValueError(f"No GSF files found in '{path}'.")
+
+    metas = []
+    for file_path in paths:
+        with open(file_path, "rb") as f:
+            metas.append(read_gsf_header(f))
+
+    for file_path, meta in zip(paths[1:], metas[1:]):
+        for key in ["XRes", "YRes", "XReal", "YReal"]:
+            if meta[key] != metas[0][key]:
+                raise ValueError(f"'{file_path}' has {key} = {meta[key]}, but "
+                                 f"'{paths[0]}' has {key} = {metas[0][key]}.")
+
+    XR, YR = metas[0]["XRes"], metas[0]["YRes"]
+    X = np.empty((YR, XR, len(paths)), dtype=np.float32)
+
+    def load(i):
+        field, _, _, _ = reader_gsf(paths[i])
+        X[:, :, i] = field[:, :, 0]
+
+    # Copying out of the memory-mapped files releases the GIL.
+    with ThreadPoolExecutor(max_workers) as executor:
+        list(executor.map(load, range(len(paths))))
+
+    return X, np.arange(XR), np.arange(YR), metas, paths
+
+
+def gsf_geometry(meta):
+    """Convert a GSF header to the metas used by 'transform_row_col'."""
+    return {
+        "Real Center" : {
+            "X" : float(meta.get("XOffset", 0.0)) + float(meta.get("XReal", 1.0)) / 2,
+            "Y" : float(meta.get("YOffset", 0.0)) + float(meta.get("YReal", 1.0)) / 2,
+        },
+
+        "Angle" : {
+            "Theta" : float(meta.get("Neaspec_Angle", 0.0))
+        },
+
+        "Real Area" : {
+            "X" : float(meta.get("XReal", 1.0)),
+            "Y" : float(meta.get("YReal", 1.0)),
+        },
+
+        "Pixel Area" : {
+            "X" : float(meta.get("XRes", 1.0)),
+            "Y" : float(meta.get("YRes", 1.0)),
+        }
+    }
+
+
 class GWYReader(FileFormat, SpectralFileFormat):
 
     EXTENSIONS = (".gsf",)
     DESCRIPTION = 'Gwyddion Simple Field 2'
+    CACHE_VERSION = 2
+
+    # Sheets: the selected file only, or every GSF file in its directory.
+    SINGLE = "Single channel"
+    STACK = "All channels in folder"
+
+    # An (x0, y0, x1, y1) pixel rectangle to load, or None for the whole scan.
+    region = None
+
+    # The dtype of the table's spectra, or None for the 'spectra_dtype' default.
+    dtype = None
+
+
+    def cache_options(self):
+        return {"region": self.region}
+
 
+    def read_header(self):
+        """Read the text header of the file without reading its field."""
+        with open(self.filename, "rb") as f:
+            return read_gsf_header(f)
+
+
+    @cached_spectra
     def read_spectra(self):
-        X, XRr, YRr, meta = reader_gsf(self.filename)
+        X, XRr, YRr, meta = reader_gsf(self.filename, region=self.region)
+        # The field stays float32 and, unless a narrower region is
+        # selected, the spectra are a view of the memory-mapped file.
         data = _spectra_from_image(X, np.array([1]), XRr, YRr)
 
-        data[2].attributes = meta
+        metas = gsf_geometry(meta)
 
-        metas = {
-            "Real Center" : {
-                "X" : float(meta.get("XOffset", 0.0)) + float(meta.get("XReal", 1.0)) / 2,
-                "Y" : float(meta.get("YOffset", 0.0)) + float(meta.get("YReal", 1.0)) / 2,
-            },
+        data[2].attributes = dict(meta, Grid=grid_descriptor(metas))
+        with data[2].unlocked(data[2].metas):
+            data[2].metas[:,[0,1]] = transform_row_col(data[2].metas[:,[0,1]], metas)
 
-            "Angle" : {
-                "Theta" : float(meta.get("Neaspec_Angle", 0.0))
-            },
+        return data
 
-            "Real Area" : {
-                "X" : float(meta.get("XReal", 1.0)),
-                "Y" : float(meta.get("YReal", 1.0)),
-            },
 
-            "Pixel Area" : {
-                "X" : float(meta.get("XRes", 1.0)),
-                "Y" : float(meta.get("YRes", 1.0)),
-            }
-        }
+    def iter_chunks(self, rows=CHUNK_ROWS):
+        """Yield the pixels in chunks of at most 'rows' rows (whole lines
+        of the image, unless one line is longer).
 
-        data[2].metas[:,[0,1]] = transform_row_col(data[2].metas[:,[0,1]], metas)
+        Each chunk is a (wavenumbers, X, meta table) triplet as returned
+        by 'read_spectra'; the spectra are views of the memory-mapped
+        field.
+        """
+        X, XRr, YRr, meta = reader_gsf(self.filename, region=self.region)
 
-        return data
+        metas = gsf_geometry(meta)
+        attributes = dict(meta, Grid=grid_descriptor(metas))
+        lines = max(1, rows // max(1, len(XRr)))
+
+        for y0 in range(0, len(YRr), lines):
+            data = _spectra_from_image(X[y0:y0 + lines], np.array([1]), XRr, YRr[y0:y0 + lines])
+
+            data[2].attributes = attributes
+            with data[2].unlocked(data[2].metas):
+                data[2].metas[:,[0,1]] = transform_row_col(data[2].metas[:,[0,1]], metas)
+
+            yield from iter_triplet(*data, rows)
+
+
+    def read_stack(self):
+        """Read all GSF files in the directory of 'filename' as one table.
+
+        Each file becomes a column, named after its title (or file name).
+        """
+        X, XRr, YRr, metas, paths = read_gsf_stack(os.path.dirname(self.filename) or ".")
+
+        names = [meta["Title"] or os.path.splitext(os.path.basename(file_path))[0]
+                 for meta, file_path in zip(metas, paths)]
+        names = get_unique_names_duplicates(names)
+
+        _, spectra, meta_table = _spectra_from_image(X, np.arange(len(names)), XRr, YRr)
+
+        geometry = gsf_geometry(metas[0])
+        coords = transform_row_col(meta_table.metas[:, [0, 1]], geometry)
+
+        domain = Domain([ContinuousVariable.make(name) for name in names],
+                        metas=meta_table.domain.metas)
+
+        return table_from_numpy(domain, spectra, dtype=spectra_dtype(self),
+                                metas=coords.astype(object),
+                                attributes={"channels": dict(zip(names, metas)),
+                                            "Grid": grid_descriptor(geometry)})
+
+
+    @property
+    def sheets(self):
+        return [GWYReader.SINGLE, GWYReader.STACK]
+
+
+    def read(self):
+        if self.sheet == GWYReader.STACK:
+            return self.read_stack()
+
+        return build_spec_table(*self.read_spectra(), dtype=spectra_dtype(self))
     
 if __name__ == "__main__":
     from Orange.data.table import dataset_dirs
@@ -1,15 +1,25 @@
+import functools
+import io
+import itertools
 from html.parser import HTMLParser
 
 
 import Orange
 import numpy as np
 from Orange.data import FileFormat, Table
-from scipy.interpolate import interp1d
 
 from orangecontrib.spectroscopy.io.gsf import reader_gsf
 from orangecontrib.spectroscopy.io.util import SpectralFileFormat
 
-from orangecontrib.b22.io.utils import MetaFormatter, transform_row_col
+from orangecontrib.b22.io.utils import MetaFormatter, transform_row_col, loadtxt_chunked, \
+    grid_descriptor, cached_spectra, build_spec_table, spectra_dtype, loadtxt_parallel, \
+    iter_triplet, table_from_numpy, CHUNK_LINES, CHUNK_ROWS
+
+
+
+
+def _in_runs(block, column, runs):
+    return np.isin(block[:, column], runs)
 
 
 
@@ -18,291 +28,639 @@ class Nea2Reader(FileFormat, SpectralFileFormat):
 
     EXTENSIONS = (".nea", ".txt")
     DESCRIPTION = 'NeaSPEC2'
+    CACHE_VERSION = 2
+
+    # The columns of version 2 files that index the data channels.
+    V2_INDEX = ("Row", "Column", "Run", "Omega", "Wavenumber", "Depth")
+
+    # Sheet that reads every channel; the other sheets select one
+    # harmonic (its amplitude and phase) or a single channel.
+    ALL_CHANNELS = "All channels"
+
+    # The channels (e.g. ["O2A", "O2P"]) and runs to read, or None for
+    # all of them. Other columns and runs are skipped while parsing.
+    channels = None
+    runs = None
+
+    # The dtype of the table's spectra, or None for the 'spectra_dtype' default.
+    dtype = None
+
+    # The number of processes that tokenize the body of version 2 files;
+    # None for all cores.
+    processes = 1
+
+
+    def cache_options(self):
+        return {"channels": self.selected_channels(), "runs": self.runs,
+                "dtype": str(spectra_dtype(self))}
+
+
+    @property
+    def sheets(self):
+        try:
+            channels = self.read_header().get("Channels", [])
+        except Exception:  # pylint: disable=broad-except
+            return []
+
+        if not channels:
+            return []
+
+        harmonics = sorted({c[:-1] for c in channels
+                            if c[-1:] in ("A", "P") and c[:-1] + "A" in channels
+                            and c[:-1] + "P" in channels})
+
+        return [Nea2Reader.ALL_CHANNELS] \
+            + [f"{h}A, {h}P" for h in harmonics] + list(channels)
+
+
+    def selected_channels(self):
+        if self.sheet is not None and self.sheet != Nea2Reader.ALL_CHANNELS:
+            return self.sheet.split(", ")
+        return self.channels
+
+
+    @staticmethod
+    def _check_channels(selected, available):
+        missing = [c for c in selected if c not in available]
+        if missing:
+            raise ValueError(f"Channels {missing} are not in the file; "
+                             f"available channels are {list(available)}.")
+
+    @staticmethod
+    def _v1_channel_code(channel):
+        # O<n>A -> 2n, O<n>P -> 2n + 1, anything else (the M channel) -> -1
+        channel = channel.strip()
+        if channel.startswith("O") and channel[-1:] in ("A", "P"):
+            return 2 * int(channel[1:-1]) + (channel[-1] == "P")
+        return -1
+
+
+    @staticmethod
+    def _interp_rows(xp, fp, x):
+        """Linearly interpolate many rows, each on its own axis, at 'x'.
+
+        Parameters
+        ----------
+        xp : np.ndarray
+            A (k, n) array with the sample positions of each row.
+        fp : np.ndarray
+            A (k, m, n) array of m sampled values for each row.
+        x : np.ndarray
+            A (p,) array of positions shared by all rows.
+
+        Returns
+        -------
+        np.ndarray
+            A (k, m, p) array of the interpolated values.
+        """
+        k, n = xp.shape
+
+        order = np.argsort(xp, axis=1)
+        xp = np.take_along_axis(xp, order, axis=1)
+        fp = np.take_along_axis(fp, order[:, None, :], axis=2)
+
+        # Shift every row into its own disjoint interval so that a single
+        # searchsorted over the flattened axes locates x in all rows.
+        lower = np.nanmin(xp) if xp.size else 0.0
+        span = (np.nanmax(xp) - lower if xp.size else 0.0) + 1.0
+        offsets = 2 * span * np.arange(k)[:, None]
+
+        # Missing positions (e.g. of the runs a pixel lacks) go to the end
+        # of their own row's interval, so the flattened axes stay sorted.
+        flat = xp - lower + offsets
+        missing = np.isnan(flat)
+        flat[missing] = np.broadcast_to(offsets + span, flat.shape)[missing]
+
+        idx = np.searchsorted(flat.ravel(), (x[None, :] - lower + offsets).ravel())
+        idx = idx.reshape(k, len(x)) - n * np.arange(k)[:, None]
+        idx = np.clip(idx, 1, n - 1)
+
+        x0 = np.take_along_axis(xp, idx - 1, axis=1)
+        x1 = np.take_along_axis(xp, idx, axis=1)
+        f0 = np.take_along_axis(fp, (idx - 1)[:, None, :], axis=2)
+        f1 = np.take_along_axis(fp, idx[:, None, :], axis=2)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            w = (x[None, :] - x0) / (x1 - x0)
+
+        w[x1 == x0] = 1.0
+
+        return f0 + w[:, None, :] * (f1 - f0)
+
+
+    def _v1_where(self):
+        # The row filter of the 'channels' and 'runs' options.
+        channels = self.selected_channels()
+        codes = None if channels is None else \
+            [self._v1_channel_code(c) for c in channels]
+
+        def where(block):
+            # The M channel is always kept; it holds the mirror positions.
+            keep = np.ones(len(block), dtype=bool)
+            if self.runs is not None:
+                keep &= np.isin(block[:, 2], self.runs)
+            if codes is not None:
+                keep &= np.isin(block[:, 3], codes) | (block[:, 3] < 0)
+            return keep
+
+        return where
+
+
+    def _v1_rows(self, f):
+        # Columns: row, column, run, channel, [data]
+        return loadtxt_chunked(f, converters={3: self._v1_channel_code},
+                               where=self._v1_where())
+
+
+    def _v1_channels(self, codes):
+        # The optical channels present, ordered O0A..O<n>A, O0P..O<n>P.
+        codes = sorted(codes, key=lambda c: (c % 2, c // 2))
+        names = ["O%d%s" % (c // 2, "AP"[c % 2]) for c in codes]
+
+        channels = self.selected_channels()
+        if channels is not None:
+            self._check_channels(channels, names)
+
+        return codes, names
+
+
+    def _v1_spectra(self, file, codes, runs, X):
+        """Interpolate the rows of whole pixels onto 'X' and average the runs.
+
+        'codes' are the channel codes and 'runs' the (sorted) runs of
+        the output, which may include some that are not in 'file'.
+        Returns the spectra and the (row, column, channel) metas.
+        """
+        keys = file[:, :4].astype(int)
+        data = file[:, 4:]
+        n_points = data.shape[1]
+
+        # Group rows by pixel; np.unique sorts the (row, column) keys.
+        pixels, pixel_i = np.unique(keys[:, :2], axis=0, return_inverse=True)
+        pixel_i = pixel_i.ravel()
+
+        # Runs are averaged, so only the runs present matter.
+        run_i = np.searchsorted(runs, keys[:, 2])
+        n_runs = len(runs)
+
+        # ASSUMPTION: there is one M channel and multiple O?A and O?P channels
+        code = keys[:, 3]
+        is_m = code < 0
+        is_o = ~is_m
+
+        names = ["O%d%s" % (c // 2, "AP"[c % 2]) for c in codes]
+
+        # Mirror positions of each (pixel, run) and the optical channels.
+        M = np.full((len(pixels), n_runs, n_points), np.nan)
+        M[pixel_i[is_m], run_i[is_m]] = data[is_m]
+
+        lookup = np.zeros(max(codes, default=-1) + 1, dtype=int)
+        lookup[codes] = np.arange(len(codes))
+        channel_i = lookup[code[is_o]]
+
+        O = np.full((len(pixels), n_runs, len(codes), n_points), np.nan)
+        O[pixel_i[is_o], run_i[is_o], channel_i] = data[is_o]
+
+        On = self._interp_rows(M.reshape(-1, n_points),
+                               O.reshape(-1, len(codes), n_points),
+                               X)
+
+        final_data = On.reshape(O.shape[:3] + (len(X),)).mean(axis=1)
+        final_data = final_data.reshape(-1, len(X))
+
+        final_metas = np.empty((len(final_data), 3), dtype=object)
+        final_metas[:, 0] = np.repeat(pixels[:, 0], len(names))
+        final_metas[:, 1] = np.repeat(pixels[:, 1], len(names))
+        final_metas[:, 2] = np.tile(names, len(pixels))
+
+        return final_data, final_metas
+
+
+    @staticmethod
+    def _v1_meta_table(final_metas):
+        metas = [Orange.data.ContinuousVariable.make("row"),
+                 Orange.data.ContinuousVariable.make("column"),
+                 Orange.data.StringVariable.make("channel")]
+
+        domain = Orange.data.Domain([], None, metas=metas)
+        return Table.from_numpy(domain, X=np.zeros((len(final_metas), 0)),
+                                metas=final_metas)
+
 
     def read_v1(self):
 
         with open(self.filename, "rt") as f:
             next(f)  # skip header
-            l = next(f)
-            l = l.strip()
-            l = l.split("\t")
-            ncols = len(l)
+            file = self._v1_rows(f)
 
-            f.seek(0)
-            next(f)
-            datacols = np.arange(4, ncols)
-            data = np.loadtxt(f, dtype="float", usecols=datacols)
+        if len(file) == 0:
+            raise ValueError("The file has no data for the selected runs.")
 
-            f.seek(0)
-            next(f)
-            metacols = np.arange(0, 4)
-            meta = np.loadtxt(f,
-                              dtype={'names': ('row', 'column', 'run', 'channel'),
-                                     'formats': (int, int, int, "S10")},
-                              usecols=metacols)
-
-            # ASSUMTION: runs start with 0
-            runs = np.unique(meta["run"])
-
-            # ASSUMPTION: there is one M channel and multiple O?A and O?P channels,
-            # both with the same number, both starting with 0
-            channels = np.unique(meta["channel"])
-            maxn = -1
-
-            def channel_type(a):
-                if a.startswith(b"O") and a.endswith(b"A"):
-                    return "OA"
-                elif a.startswith(b"O") and a.endswith(b"P"):
-                    return "OP"
+        code = file[:, 3].astype(int)
+        is_m = code < 0
+        codes, _ = self._v1_channels(np.unique(code[~is_m]))
+        runs = np.unique(file[:, 2].astype(int))
+
+        # we need the limits of common X for all
+        data = file[:, 4:]
+        min_intp = np.max(np.min(data[is_m], axis=1))
+        max_intp = np.min(np.max(data[is_m], axis=1))
+
+        X = np.linspace(min_intp, max_intp, num=data.shape[1])
+
+        final_data, final_metas = self._v1_spectra(file, codes, runs, X)
+
+        return X, final_data, self._v1_meta_table(final_metas)
+
+
+    def iter_v1(self, rows):
+        """Yield the spectra of a version 1 file 'rows' rows at a time.
+
+        The first pass finds the channels, runs and the common mirror
+        range of the whole file, so that every chunk is interpolated
+        onto the same axis as by 'read_v1'; the second pass interpolates
+        whole pixels, in the order of the file.
+        """
+        codes, runs = set(), set()
+        min_intp, max_intp = -np.inf, np.inf
+        n_points = None
+
+        with open(self.filename, "rt") as f:
+            next(f)  # skip header
+
+            for lines in iter(lambda: list(itertools.islice(f, CHUNK_LINES)), []):
+                file = self._v1_rows(iter(lines))
+                if len(file) == 0:
+                    continue
+
+                code = file[:, 3].astype(int)
+                is_m = code < 0
+                data = file[:, 4:]
+                n_points = data.shape[1]
+
+                codes.update(np.unique(code[~is_m]).tolist())
+                runs.update(np.unique(file[:, 2].astype(int)).tolist())
+
+                if is_m.any():
+                    min_intp = max(min_intp, np.max(np.min(data[is_m], axis=1)))
+                    max_intp = min(max_intp, np.min(np.max(data[is_m], axis=1)))
+
+        if n_points is None:
+            raise ValueError("The file has no data for the selected runs.")
+
+        codes, _ = self._v1_channels(codes)
+        runs = np.array(sorted(runs))
+        X = np.linspace(min_intp, max_intp, num=n_points)
+
+        pending = np.empty((0, 4 + n_points))
+
+        # Batches of the lines of about 'rows' rows: each pixel has an M
+        # line and a line per channel for each run.
+        n_lines = max(1, rows // len(codes)) * len(runs) * (len(codes) + 1)
+
+        with open(self.filename, "rt") as f:
+            next(f)  # skip header
+
+            while True:
+                lines = list(itertools.islice(f, n_lines))
+
+                file = self._v1_rows(iter(lines))
+                if len(file) > 0:
+                    file = np.concatenate([pending, file])
                 else:
-                    return "M"
-
-            for a in channels:
-                if channel_type(a) in ("OA", "OP"):
-                    maxn = max(maxn, int(a[1:-1]))
-            numharmonics = maxn+1
-
-            rowcols = np.vstack((meta["row"], meta["column"])).T
-            uniquerc = set(map(tuple, rowcols))
-
-            di = {}  # dictionary of indices for each row and column
-
-            min_intp, max_intp = None, None
-
-            for i, (row, col, run, chan) in enumerate(meta):
-                if (row, col) not in di:
-                    di[(row, col)] = \
-                        {"M": np.zeros((len(runs), len(datacols))) * np.nan,
-                         "OA": np.zeros((numharmonics, len(runs), len(datacols))) * np.nan,
-                         "OP": np.zeros((numharmonics, len(runs), len(datacols))) * np.nan}
-                if channel_type(chan) == "M":
-                    di[(row, col)][channel_type(chan)][run] = data[i]
-                    if min_intp is None:  # we need the limits of common X for all
-                        min_intp = np.min(data[i])
-                        max_intp = np.max(data[i])
-                    else:
-                        min_intp = max(min_intp, np.min(data[i]))
-                        max_intp = min(max_intp, np.max(data[i]))
-                elif channel_type(chan) in ("OA", "OP"):
-                    di[(row, col)][channel_type(chan)][int(chan[1:-1]), run] = data[i]
-
-            X = np.linspace(min_intp, max_intp, num=len(datacols))
-
-            final_metas = []
-            final_data = []
-
-            for row, col in uniquerc:
-                cur = di[(row, col)]
-                M, OA, OP = cur["M"], cur["OA"], cur["OP"]
-
-                OAn = np.zeros(OA.shape) * np.nan
-                OPn = np.zeros(OA.shape) * np.nan
-                for run in range(len(M)):
-                    f = interp1d(M[run], OA[:, run])
-                    OAn[:, run] = f(X)
-                    f = interp1d(M[run], OP[:, run])
-                    OPn[:, run] = f(X)
-
-                OAmean = np.mean(OAn, axis=1)
-                OPmean = np.mean(OPn, axis=1)
-                final_data.append(OAmean)
-                final_data.append(OPmean)
-                final_metas += [[row, col, "O%dA" % i] for i in range(numharmonics)]
-                final_metas += [[row, col, "O%dP" % i] for i in range(numharmonics)]
-
-            final_data = np.vstack(final_data)
-
-            metas = [Orange.data.ContinuousVariable.make("row"),
-                     Orange.data.ContinuousVariable.make("column"),
-                     Orange.data.StringVariable.make("channel")]
-
-            domain = Orange.data.Domain([], None, metas=metas)
-            meta_data = Table.from_numpy(domain, X=np.zeros((len(final_data), 0)),
-                                         metas=np.asarray(final_metas, dtype=object))
-            return X, final_data, meta_data
+                    file = pending
 
-    def read_v2(self):
-        file_format = MetaFormatter.FileFormat.NEA_TXT
+                # A short batch is the end of the file.
+                end = len(lines) < n_lines
 
-        with open(self.filename, "r", encoding='utf-8') as f:
-            count = -1
+                if not end and len(file) > 0:
+                    # The last pixel may continue in the next lines.
+                    keys = file[:, :2]
+                    n = np.flatnonzero(np.any(keys != keys[-1], axis=1)).max(initial=-1) + 1
+                else:
+                    n = len(file)
 
-            meta = {}
+                pending = file[n:]
 
-            while f:
-                count += 1
-                line = f.readline()
+                if n > 0:
+                    final_data, final_metas = self._v1_spectra(file[:n], codes, runs, X)
 
-                if line[0] != '#':
+                    for _, X_chunk, metas in iter_triplet(X, final_data, final_metas, rows):
+                        yield X, X_chunk, self._v1_meta_table(metas)
+
+                if end:
                     break
 
-                if count == 0:
-                    assert(line == "# www.neaspec.com\n")
-                    continue
 
-                key, value = line.split(":", 1)
-                key = key[2:]
-                new_key, values = MetaFormatter.format(key,
-                                                       value.split(),
-                                                       file_format,
-                                                       default_func=MetaFormatter.Default.BASIC)
-                
-                if new_key is not None:
-                    key = new_key
+    @staticmethod
+    def read_v2_header(f):
+        """Read the '#' lines and the column headers of a version 2 file.
 
-                if values is not None:
-                    meta[key] = values
-                
+        Leaves 'f' positioned at the first line of the body.
+        """
+        file_format = MetaFormatter.FileFormat.NEA_TXT
 
-            file = np.loadtxt(f)  # Slower part
+        count = -1
+
+        meta = {}
+
+        while f:
+            count += 1
+            line = f.readline()
+
+            if line[0] != '#':
+                break
+
+            if count == 0:
+                assert(line == "# www.neaspec.com\n")
+                continue
+
+            key, value = line.split(":", 1)
+            key = key[2:]
+            new_key, values = MetaFormatter.format(key,
+                                                   value.split(),
+                                                   file_format,
+                                                   default_func=MetaFormatter.Default.BASIC)
+            
+            if new_key is not None:
+                key = new_key
+
+            if values is not None:
+                meta[key] = values
 
-        # Find the Wavenumber column
         headers = line.strip().split('\t')
 
+        return meta, headers
+
+
+    def read_header(self):
+        """Read the metadata of the file without reading its data.
+
+        Version 1 files have no metadata; for version 2 files the
+        metadata is that of the '#' lines, with the data channels
+        listed under "Channels".
+        """
+        with open(self.filename, "rt", encoding='utf-8') as f:
+            if f.read(2) != '# ':
+                return {}
+
+            f.seek(0)
+            meta, headers = self.read_v2_header(f)
+
+        index = [headers.index(name) for name in self.V2_INDEX if name in headers]
+        meta["Channels"] = headers[max(index, default=-1) + 1:]
+
+        return meta
+
+
+    def v2_columns(self, headers):
+        """Return the columns to read, the row filter and the headers read.
+
+        These follow the 'channels' and 'runs' options.
+        """
+        first = max(headers.index(name) for name in self.V2_INDEX if name in headers) + 1
+        usecols = list(range(len(headers)))
+
+        channels = self.selected_channels()
+        if channels is not None:
+            self._check_channels(channels, headers[first:])
+            usecols = list(range(first)) + [headers.index(c) for c in channels]
+
+        where = None
+        if self.runs is not None and "Run" in headers:
+            where = functools.partial(_in_runs, column=headers.index("Run"),
+                                      runs=list(self.runs))
+
+        return usecols, where, [headers[i] for i in usecols]
+
+
+    def read_v2_body(self, headers, file, meta):
+        # Find the Wavenumber column
         if "Wavenumber" in headers:
             return self.read_v2_wavenumbers(headers, file, meta)
         
         return self.read_v2_interferograms(headers, file, meta)
-    
 
 
-    def read_v2_wavenumbers(self, headers, file, meta):
-        # Desired headers:
-        # map_x  map_y  row  col  channel  [wavenumbers]
+    def read_v2(self):
+        with open(self.filename, "r", encoding='utf-8') as f:
+            meta, headers = self.read_v2_header(f)
+            usecols, where, headers = self.v2_columns(headers)
 
-        row_i = col_i = ome_i = wav_i = None
+            if self.processes == 1:
+                file = loadtxt_chunked(f, len(headers), usecols=usecols, where=where)
+            else:
+                file = loadtxt_parallel(self.filename, f.tell(), len(headers),
+                                        max_workers=self.processes,
+                                        usecols=usecols, where=where)
 
-        for i, e in enumerate(headers):
-            if e == "Row":
-                row_i = i
+        if len(file) == 0:
+            raise ValueError("The file has no data for the selected runs.")
 
-            elif e == "Column":
-                col_i = i
+        return self.read_v2_body(headers, file, meta)
 
-            elif e == "Omega":
-                ome_i = i
 
-            elif e == 'Wavenumber':
-                wav_i = i
+    @staticmethod
+    def v2_block_length(headers, body, meta=None):
+        """Return the number of lines of each pixel (or run) block.
 
+        The length is where the pixel (or run) first changes in the body,
+        or else the Z of the "Pixel Area (X, Y, Z)" header in 'meta', so
+        that a single block is complete once it has that many lines.
+        Returns None if neither is known.
+        """
+        keys = body[:, [headers.index(name) for name in ("Row", "Column", "Run")
+                        if name in headers]]
+        change = np.flatnonzero(np.any(keys[1:] != keys[:-1], axis=1))
 
-        channels = np.array(headers[wav_i + 1:])
-        # Extract other data #
+        if len(change):
+            return change[0] + 1
 
-        rows = int(np.nanmax(file[:, row_i]) + 1)
-        cols = int(np.nanmax(file[:, col_i]) + 1)
+        try:
+            n_points = int((meta or {})["Pixel Area"]["Z"])
+        except (KeyError, TypeError, ValueError):
+            return None
 
-        n_cols = int(np.nanmax(file[:, ome_i]) + 1)
-        n_rows = rows * cols * channels.size
+        return n_points if n_points > 0 else None
 
 
-        # Transform Actual Data
-        M = np.full((int(n_rows), int(n_cols)), np.nan, dtype='float')
+    def iter_v2(self, rows):
+        """Yield the spectra of a version 2 file 'rows' rows at a time.
 
-        meta_data = np.zeros((int(n_rows), 3), dtype='object')
+        The body is parsed in batches of whole pixel (or run) blocks.
+        """
+        with open(self.filename, "r", encoding='utf-8') as f:
+            meta, headers = self.read_v2_header(f)
+            usecols, where, headers = self.v2_columns(headers)
 
+            first = max(headers.index(name) for name in self.V2_INDEX if name in headers) + 1
+            n_channels = max(1, len(headers) - first)
 
-        for j in range(int(rows * cols)):
-            lower = j * n_cols
-            upper = (j + 1) * n_cols
+            pending = np.empty((0, len(headers)))
+            n_points = None
+            n_lines = CHUNK_LINES
+            found = False
 
-            row_values = file[lower:upper, row_i]
-            assert np.all(row_values == row_values[0])
+            while True:
+                lines = list(itertools.islice(f, n_lines))
+                # A short batch is the end of the file.
+                end = len(lines) < n_lines
 
-            col_values = file[lower:upper, col_i]
-            assert np.all(col_values == col_values[0])
+                body = loadtxt_chunked(iter(lines), len(headers), usecols=usecols, where=where)
+                body = np.concatenate([pending, body])
 
-            meta_data[channels.size * j:channels.size * (j+1), 0] = col_values[0]
-            meta_data[channels.size * j:channels.size * (j+1), 1] = row_values[0]
-            meta_data[channels.size * j:channels.size * (j+1), 2] = np.arange(channels.size)
+                if end:
+                    n = len(body)
+                elif n_points is None:
+                    n = 0
 
-            for k in range(channels.size):
-                M[k + channels.size * j, :] = file[lower:upper, k + wav_i + 1]
+                    if len(body):
+                        n_points = self.v2_block_length(headers, body, meta)
 
+                    if n_points is not None:
+                        # Batches of the blocks of about 'rows' rows; the
+                        # blocks read so far wait for the first of them.
+                        n_lines = max(1, rows // n_channels) * n_points
+                else:
+                    n = len(body) // n_points * n_points
 
-        meta_data[:,[0, 1]] = transform_row_col(meta_data[:,[0, 1]], meta)
+                pending = body[n:]
 
+                if n > 0:
+                    found = True
+                    yield from iter_triplet(*self.read_v2_body(headers, body[:n], meta), rows)
 
-        waveN = file[0:int(n_cols), wav_i]
-        metas = [Orange.data.ContinuousVariable.make("map_x"),
-                 Orange.data.ContinuousVariable.make("map_y"),
-                 Orange.data.DiscreteVariable.make("channel", values=channels)]
+                if end:
+                    break
 
-        domain = Orange.data.Domain([], None, metas=metas)
-        meta_data = Table.from_numpy(domain, X=np.zeros((len(M), 0)),
-                                     metas=meta_data)
-        
-        meta_data.attributes = meta
+        if not found:
+            raise ValueError("The file has no data for the selected runs.")
 
-        return waveN, M, meta_data
 
+    def iter_chunks(self, rows=CHUNK_ROWS):
+        """Yield the spectra of the file in chunks of at most 'rows' rows.
+
+        Each chunk is a (wavenumbers, X, meta table) triplet, as returned
+        by 'read_spectra', and the wavenumbers and the domain of the meta
+        table are the same in all chunks. The file is parsed as the
+        chunks are consumed, so only one chunk is held in memory. The
+        'channels' and 'runs' options apply.
+        """
+        with open(self.filename, "rt", encoding='utf-8') as f:
+            version = 2 if f.read(2) == '# ' else 1
 
+        if version == 1:
+            return self.iter_v1(rows)
 
-    def read_v2_interferograms(self, headers, file, meta):
-        # Desired headers:
-        # map_x  map_y  depth  channel  [run]
+        return self.iter_v2(rows)
 
-        row_i = col_i = run_i = dep_i = None
 
-        for i, e in enumerate(headers):
-            if e == "Row":
-                row_i = i
 
-            elif e == "Column":
-                col_i = i
+    @staticmethod
+    def _v2_blocks(headers, file, axis):
+        # Every pixel (and run) is written as a block of consecutive
+        # lines, one line per point on 'axis', so the body is a regular
+        # (block x point x column) array.
+        n_points = int(np.nanmax(file[:, headers.index(axis)]) + 1)
 
-            elif e == "Run":
-                run_i = i
+        if file.shape[0] % n_points != 0:
+            raise ValueError(f"Expected a multiple of {n_points} lines, "
+                             f"but got {file.shape[0]}.")
 
-            elif e == "Depth":
-                dep_i = i
+        blocks = file.reshape(file.shape[0] // n_points, n_points, file.shape[1])
 
+        # Row and column must be constant within each block.
+        for name in ["Row", "Column"]:
+            values = blocks[:, :, headers.index(name)]
+            assert np.all(values == values[:, :1])
 
-        # Run is averaging
-        # Depth is depth
+        return blocks
 
 
-        channels = np.array(headers[dep_i + 1:])
-        # Extract other data #
+    @staticmethod
+    def _v2_spectra(blocks, first, dtype=None):
+        # (block, point, channel) -> (block, channel, point) -> rows of M.
+        # Reshape only copies when the transposed layout requires it.
+        n_blocks, n_points, _ = blocks.shape
+        n_channels = blocks.shape[2] - first
 
-        rows = int(np.nanmax(file[:, row_i]) + 1)
-        cols = int(np.nanmax(file[:, col_i]) + 1)
+        spectra = blocks[:, :, first:].transpose(0, 2, 1)
 
-        n_cols = int(np.nanmax(file[:, dep_i]) + 1)
-        n_rows = rows * cols * channels.size
+        if dtype is None or dtype == blocks.dtype:
+            return spectra.reshape(n_blocks * n_channels, n_points)
 
+        # Convert while copying, instead of copying twice.
+        M = np.empty((n_blocks, n_channels, n_points), dtype=dtype)
+        M[...] = spectra
 
-        # Transform Actual Data
-        M = np.full((int(n_rows), int(n_cols)), np.nan, dtype='float')
+        return M.reshape(n_blocks * n_channels, n_points)
 
-        meta_data = np.zeros((int(n_rows), 4), dtype='object')
 
+    def read_v2_wavenumbers(self, headers, file, meta):
+        # Desired headers:
+        # map_x  map_y  row  col  channel  [wavenumbers]
 
-        for j in range(int(rows * cols)):
-            lower = j * n_cols
-            upper = (j + 1) * n_cols
+        row_i = headers.index("Row")
+        col_i = headers.index("Column")
+        wav_i = headers.index("Wavenumber")
+        first = max(row_i, col_i, headers.index("Omega"), wav_i) + 1
 
-            row_values = file[lower:upper, row_i]
-            assert np.all(row_values == row_values[0])
+        channels = np.array(headers[first:])
 
-            col_values = file[lower:upper, col_i]
-            assert np.all(col_values == col_values[0])
+        blocks = self._v2_blocks(headers, file, "Omega")
+        M = self._v2_spectra(blocks, first, spectra_dtype(self))
 
-            run_values = file[lower:upper, run_i]
+        meta_data = np.zeros((len(M), 3), dtype='object')
+        meta_data[:, 0] = np.repeat(blocks[:, 0, col_i], channels.size)
+        meta_data[:, 1] = np.repeat(blocks[:, 0, row_i], channels.size)
+        meta_data[:, 2] = np.tile(np.arange(channels.size), len(blocks))
 
-            meta_data[channels.size * j:channels.size * (j+1), 0] = col_values[0]
-            meta_data[channels.size * j:channels.size * (j+1), 1] = row_values[0]
-            meta_data[channels.size * j:channels.size * (j+1), 2] = run_values[0]
-            meta_data[channels.size * j:channels.size * (j+1), 3] = np.arange(channels.size)
+        meta_data[:,[0, 1]] = transform_row_col(meta_data[:,[0, 1]], meta)
 
-            for k in range(channels.size):
-                M[k + channels.size * j, :] = file[lower:upper, k + run_i + 1]
 
+        waveN = blocks[0, :, wav_i]
+        metas = [Orange.data.ContinuousVariable.make("map_x"),
+                 Orange.data.ContinuousVariable.make("map_y"),
+                 Orange.data.DiscreteVariable.make("channel", values=channels)]
+
+        domain = Orange.data.Domain([], None, metas=metas)
+        meta_data = Table.from_numpy(domain, X=np.zeros((len(M), 0)),
+                                     metas=meta_data)
+        
+        meta_data.attributes = dict(meta, Grid=grid_descriptor(meta))
+
+        return waveN, M, meta_data
+
+
+
+    def read_v2_interferograms(self, headers, file, meta):
+        # Desired headers:
+        # map_x  map_y  run  channel  [depth]
+
+        row_i = headers.index("Row")
+        col_i = headers.index("Column")
+        run_i = headers.index("Run")
+        dep_i = headers.index("Depth")
+        first = max(row_i, col_i, run_i, dep_i) + 1
+
+        # Run is averaging
+        # Depth is depth
+
+        channels = np.array(headers[first:])
+
+        blocks = self._v2_blocks(headers, file, "Depth")
+        M = self._v2_spectra(blocks, first, spectra_dtype(self))
+
+        meta_data = np.zeros((len(M), 4), dtype='object')
+        meta_data[:, 0] = np.repeat(blocks[:, 0, col_i], channels.size)
+        meta_data[:, 1] = np.repeat(blocks[:, 0, row_i], channels.size)
+        meta_data[:, 2] = np.repeat(blocks[:, 0, run_i], channels.size)
+        meta_data[:, 3] = np.tile(np.arange(channels.size), len(blocks))
 
         meta_data[:,[0, 1]] = transform_row_col(meta_data[:,[0, 1]], meta)
 
 
-        waveN = file[0:int(n_cols), dep_i]
+        waveN = blocks[0, :, dep_i]
         metas = [Orange.data.ContinuousVariable.make("map_x"),
                  Orange.data.ContinuousVariable.make("map_y"),
                  Orange.data.ContinuousVariable.make("run"),
@@ -312,18 +670,22 @@ class Nea2Reader(FileFormat, SpectralFileFormat):
         meta_data = Table.from_numpy(domain, X=np.zeros((len(M), 0)),
                                      metas=meta_data)
         
-        meta_data.attributes = meta
+        meta_data.attributes = dict(meta, Grid=grid_descriptor(meta))
 
         return waveN, M, meta_data
 
 
 
+    def follower(self):
+        """Return a 'Nea2Follower' for reading the file while it is written."""
+        return Nea2Follower(self)
 
 
+    def read(self):
+        return build_spec_table(*self.read_spectra(), dtype=spectra_dtype(self))
 
 
-
-
+    @cached_spectra
     def read_spectra(self):
         version = 1
         with open(self.filename, "rt", encoding='utf-8') as f:
@@ -335,6 +697,153 @@ class Nea2Reader(FileFormat, SpectralFileFormat):
             return self.read_v2()
         
 
+
+
+
+class Nea2Follower:
+    """Read the pixels appended to a NeaSPEC (version 2) export as it is written.
+
+    The follower remembers the byte offset of the data it has read, so
+    each 'update' only parses the lines appended since the previous one
+    and adds the pixel blocks they complete to 'data', the table of all
+    pixels read so far. Lines of a block that is still being written are
+    kept until the block is complete. The reader's 'channels', 'runs' and
+    'dtype' options apply.
+
+    'update' does not wait for new lines; 'follow' calls it from a Qt
+    timer, so a widget can follow a file without blocking.
+    """
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.offset = None
+        self.meta = None
+        self.headers = None
+        self.usecols = None
+        self.where = None
+        self.pending = None
+        self.n_points = None
+
+        self.data = None
+        # Rows of 'data', with room to grow; 'data' views their start.
+        self._X = None
+        self._metas = None
+        self._ids = None
+
+
+    def _start(self):
+        # Read the header once it is complete.
+        with open(self.reader.filename, "r", encoding='utf-8') as f:
+            while True:
+                line = f.readline()
+
+                if not line.endswith("\n"):
+                    return False
+
+                if line[0] != '#':
+                    break
+
+            f.seek(0)
+            meta, headers = self.reader.read_v2_header(f)
+            self.offset = f.tell()
+
+        self.meta = meta
+        self.usecols, self.where, self.headers = self.reader.v2_columns(headers)
+
+        return True
+
+
+    def _append(self, table):
+        # Add the rows of 'table' to 'data'. The buffers grow by half, and
+        # a grown buffer is a new array, so tables returned before still
+        # view rows that are never written again.
+        n = 0 if self.data is None else len(self.data)
+        m = n + len(table)
+
+        if self._X is None or m > len(self._X):
+            capacity = max(m, int(1.5 * (0 if self._X is None else len(self._X))))
+            buffers = []
+
+            for old, new in [(self._X, table.X), (self._metas, table.metas),
+                             (self._ids, table.ids)]:
+                buffer = np.empty((capacity,) + new.shape[1:], dtype=new.dtype)
+                if old is not None:
+                    buffer[:n] = old[:n]
+                buffers.append(buffer)
+
+            self._X, self._metas, self._ids = buffers
+
+        self._X[n:m] = table.X
+        self._metas[n:m] = table.metas
+        self._ids[n:m] = table.ids
+
+        self.data = table_from_numpy(table.domain, self._X[:m], dtype=self._X.dtype,
+                                     metas=self._metas[:m], ids=self._ids[:m],
+                                     attributes=table.attributes)
+
+
+    def update(self):
+        """Read the pixels completed since the last update.
+
+        Returns the table of all pixels read so far ('data'), or None if
+        no pixel was completed since the last update.
+        """
+        if self.offset is None and not self._start():
+            return None
+
+        with open(self.reader.filename, "rb") as f:
+            f.seek(self.offset)
+            data = f.read()
+
+        # Only complete lines are read.
+        end = data.rfind(b"\n") + 1
+        self.offset += end
+
+        body = loadtxt_chunked(io.StringIO(data[:end].decode("utf-8")), len(self.headers),
+                               usecols=self.usecols, where=self.where)
+
+        if self.pending is not None:
+            body = np.concatenate([self.pending, body])
+
+        if self.n_points is None:
+            # The first block ends where the pixel (or run) changes, or
+            # after the header's number of points.
+            self.n_points = self.reader.v2_block_length(self.headers, body, self.meta)
+
+            if self.n_points is None:
+                self.pending = body
+                return None
+
+        n = len(body) // self.n_points * self.n_points
+        self.pending = body[n:]
+
+        if n == 0:
+            return None
+
+        self._append(build_spec_table(*self.reader.read_v2_body(self.headers, body[:n],
+                                                                self.meta),
+                                      dtype=spectra_dtype(self.reader)))
+
+        return self.data
+
+
+    def follow(self, interval=1.0, timeout=None, parent=None):
+        """Return a started 'FollowTimer' that updates every 'interval' seconds.
+
+        Its 'updated' signal gives the table of all pixels read so far;
+        it stops once no pixel has been completed for 'timeout' seconds
+        (or never, if 'timeout' is None). Needs a running Qt event loop.
+        """
+        # Imported here, so reading files does not need Qt.
+        from orangecontrib.b22.utils.follow import FollowTimer
+
+        timer = FollowTimer(self, interval, timeout, parent)
+        timer.start()
+        return timer
+
+
+
+
 if __name__ == "__main__":
     from Orange.data.table import dataset_dirs
     #reader = GWYReader()
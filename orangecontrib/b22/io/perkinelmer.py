@@ -1,8 +1,18 @@
+import functools
+import glob
+import os
+import re
 import struct
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
 import numpy as np
-from Orange.data import Table, Domain, FileFormat
+from Orange.data import Table, Domain, FileFormat, ContinuousVariable, StringVariable
 from orangecontrib.spectroscopy.io.util import SpectralFileFormat
 
+from orangecontrib.b22.io.utils import cached_spectra, build_spec_table, spectra_dtype, \
+    iter_triplet, CHUNK_ROWS
+
 
 ## The below file readers are based on file readers written by Specio
 ## (https://github.com/paris-saclay-cds/specio) with the following
@@ -39,17 +49,32 @@ from orangecontrib.spectroscopy.io.util import SpectralFileFormat
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 
+@functools.lru_cache(maxsize=None)
+def _struct(format):
+    return struct.Struct(format)
+
+
+
+
 class BlockReader:
+    """Read blocks of a binary buffer without copying them.
+
+    The data is held as a memoryview, so 'peek' and 'read' return views
+    into the original buffer, and unpacking uses cached 'struct.Struct'
+    objects instead of re-parsing the format string on every call.
+    """
+
     def __init__(self, data, start=0):
-        self.data = data
+        self.data = memoryview(data)
         self.start = start
     
 
     def peek(self, step, format=None, expect_tuple=False):
-        block = self.data[self.start : self.start + step]
-        return BlockReader.format(block,
-                                  format, 
-                                  expect_tuple=expect_tuple)
+        return BlockReader.readData(self.data,
+                                    self.start,
+                                    step,
+                                    format=format,
+                                    expect_tuple=expect_tuple)
     
 
     def read(self, step, format=None, expect_tuple=False):
@@ -75,7 +100,7 @@ class BlockReader:
 
     @staticmethod
     def readData(data, start, step, format=None, expect_tuple=False):
-        block = data[start : start + step]
+        block = memoryview(data)[start : start + step]
         return BlockReader.format(block,
                                   format, 
                                   expect_tuple=expect_tuple)
@@ -105,12 +130,12 @@ class BlockReader:
 
     @staticmethod
     def _decode(data, format):
-        return data.decode(format)
+        return str(data, format)
 
 
     @staticmethod
     def _unpack(data, format):
-        return struct.unpack(format, data)
+        return _struct(format).unpack(data)
     
 
     @staticmethod
@@ -136,7 +161,10 @@ class PerkinElmer:
     
 
     @staticmethod
-    def createMeta(values, attrs, meta=dict()):
+    def createMeta(values, attrs, meta=None):
+        if meta is None:
+            meta = {}
+
         for attr_name, attr_index in attrs:
             try:
                 meta[attr_name] = values[attr_index]
@@ -193,39 +221,45 @@ class PerkinElmer:
         return meta
 
 
+    # Tags of the values in a 5104 block: a string ('#u', followed by its
+    # size, the string and 6 bytes), a short ('$u', followed by 6 bytes)
+    # and a bare short (',u').
+    TAGS_5104 = re.compile(rb'#u|\$u|,u')
+
+    SHORT = _struct("<h")
+
+
     @staticmethod
     def decode5104(data):
         values = []
 
-        block_reader = BlockReader(data)
+        data = memoryview(data)
+        end = len(data) - 1  # a tag must start before the last 2 bytes
+        start = 0
+
+        # Jump from tag to tag, rather than stepping through every byte.
+        while True:
+            match = PerkinElmer.TAGS_5104.search(data, start, end)
 
-        while not block_reader.atEnd(2):
-            tag = block_reader.read(2)
+            if match is None:
+                break
+
+            tag = match.group()
+            start = match.end()
+
+            value, = PerkinElmer.SHORT.unpack_from(data, start)
+            start += 2
 
             if tag == b'#u':
-                value_size = block_reader.read(2,
-                                               format="<h",
-                                               expect_tuple=False)
-                
-                values.append(block_reader.read(value_size,
-                                                format="utf-8"))
-                
-                block_reader.step(6)
-            
+                values.append(str(data[start:start + value], "utf-8"))
+                start += value + 6
+
             elif tag == b'$u':
-                values.append(block_reader.read(2,
-                                                format="<h",
-                                                expect_tuple=False))
-                
-                block_reader.step(6)
-            
-            elif tag == b',u':
-                values.append(block_reader.read(2,
-                                                format="<h",
-                                                expect_tuple=False))
-            
+                values.append(value)
+                start += 6
+
             else:
-                block_reader.step(-1)
+                values.append(value)
 
         meta = PerkinElmer.createMeta(
             values,
@@ -336,13 +370,197 @@ class PerkinElmer:
     
 
 
+def sp_batch_paths(path):
+    """Return the sorted SP files in a directory or matching a glob."""
+    if os.path.isdir(path):
+        path = os.path.join(path, "*.sp")
+
+    return sorted(glob.glob(path))
+
+
+def _read_sp_file(file_path):
+    # Runs in a worker process; only the spectrum and header are sent back.
+    _, X, meta = PerkinElmerReader(file_path).read_sp()
+    return X[0], meta.attributes
+
+
+def _header_values(variable, values):
+    if variable.is_continuous:
+        return [np.nan if v is None else v for v in values]
+
+    return ["" if v is None else str(v) for v in values]
+
+
+def _header_variable(name, values):
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool)
+           for v in values if v is not None):
+        variable = ContinuousVariable.make(name)
+    else:
+        variable = StringVariable.make(name)
+
+    return variable, _header_values(variable, values)
+
+
+def _read_sp_files(paths, max_workers=None):
+    # The (spectrum, header) of each file, parsed in a process pool.
+    workers = min(max_workers or os.cpu_count() or 1, len(paths))
+    if workers <= 1:
+        return list(map(_read_sp_file, paths))
+
+    # Batch the files, so each task is worth sending to a process.
+    chunksize = max(1, len(paths) // (4 * workers))
+
+    # Spawned workers do not inherit the threads and Qt state of the
+    # (widget) process, unlike forked ones.
+    with ProcessPoolExecutor(workers, mp_context=get_context("spawn")) as executor:
+        return list(executor.map(_read_sp_file, paths, chunksize=chunksize))
+
+
+def _sp_batch(paths, results, variables=None):
+    # The triplet of read SP files; 'variables' are the metas of the
+    # header fields, or None to choose them from the values.
+    spectra, headers = zip(*results)
+
+    for file_path, header in zip(paths[1:], headers[1:]):
+        for key in ["min_wavelength", "max_wavelength", "n_points"]:
+            if header[key] != headers[0][key]:
+                raise ValueError(f"'{file_path}' has {key} = {header[key]}, but "
+                                 f"'{paths[0]}' has {key} = {headers[0][key]}.")
+
+    wavenumbers = np.linspace(headers[0]["min_wavelength"],
+                              headers[0]["max_wavelength"],
+                              headers[0]["n_points"])
+
+    columns = [[os.path.basename(file_path) for file_path in paths]]
+
+    if variables is None:
+        variables = [StringVariable.make("filename")]
+
+        for key in headers[0]:
+            variable, values = _header_variable(key, [header.get(key) for header in headers])
+            variables.append(variable)
+            columns.append(values)
+
+    else:
+        for variable in variables[1:]:
+            columns.append(_header_values(variable, [header.get(variable.name)
+                                                     for header in headers]))
+
+    metas = np.empty((len(paths), len(columns)), dtype=object)
+    for i, values in enumerate(columns):
+        metas[:, i] = values
+
+    meta_data = Table.from_numpy(Domain([], None, metas=variables),
+                                 X=np.zeros((len(paths), 0)),
+                                 metas=metas)
+
+    return wavenumbers, np.vstack(spectra), meta_data
+
+
+def read_sp_batch(path, max_workers=None):
+    """Read a batch of SP spectra (one per file) into a single table.
+
+    The files are parsed in a process pool. All spectra must share the
+    same wavenumber axis.
+
+    Parameters
+    ----------
+    path : str
+        A directory (all of its SP files are read) or a glob pattern.
+    max_workers : int | None
+        The number of worker processes.
+
+    Returns
+    -------
+    tuple
+        The wavenumbers, the (files, points) spectra and a table with
+        the file name and the decoded header fields as metas.
+    """
+    paths = sp_batch_paths(path)
+
+    if not paths:
+        raise ValueError(f"No SP files found in '{path}'.")
+
+    return _sp_batch(paths, _read_sp_files(paths, max_workers))
+
+
+def iter_sp_batch(path, rows=CHUNK_ROWS, max_workers=None):
+    """As 'read_sp_batch', but yield the triplets of 'rows' files at a time.
+
+    The metas of the header fields are chosen from the first chunk.
+    """
+    paths = sp_batch_paths(path)
+
+    if not paths:
+        raise ValueError(f"No SP files found in '{path}'.")
+
+    first, variables = None, None
+
+    for start in range(0, len(paths), rows):
+        chunk = paths[start:start + rows]
+        wavenumbers, X, meta_data = _sp_batch(chunk, _read_sp_files(chunk, max_workers),
+                                              variables)
+
+        if first is None:
+            first, variables = wavenumbers, meta_data.domain.metas
+        elif not np.array_equal(wavenumbers, first):
+            raise ValueError(f"'{chunk[0]}' has other wavenumbers than '{paths[0]}'.")
+
+        yield first, X, meta_data
+
+
+
+
 class PerkinElmerReader(FileFormat, SpectralFileFormat):
 
     EXTENSIONS = (".sp", ".fsm",)
     DESCRIPTION = "Perkin Elmer File"
+    CACHE_VERSION = 3
+
+    # Sheets of FSM maps, offered by the File widget: presets of the FSM
+    # options below, which override the reader's attributes. Pixel
+    # regions depend on the size of each map and have no presets; they
+    # can only be set from Python ('region').
+    FSM_SHEETS = {
+        "Full map": {},
+        "Preview (every 2nd pixel)": {"stride": 2},
+        "Preview (every 4th pixel)": {"stride": 4},
+        "Preview (every 8th pixel)": {"stride": 8},
+        "Fingerprint region (900-1800 cm-1)": {"wavenumber_range": (900, 1800)},
+        "Amide I and II (1480-1720 cm-1)": {"wavenumber_range": (1480, 1720)},
+        "CH stretching (2800-3050 cm-1)": {"wavenumber_range": (2800, 3050)},
+    }
+
+    # Sheets of SP spectra: the selected file only, or every SP file in
+    # its directory.
+    SP_SINGLE = "Single spectrum"
+    SP_FOLDER = "All spectra in folder"
+
+    # FSM options: an (x0, y0, x1, y1) pixel rectangle (end exclusive),
+    # the pixel stride and a (low, high) wavenumber range. None selects
+    # the whole map or spectrum.
+    region = None
+    stride = 1
+    wavenumber_range = None
+
+    # The dtype of the table's spectra, or None for the 'spectra_dtype' default.
+    dtype = None
 
 
-    def read_sp(self):
+    @property
+    def sheets(self):
+        if self.filename[-3:] == "fsm":
+            return list(self.FSM_SHEETS)
+        return [PerkinElmerReader.SP_SINGLE, PerkinElmerReader.SP_FOLDER]
+
+
+    def cache_options(self):
+        return self.fsm_options()
+
+
+    def _read_sp(self, spectrum=True):
+        # Decode the blocks of an SP file: its metadata and, optionally,
+        # its spectrum.
         f = open(self.filename, "rb")
         data = f.read()
         f.close()
@@ -360,11 +578,13 @@ class PerkinElmerReader(FileFormat, SpectralFileFormat):
             35699: PerkinElmer.decode35699,
             35700: PerkinElmer.decode35700,
             35701: PerkinElmer.decode35701,
-            35708: PerkinElmer.decode35708,
         }
 
+        if spectrum:
+            decoders[35708] = PerkinElmer.decode35708
+
         stops = []
-        spectrum = []
+        values = []
 
         block_id, block_size = reader.read(6,
                                            format="<Hi",
@@ -405,10 +625,16 @@ class PerkinElmerReader(FileFormat, SpectralFileFormat):
                     meta.update(decoded)
                 
                 else:
-                    spectrum = decoded
+                    values = decoded
 
             reader.start += block_size
 
+        return meta, values
+
+
+    def read_sp(self):
+        meta, spectrum = self._read_sp()
+
         wavenumbers = np.linspace(meta['min_wavelength'],
                                   meta['max_wavelength'],
                                   meta['n_points'])
@@ -424,57 +650,242 @@ class PerkinElmerReader(FileFormat, SpectralFileFormat):
         return wavenumbers, datavals, meta_data
     
 
-    def read_fsm(self):
-        f = open(self.filename, "rb")
-        data = f.read()
-        f.close()
+    FSM_DECODERS = {
+        5100: PerkinElmer.decode5100,
+        5104: PerkinElmer.decode5104,
+    }
 
-        reader = BlockReader(data)
 
-        meta = {
-            "signature" : reader.read(4, format="utf-8"),
-            "description" : reader.read(40, format="utf-8"),
-        }
+    def read_fsm_header(self):
+        """Decode the blocks of an FSM file up to its first spectrum.
 
-        decoders = {
-            5100: PerkinElmer.decode5100,
-            5104: PerkinElmer.decode5104,
-            5105: PerkinElmer.decode5105,
-        }
+        Returns
+        -------
+        tuple
+            The metadata and the file offset of the first 5105 (spectrum)
+            block, or None if there are no spectra.
+        """
+        with open(self.filename, "rb") as f:
+            reader = BlockReader(f.read(44))
+
+            meta = {
+                "signature" : reader.read(4, format="utf-8"),
+                "description" : reader.read(40, format="utf-8"),
+            }
+
+            while True:
+                header = f.read(6)
+
+                if len(header) < 6:
+                    return meta, None
+
+                block_id, block_size = BlockReader.format(header, "<Hi", expect_tuple=True)
+
+                if block_id == 5105:
+                    return meta, f.tell() - 6
+
+                if block_id in self.FSM_DECODERS:
+                    meta.update(self.FSM_DECODERS[block_id](f.read(block_size)))
+                else:
+                    f.seek(block_size, 1)
+
+
+    def fsm_spectra(self, offset, n_z):
+        """Return a strided view of the spectra of a memory-mapped FSM file.
+
+        Every spectrum is stored as a 5105 block: a 6-byte header followed
+        by n_z float32 values, so from 'offset' on the file is a regular
+        array of blocks and the values are a (blocks, n_z) view of it.
+
+        Returns None if the blocks do not follow this layout.
+        """
+        block = np.dtype([("id", "<u2"), ("size", "<i4"), ("values", "<f4", (n_z,))])
+
+        n_blocks, rest = divmod(os.path.getsize(self.filename) - offset, block.itemsize)
 
-        spectrum = []
+        if rest != 0 or n_blocks == 0:
+            return None
 
+        # Copy-on-write, so the spectra can be modified without touching the file.
+        blocks = np.memmap(self.filename, dtype=block, mode="c",
+                           offset=offset, shape=(n_blocks,))
+
+        if np.any(blocks["id"] != 5105) or np.any(blocks["size"] != 4 * n_z):
+            return None
+
+        return blocks["values"]
+
+
+    def _read_fsm_blocks(self, offset, n_z):
+        # Generic path for files whose spectrum blocks are not regular.
+        with open(self.filename, "rb") as f:
+            f.seek(offset)
+            reader = BlockReader(f.read())
+
+        blocks = []
         while not reader.atEnd(6):
             block_id, block_size = reader.read(6,
                                                format="<Hi",
                                                expect_tuple=True)
+            if block_id == 5105:
+                blocks.append((reader.start, block_size))
+            reader.step(block_size)
 
-            decoded = decoders[block_id](reader.read(block_size))
+        spectra = np.empty((len(blocks), n_z), dtype=np.float32)
+        for i, (start, block_size) in enumerate(blocks):
+            spectra[i] = PerkinElmer.decode5105(BlockReader.readData(reader.data,
+                                                                     start,
+                                                                     block_size))
 
-            if isinstance(decoded, dict):
-                meta.update(decoded)
-            else:
-                spectrum.append(decoded)
+        return spectra
 
-        
-        wavenumbers = np.arange(meta['z_start'],
-                                meta['z_end'] + meta['z_delta'],
-                                meta['z_delta'])
-        
-        datavals = np.squeeze(spectrum)
 
-        domain = Domain([], None)
-        meta_data = Table.from_numpy(domain,
-                                     X=np.zeros((len(datavals), 0)))
+    def fsm_options(self):
+        """Return the region, stride and wavenumber range of FSM maps.
+
+        The preset of the selected sheet overrides the attributes.
+        """
+        options = {
+            "region": self.region,
+            "stride": self.stride,
+            "wavenumber_range": self.wavenumber_range,
+        }
+        options.update(self.FSM_SHEETS.get(self.sheet, {}))
+        return options
+
+
+    def select_fsm(self, wavenumbers, spectra, meta):
+        """Select the region, stride and wavenumber range of an FSM map.
+
+        The options are those of 'fsm_options': the sheets offer strides
+        and wavenumber ranges, while a pixel region must be set as the
+        'region' attribute from Python. The selection is made by slicing, so with the memory-mapped
+        spectra only the selected values are read from the file.
+        """
+        n_x, n_y = meta['n_x'], meta['n_y']
+        options = self.fsm_options()
+        region, stride = options["region"], options["stride"]
+
+        x0, y0, x1, y1 = (0, 0, n_x, n_y) if region is None else region
+
+        if not (0 <= x0 < x1 <= n_x and 0 <= y0 < y1 <= n_y):
+            raise ValueError(f"Region {region} is outside of the {n_x}x{n_y} map.")
+
+        if options["wavenumber_range"] is None:
+            z = slice(None)
+        else:
+            lower, upper = sorted(options["wavenumber_range"])
+            inside = np.flatnonzero((wavenumbers >= lower) & (wavenumbers <= upper))
+            z = slice(inside[0], inside[-1] + 1) if len(inside) else slice(0, 0)
+
+        wavenumbers = wavenumbers[z]
+
+        if len(spectra) != n_x * n_y:
+            if region is not None or stride != 1:
+                raise ValueError(f"Expected {n_x * n_y} spectra, but got {len(spectra)}.")
+
+            return wavenumbers, spectra[:, z], None
+
+        # Spectra are stored row by row (x varies fastest).
+        image = spectra.reshape(n_y, n_x, -1)[y0:y1:stride, x0:x1:stride, z]
+
+        xs = meta['x_init'] + meta['x_delta'] * np.arange(x0, x1, stride)
+        ys = meta['y_init'] + meta['y_delta'] * np.arange(y0, y1, stride)
+
+        coords = np.column_stack((np.tile(xs, len(ys)), np.repeat(ys, len(xs))))
+
+        return wavenumbers, image.reshape(-1, image.shape[2]), coords
+
+
+    def _fsm_selection(self):
+        # The selected wavenumbers, spectra and coordinates, and the header.
+        meta, offset = self.read_fsm_header()
+
+        n_z = meta['n_z']
+
+        wavenumbers = meta['z_start'] + meta['z_delta'] * np.arange(n_z)
+
+        if offset is None:
+            datavals = np.empty((0, n_z), dtype=np.float32)
+        else:
+            datavals = self.fsm_spectra(offset, n_z)
+
+            if datavals is None:
+                datavals = self._read_fsm_blocks(offset, n_z)
+
+        return *self.select_fsm(wavenumbers, datavals, meta), meta
+
+
+    @staticmethod
+    def _fsm_meta_table(n, coords, meta):
+        if coords is None:
+            domain = Domain([], None)
+            meta_data = Table.from_numpy(domain,
+                                         X=np.zeros((n, 0)))
+        else:
+            domain = Domain([], None, metas=[ContinuousVariable.make("map_x"),
+                                             ContinuousVariable.make("map_y")])
+            meta_data = Table.from_numpy(domain,
+                                         X=np.zeros((n, 0)),
+                                         metas=coords.astype(object))
         
         meta_data.attributes = meta
         
-        return wavenumbers, datavals, meta_data
-    
+        return meta_data
+
 
+    def read_fsm(self):
+        wavenumbers, datavals, coords, meta = self._fsm_selection()
+        
+        return wavenumbers, datavals, self._fsm_meta_table(len(datavals), coords, meta)
+
+
+    def iter_chunks(self, rows=CHUNK_ROWS):
+        """Yield the spectra in chunks of at most 'rows' rows.
+
+        Each chunk is a (wavenumbers, X, meta table) triplet as returned
+        by 'read_spectra'. The spectra of FSM maps are views of the
+        memory-mapped file, and the spectra of the "All spectra in
+        folder" sheet are read as the chunks are consumed.
+        """
+        if self.sheet == PerkinElmerReader.SP_FOLDER:
+            yield from iter_sp_batch(os.path.dirname(self.filename) or ".", rows)
+
+        elif self.filename[-2:] == "sp":
+            yield from iter_triplet(*self.read_sp(), rows)
+
+        else:
+            wavenumbers, datavals, coords, meta = self._fsm_selection()
+
+            for start in range(0, len(datavals), rows):
+                X = datavals[start:start + rows]
+                chunk_coords = None if coords is None else coords[start:start + rows]
+
+                yield wavenumbers, X, self._fsm_meta_table(len(X), chunk_coords, meta)
+
+
+    def read_header(self):
+        """Read the metadata of the file without reading its spectra."""
+        if self.filename[-2:] == "sp":
+            meta, _ = self._read_sp(spectrum=False)
+            return meta
+
+        meta, _ = self.read_fsm_header()
+        return meta
+
+
+    @cached_spectra
     def read_spectra(self):
         if self.filename[-2:] == "sp":
             return self.read_sp()
         
         else:
             return self.read_fsm()
+
+
+    def read(self):
+        if self.sheet == PerkinElmerReader.SP_FOLDER:
+            return build_spec_table(*read_sp_batch(os.path.dirname(self.filename) or "."),
+                                    dtype=spectra_dtype(self))
+
+        return build_spec_table(*self.read_spectra(), dtype=spectra_dtype(self))
@@ -0,0 +1,80 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from orangecontrib.b22.io.gwyddion import GWYReader
+from orangecontrib.b22.io.neaspec import Nea2Reader
+from orangecontrib.b22.io.perkinelmer import PerkinElmerReader
+
+
+
+
+# Readers with a 'read_header' method.
+HEADER_READERS = (Nea2Reader, GWYReader, PerkinElmerReader)
+
+
+
+
+def header_reader(file_path):
+    """Return the reader class of a file (by its extension), or None."""
+    extension = os.path.splitext(file_path)[1].lower()
+
+    for reader in HEADER_READERS:
+        if extension in reader.EXTENSIONS:
+            return reader
+
+    return None
+
+
+def read_header(file_path):
+    """Read the metadata of a file without reading its data."""
+    reader = header_reader(file_path)
+
+    if reader is None:
+        raise ValueError(f"No reader for '{file_path}'.")
+
+    return reader(file_path).read_header()
+
+
+def scan_paths(path, recursive=False):
+    """Return the sorted files in a directory that have a reader."""
+    if recursive:
+        paths = [os.path.join(root, name)
+                 for root, _, names in os.walk(path) for name in names]
+    else:
+        paths = [entry.path for entry in os.scandir(path) if entry.is_file()]
+
+    return sorted(p for p in paths if header_reader(p) is not None)
+
+
+def scan_metadata(path, recursive=False, max_workers=None):
+    """Read the headers of all supported files in a directory.
+
+    Only the headers are read (see the readers' 'read_header'), in a
+    thread pool, so a directory of large maps is indexed in about the
+    time it takes to open its files.
+
+    Parameters
+    ----------
+    path : str
+        The directory to scan.
+    recursive : bool
+        If True, subdirectories are scanned too.
+    max_workers : int | None
+        The number of threads used to read the headers.
+
+    Returns
+    -------
+    dict
+        The header of each file, by path; None for files whose header
+        could not be read.
+    """
+    paths = scan_paths(path, recursive=recursive)
+
+    def load(file_path):
+        try:
+            return read_header(file_path)
+        except Exception:  # pylint: disable=broad-except
+            return None
+
+    with ThreadPoolExecutor(max_workers) as executor:
+        return dict(zip(paths, executor.map(load, paths)))
@@ -0,0 +1,47 @@
+import os
+import tempfile
+import unittest
+
+from orangecontrib.b22.io.benchmark import CASES, generate, measure, report
+
+
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_cases(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for case in CASES:
+                path = generate(case, directory, (3, 2), 16, 4)
+                self.assertTrue(os.path.exists(path))
+
+                seconds, _, _, shape = measure(case, path)
+                self.assertGreater(seconds, 0)
+
+                if case == "gsf":
+                    self.assertEqual(shape, (6, 1))
+                elif case == "nea_v2_interferogram":
+                    # Two runs of the four channels.
+                    self.assertEqual(shape, (6 * 2 * 4, 16))
+                elif case.startswith("nea"):
+                    # The v1 runs are averaged.
+                    self.assertEqual(shape, (6 * 4, 16))
+                else:
+                    self.assertEqual(shape, (6, 16))
+
+
+    def test_report(self):
+        result = {"case": "fsm", "pixels": 6, "points": 16, "channels": 4, "columns": 16,
+                  "bytes": 1024**2, "seconds": 0.5, "mb_per_s": 2.0, "us_per_pixel": 1.0,
+                  "peak_rss_mb": None, "read_rss_mb": None}
+
+        lines = report([result], [dict(result, seconds=1.0)]).splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].endswith("0.50x"))
+
+        self.assertNotIn("vs ref", report([result]))
+
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from orangecontrib.b22.io import Nea2Reader
+from orangecontrib.b22.io.utils import SpectraCache, spectra_cache
+from orangecontrib.b22.io.tests.test_neaspec import write_nea_v2
+
+
+
+
+class TestSpectraCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "map.txt")
+        write_nea_v2(self.path)
+
+        self.directory = os.path.join(self.tmp.name, "cache")
+        spectra_cache.enable(directory=self.directory, max_size=2**30)
+
+
+    def tearDown(self):
+        spectra_cache.disable()
+        spectra_cache.directory = None
+        self.tmp.cleanup()
+
+
+    def read(self):
+        return Nea2Reader(self.path).read_spectra()
+
+
+    def test_disabled(self):
+        spectra_cache.disable()
+        self.read()
+        self.assertFalse(os.path.exists(self.directory))
+
+
+    def test_hit(self):
+        wavenumbers, X, meta = self.read()
+
+        with patch.object(Nea2Reader, "read_v2") as read_v2:
+            cached = self.read()
+            read_v2.assert_not_called()
+
+        np.testing.assert_array_equal(cached[0], wavenumbers)
+        np.testing.assert_array_equal(cached[1], X)
+        self.assertIsInstance(cached[1], np.memmap)
+        np.testing.assert_array_equal(cached[2].metas, meta.metas)
+        self.assertEqual(cached[2].attributes, meta.attributes)
+
+
+    def test_stale(self):
+        self.read()
+
+        write_nea_v2(self.path, rows=3)
+        os.utime(self.path, ns=(0, 0))
+
+        _, X, _ = self.read()
+        self.assertEqual(X.shape[0], 3 * 3 * 3)
+
+
+    def test_corrupt(self):
+        self.read()
+
+        (_, _, entry), = spectra_cache.entries()
+        with open(os.path.join(entry, SpectraCache.X_FILE), "wb") as f:
+            f.write(b"garbage")
+
+        _, X, _ = self.read()
+        self.assertEqual(X.shape, (2 * 3 * 3, 4))
+        self.assertNotIsInstance(X, np.memmap)
+
+        _, X, _ = self.read()
+        self.assertIsInstance(X, np.memmap)
+
+
+    def test_evict(self):
+        other = os.path.join(self.tmp.name, "other.txt")
+        write_nea_v2(other, rows=3)
+
+        self.read()
+        (_, size, first), = spectra_cache.entries()
+        os.utime(os.path.join(first, SpectraCache.KEY_FILE), (0, 0))
+
+        spectra_cache.max_size = 2 * size
+        Nea2Reader(other).read_spectra()
+
+        entries = spectra_cache.entries()
+        self.assertEqual(len(entries), 1)
+        self.assertNotEqual(entries[0][2], first)
+
+
+
+
+if __name__ == "__main__":
+    unittest.main()
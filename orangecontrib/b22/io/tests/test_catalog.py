@@ -0,0 +1,131 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from orangecontrib.b22.io.catalog import MetadataCatalog, header_record
+from orangecontrib.b22.io.tests.test_gwyddion import write_gsf
+from orangecontrib.b22.io.tests.test_neaspec import write_nea_v2
+from orangecontrib.b22.io.tests.test_perkinelmer import write_fsm
+
+
+
+
+def write_nea(path, project, date, center=(10.0, 20.0)):
+    write_nea_v2(path)
+
+    with open(path, encoding="utf-8") as f:
+        lines = f.readlines()
+
+    lines[2] = f"# Project:\t{project}\n"
+    lines[3] = f"# Scanner Center Position (X, Y):\t[µm]\t{center[0]}\t{center[1]}\n"
+    lines.insert(1, f"# Date:\t{date}\n")
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+
+
+
+
+class TestMetadataCatalog(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data = os.path.join(self.tmp.name, "data")
+        os.makedirs(os.path.join(self.data, "sub"))
+
+        # Scan areas are 3 x 2, centred on the given positions.
+        write_nea(self.path("a.txt"), "P1", "01/02/2024 10:00:00")
+        write_nea(self.path("sub/b.txt"), "P1", "03/04/2024 10:00:00", center=(50.0, 50.0))
+        write_nea(self.path("c.txt"), "P2", "05/06/2024 10:00:00")
+        write_gsf(self.path("scan.gsf"), np.zeros((4, 5)), x_real=2.0, y_real=1.0)
+        write_fsm(self.path("image.fsm"))
+
+        self.catalog = MetadataCatalog(os.path.join(self.tmp.name, "catalog.sqlite"))
+        self.catalog.add_folder(self.data)
+
+
+    def tearDown(self):
+        self.catalog.close()
+        self.tmp.cleanup()
+
+
+    def path(self, name):
+        return os.path.join(self.data, name)
+
+
+    def test_query(self):
+        self.assertEqual(self.catalog.update(), (5, 0))
+
+        self.assertEqual(self.catalog.query(project="P1"),
+                         [self.path("a.txt"), self.path("sub/b.txt")])
+        self.assertEqual(self.catalog.query(project="P1", region=(11, 20.5, 12, 30)),
+                         [self.path("a.txt")])
+        self.assertEqual(self.catalog.query(project="P1", after="2024-02-01"),
+                         [self.path("sub/b.txt")])
+        # The FSM header is dated 2024-01-02.
+        self.assertEqual(self.catalog.query(before="2024-02-01"),
+                         [self.path("a.txt"), self.path("image.fsm")])
+
+        # GSF: (0, 0) to (2, 1); FSM: (10, 20) to (13, 22.5).
+        self.assertEqual(self.catalog.query(region=(1.5, 0.5, 1.6, 0.6)),
+                         [self.path("scan.gsf")])
+        self.assertEqual(self.catalog.query(region=(12.9, 22, 14, 23), reader="PerkinElmerReader"),
+                         [self.path("image.fsm")])
+
+        self.assertEqual(self.catalog.header(self.path("c.txt"))["Project"], "P2")
+
+
+    def test_perkinelmer_dates(self):
+        for date in ["Tue Jan 02 10:20:30 2024", "02/01/2024 10:20:30",
+                     "2 January 2024 10:20:30", "02-Jan-2024 10:20:30"]:
+            _, iso, _ = header_record("PerkinElmerReader", {"date": date})
+            self.assertEqual(iso, "2024-01-02T10:20:30")
+
+        _, iso, _ = header_record("PerkinElmerReader", {"date": "02/01/2024"})
+        self.assertEqual(iso, "2024-01-02T00:00:00")
+        self.assertIsNone(header_record("PerkinElmerReader", {"date": "soon"})[1])
+
+
+    def test_incremental(self):
+        self.catalog.update()
+
+        with patch("orangecontrib.b22.io.catalog.read_header") as read_header:
+            self.assertEqual(self.catalog.update(), (0, 0))
+            read_header.assert_not_called()
+
+        write_nea(self.path("a.txt"), "P3", "01/02/2024 10:00:00")
+        os.utime(self.path("a.txt"), ns=(0, 0))
+        os.remove(self.path("c.txt"))
+
+        self.assertEqual(self.catalog.update(), (1, 1))
+        self.assertEqual(self.catalog.query(project="P3"), [self.path("a.txt")])
+        self.assertEqual(self.catalog.query(project="P2"), [])
+
+
+    def test_persistent(self):
+        self.catalog.update()
+        self.catalog.close()
+
+        self.catalog = MetadataCatalog(os.path.join(self.tmp.name, "catalog.sqlite"))
+        self.assertEqual(self.catalog.folders(), [self.data])
+        self.assertEqual(len(self.catalog.query()), 5)
+
+
+    def test_unavailable_folder(self):
+        self.catalog.update()
+
+        shutil.move(self.data, self.data + "-moved")
+        self.assertEqual(self.catalog.update(), (0, 0))
+        self.assertEqual(len(self.catalog.query()), 5)
+
+        self.catalog.remove_folder(self.data)
+        self.assertEqual(self.catalog.query(), [])
+
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from Orange.data import Domain, ContinuousVariable
+
+from orangecontrib.b22.io import Nea2Reader, GWYReader, PerkinElmerReader
+from orangecontrib.b22.io.utils import set_spectra_dtype, spectra_dtype, table_from_numpy
+from orangecontrib.b22.io.tests.test_gwyddion import write_gsf
+from orangecontrib.b22.io.tests.test_neaspec import write_nea_v2
+from orangecontrib.b22.io.tests.test_perkinelmer import write_fsm
+
+
+
+
+class TestSpectraDtype(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+
+    def tearDown(self):
+        set_spectra_dtype(np.float64)
+        self.tmp.cleanup()
+
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+
+    def test_table_from_numpy(self):
+        domain = Domain([ContinuousVariable("a"), ContinuousVariable("b")])
+        X = np.array([[1, np.inf], [3, 4]], dtype=np.float32)
+
+        table = table_from_numpy(domain, X, dtype=np.float32)
+        self.assertEqual(table.X.dtype, np.float32)
+        np.testing.assert_array_equal(table.X, [[1, np.nan], [3, 4]])
+
+        self.assertEqual(table_from_numpy(domain, X).X.dtype, np.float64)
+
+
+    def test_global(self):
+        reader = GWYReader(self.path("scan.gsf"))
+        self.assertEqual(spectra_dtype(reader), np.float64)
+
+        set_spectra_dtype("float32")
+        self.assertEqual(spectra_dtype(reader), np.float32)
+
+        reader.dtype = np.float64
+        self.assertEqual(spectra_dtype(reader), np.float64)
+
+
+    def test_readers(self):
+        field = np.arange(20, dtype=np.float32).reshape(4, 5)
+        write_gsf(self.path("scan.gsf"), field)
+        write_nea_v2(self.path("map.txt"))
+        write_fsm(self.path("image.fsm"))
+
+        for reader in [GWYReader(self.path("scan.gsf")),
+                       Nea2Reader(self.path("map.txt")),
+                       PerkinElmerReader(self.path("image.fsm"))]:
+            expected = reader.read()
+            reader.dtype = np.float32
+            table = reader.read()
+
+            self.assertEqual(expected.X.dtype, np.float64)
+            self.assertEqual(table.X.dtype, np.float32)
+            self.assertEqual(table.domain, expected.domain)
+            np.testing.assert_allclose(table.X, expected.X, rtol=1e-6)
+            np.testing.assert_array_equal(table.metas, expected.metas)
+
+        reader = GWYReader(self.path("scan.gsf"))
+        reader.dtype = np.float32
+        reader.select_sheet(GWYReader.STACK)
+        np.testing.assert_array_equal(reader.read().X, field.reshape(-1, 1))
+        self.assertEqual(reader.read().X.dtype, np.float32)
+
+
+
+
+if __name__ == "__main__":
+    unittest.main()
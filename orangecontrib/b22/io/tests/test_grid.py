@@ -0,0 +1,130 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from orangecontrib.spectroscopy.utils import values_to_linspace
+
+from orangecontrib.b22.io import Nea2Reader, GWYReader
+from orangecontrib.b22.io.utils import grid_descriptor, transform_row_col
+from orangecontrib.b22.io.tests.test_gwyddion import write_gsf
+from orangecontrib.b22.io.tests.test_neaspec import write_nea_v2
+from orangecontrib.b22.utils.plots import gridIndex, gridRaster, gridLinspaces, \
+    generateCoords, rotateCoords
+
+
+
+
+META = {
+    "Real Center" : {"X" : 10.0, "Y" : 20.0},
+    "Angle"       : {"Theta" : 15.0},
+    "Real Area"   : {"X" : 6.0, "Y" : 4.0},
+    "Pixel Area"  : {"X" : 6, "Y" : 8},
+}
+
+
+def row_col(n_x, n_y):
+    return np.array([[c, r] for r in range(n_y) for c in range(n_x)], dtype=float)
+
+
+
+
+class TestGridDescriptor(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+
+    def test_descriptor(self):
+        index = row_col(6, 8)
+        coords = transform_row_col(index, META)
+        grid = grid_descriptor(META)
+
+        self.assertEqual(grid["shape"], (6, 8))
+        self.assertEqual(grid["angle"], 15.0)
+        np.testing.assert_allclose(grid["step"], (1.0, 0.5))
+        np.testing.assert_allclose(coords[0], grid["origin"])
+
+        np.testing.assert_array_equal(gridIndex(grid, coords), index)
+
+
+    def test_raster(self):
+        index = row_col(6, 8)
+        coords = transform_row_col(index, META)
+        lss, rot, found = gridRaster(grid_descriptor(META), coords)
+
+        # The raster, rotated back as 'ImageItem' draws it.
+        raster = rotateCoords(generateCoords(*lss), -rot)
+        np.testing.assert_allclose(raster[found[:, 1] * lss[0][2] + found[:, 0]], coords)
+
+        # Rotated grids have no axis-aligned linspaces.
+        self.assertIsNone(gridLinspaces(grid_descriptor(META), coords))
+
+
+    def test_subset(self):
+        index = row_col(6, 8)
+        coords = transform_row_col(index, META)
+        grid = grid_descriptor(META)
+
+        order = np.random.default_rng(0).permutation(len(coords))[:20]
+        np.testing.assert_array_equal(gridIndex(grid, coords[order]), index[order])
+
+        # Off the grid.
+        self.assertIsNone(gridIndex(grid, coords + 0.1))
+        self.assertIsNone(gridIndex(grid, transform_row_col(index - 1, META)))
+        self.assertIsNone(gridIndex({}, coords))
+
+
+    def test_readers(self):
+        write_nea_v2(self.path("map.txt"), rows=2, cols=3)
+        write_gsf(self.path("scan.gsf"), np.zeros((4, 5)))
+
+        for reader in [Nea2Reader(self.path("map.txt")), GWYReader(self.path("scan.gsf"))]:
+            table = reader.read()
+            coords = np.column_stack((table.get_column("map_x"), table.get_column("map_y")))
+            grid = table.attributes["Grid"]
+
+            # Every pixel of the scan is found.
+            index = gridIndex(grid, coords)
+            self.assertEqual(len(np.unique(index, axis=0)), np.prod(grid["shape"]))
+
+            lsx, lsy = gridLinspaces(grid, coords)
+            np.testing.assert_allclose(lsx, values_to_linspace(coords[:, 0]))
+            np.testing.assert_allclose(lsy, values_to_linspace(coords[:, 1]))
+
+
+    def test_image_item(self):
+        # pylint: disable=import-outside-toplevel
+        import pyqtgraph as pg
+        from orangecontrib.b22.visuals.components.imageplot.imageitem import ImageItem
+
+        pg.mkQApp()
+
+        index = row_col(6, 8)
+        coords = transform_row_col(index, META)
+        values = np.arange(len(coords), dtype=float)[:, None]
+
+        with patch("orangecontrib.b22.visuals.components.imageplot.imageitem.findRaster") as find:
+            item = ImageItem(coords, values, grid=grid_descriptor(META))
+            find.assert_not_called()
+
+        np.testing.assert_array_equal(item._grid_index, index)
+
+        # Without a grid (or with a wrong one) the raster is detected.
+        item = ImageItem(coords + 0.1, values, grid=grid_descriptor(META))
+        self.assertIsNone(item._grid_index)
+
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from orangecontrib.b22.io import GWYReader
+from orangecontrib.b22.io.gwyddion import reader_gsf, read_gsf_stack
+
+
+
+
+def write_gsf(path, field, x_real=2.0, y_real=1.0, title="Z"):
+    """Write a (YRes, XRes) field as a Gwyddion Simple Field file."""
+    header = ("Gwyddion Simple Field 1.0\n"
+              f"XRes = {field.shape[1]}\n"
+              f"YRes = {field.shape[0]}\n"
+              f"XReal = {x_real}\n"
+              f"YReal = {y_real}\n"
+              f"Title = {title}\n").encode("utf-8")
+
+    with open(path, "wb") as f:
+        f.write(header)
+        f.write(b"\x00" * (4 - len(header) % 4))
+        f.write(np.asarray(field, dtype="<f4").tobytes())
+
+
+
+
+class TestGWYReader(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "scan.gsf")
+        self.field = np.arange(20, dtype=np.float32).reshape(4, 5)
+        write_gsf(self.path, self.field)
+
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+
+    def test_reader_gsf(self):
+        X, XRr, YRr, meta = reader_gsf(self.path)
+
+        self.assertIsInstance(X, np.memmap)
+        self.assertEqual(X.dtype, np.float32)
+        np.testing.assert_array_equal(X[:, :, 0], self.field)
+        np.testing.assert_array_equal(XRr, np.arange(5))
+        np.testing.assert_array_equal(YRr, np.arange(4))
+        self.assertEqual((meta["XRes"], meta["YRes"], meta["Title"]), (5, 4, "Z"))
+
+
+    def test_reader_gsf_region(self):
+        X, XRr, YRr, _ = reader_gsf(self.path, region=(1, 2, 4, 4))
+
+        np.testing.assert_array_equal(X[:, :, 0], self.field[2:4, 1:4])
+        np.testing.assert_array_equal(XRr, [1, 2, 3])
+        np.testing.assert_array_equal(YRr, [2, 3])
+
+        with self.assertRaises(ValueError):
+            reader_gsf(self.path, region=(0, 0, 6, 4))
+
+
+    def test_read_spectra(self):
+        wavenumbers, X, meta = GWYReader(self.path).read_spectra()
+
+        self.assertEqual(X.dtype, np.float32)
+        np.testing.assert_array_equal(X[:, 0], self.field.ravel())
+        self.assertEqual(len(meta), 20)
+
+
+    def test_iter_chunks(self):
+        wavenumbers, X, meta = GWYReader(self.path).read_spectra()
+
+        for rows, n_chunks in [(10, 2), (7, 4), (3, 8), (1000, 1)]:
+            chunks = list(GWYReader(self.path).iter_chunks(rows=rows))
+
+            self.assertEqual(len(chunks), n_chunks)
+            self.assertTrue(all(len(chunk[1]) <= rows for chunk in chunks))
+            np.testing.assert_array_equal(chunks[0][0], wavenumbers)
+            np.testing.assert_array_equal(np.vstack([chunk[1] for chunk in chunks]), X)
+            np.testing.assert_array_equal(np.vstack([chunk[2].metas for chunk in chunks]),
+                                          meta.metas)
+            self.assertEqual(chunks[0][2].attributes["Grid"], meta.attributes["Grid"])
+
+
+    def test_read_spectra_region(self):
+        full = GWYReader(self.path).read_spectra()[2].metas
+
+        reader = GWYReader(self.path)
+        reader.region = (1, 2, 4, 4)
+        _, X, meta = reader.read_spectra()
+
+        np.testing.assert_array_equal(X[:, 0], self.field[2:4, 1:4].ravel())
+
+        # Positions are those of the same pixels in the full scan.
+        index = (np.arange(2, 4)[:, None] * 5 + np.arange(1, 4)).ravel()
+        np.testing.assert_allclose(meta.metas.astype(float), full[index].astype(float))
+
+
+    def test_read_gsf_stack(self):
+        write_gsf(os.path.join(self.tmp.name, "scan O2A.gsf"), 2 * self.field, title="O2A")
+
+        X, XRr, YRr, metas, paths = read_gsf_stack(self.tmp.name)
+
+        self.assertEqual(X.shape, (4, 5, 2))
+        np.testing.assert_array_equal(X[:, :, 0], 2 * self.field)
+        np.testing.assert_array_equal(X[:, :, 1], self.field)
+        self.assertEqual([m["Title"] for m in metas], ["O2A", "Z"])
+
+
+    def test_read_gsf_stack_mismatch(self):
+        write_gsf(os.path.join(self.tmp.name, "other.gsf"), self.field, x_real=3.0)
+
+        with self.assertRaises(ValueError):
+            read_gsf_stack(self.tmp.name)
+
+
+    def test_read_stack_sheet(self):
+        write_gsf(os.path.join(self.tmp.name, "scan O2A.gsf"), 2 * self.field, title="O2A")
+
+        reader = GWYReader(self.path)
+        self.assertEqual(reader.sheets, [GWYReader.SINGLE, GWYReader.STACK])
+
+        reader.select_sheet(GWYReader.STACK)
+        table = reader.read()
+
+        self.assertEqual([a.name for a in table.domain.attributes], ["O2A", "Z"])
+        np.testing.assert_array_equal(table.X[:, 1], self.field.ravel())
+
+        single = GWYReader(self.path).read()
+        np.testing.assert_allclose(table.metas.astype(float), single.metas.astype(float))
+
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,503 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from orangecontrib.b22.io import Nea2Reader
+from orangecontrib.b22.io.utils import loadtxt_chunked, loadtxt_parallel
+
+
+
+
+HEADER = [
+    "# www.neaspec.com",
+    "# Scan:\tSynthetic",
+    "# Project:\tTests",
+    "# Scanner Center Position (X, Y):\t[µm]\t10.0\t20.0",
+    "# Rotation:\t[°]\t0.0",
+    "# Scan Area (X, Y, Z):\t[µm]\t3.0\t2.0\t0.0",
+    "# Pixel Area (X, Y, Z):\t[px]\t3\t2\t4",
+]
+
+
+def write_nea_v1(path, rows=2, cols=2, runs=2, harmonics=2, points=8, power=1):
+    """Write a synthetic legacy NeaSPEC export with a linear mirror axis.
+
+    The amplitudes are 2 * mirror ** power + n for harmonic n.
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("Row\tColumn\tRun\tChannel\t"
+                + "\t".join(str(i) for i in range(points)) + "\n")
+
+        for row in range(rows):
+            for col in range(cols):
+                for run in range(runs):
+                    mirror = np.linspace(run, 10 + run, points)[::1 - 2 * (run % 2)]
+                    lines = [("M", mirror)]
+
+                    for n in range(harmonics):
+                        lines.append((f"O{n}A", 2 * mirror ** power + n))
+                        lines.append((f"O{n}P", mirror - n))
+
+                    for name, values in lines:
+                        f.write(f"{row}\t{col}\t{run}\t{name}\t"
+                                + "\t".join(f"{v:g}" for v in values) + "\n")
+
+
+def write_nea_v2(path, rows=2, cols=3, points=4, channels=("O1A", "O1P", "O2A"),
+                 runs=1, interferogram=False):
+    """Write a synthetic NeaSPEC v2 export and return its numeric body."""
+    axis = "Depth" if interferogram else "Omega"
+
+    if interferogram:
+        columns = ["Row", "Column", "Run", "Depth"]
+    else:
+        columns = ["Row", "Column", "Omega", "Wavenumber"]
+
+    body = []
+
+    for row in range(rows):
+        for col in range(cols):
+            for run in range(runs):
+                for i in range(points):
+                    values = [row * 100 + col * 10 + run + k + i / 10
+                              for k in range(len(channels))]
+
+                    if interferogram:
+                        body.append([row, col, run, i] + values)
+                    else:
+                        body.append([row, col, i, 1000.0 + i] + values)
+
+    body = np.array(body, dtype=float)
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(HEADER) + "\n")
+        f.write("\t".join(columns + list(channels)) + "\n")
+
+        for line in body:
+            f.write("\t".join(f"{v:g}" for v in line) + "\t\n")
+
+    return body
+
+
+
+
+class TestLoadtxtChunked(unittest.TestCase):
+    def test_matches_loadtxt(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "body.txt")
+            expected = np.arange(70.0).reshape(10, 7)
+            np.savetxt(path, expected, delimiter="\t")
+
+            for chunk_size in [1, 3, 10, 100]:
+                with open(path, "r") as f:
+                    actual = loadtxt_chunked(f, 7, chunk_size=chunk_size)
+
+                np.testing.assert_array_equal(actual, expected)
+
+
+    def test_wrong_columns(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "body.txt")
+            np.savetxt(path, np.zeros((3, 4)))
+
+            with open(path, "r") as f:
+                with self.assertRaises(ValueError):
+                    loadtxt_chunked(f, 5)
+
+
+    def test_usecols_where(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "body.txt")
+            body = np.arange(70.0).reshape(10, 7)
+            np.savetxt(path, body)
+
+            with open(path, "r") as f:
+                actual = loadtxt_chunked(f, 2, chunk_size=3, usecols=[0, 5],
+                                         where=lambda block: block[:, 0] % 14 == 0)
+
+            np.testing.assert_array_equal(actual, body[::2][:, [0, 5]])
+
+
+
+
+def every_other_row(block):
+    return block[:, 0] % 12 == 0
+
+
+def second_half(block):
+    return block[:, 0] >= 1500
+
+
+class TestLoadtxtParallel(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "body.txt")
+        self.body = np.arange(3000.0).reshape(500, 6)
+
+        with open(self.path, "w") as f:
+            f.write("# header\nA\tB\n")
+            self.offset = f.tell()
+            np.savetxt(f, self.body, delimiter="\t", fmt="%g")
+
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+
+    def test_matches_serial(self):
+        for range_bytes in [100, 1000, 10**6]:
+            actual = loadtxt_parallel(self.path, self.offset, 6, max_workers=3,
+                                      range_bytes=range_bytes)
+            np.testing.assert_array_equal(actual, self.body)
+
+
+    def test_usecols_where(self):
+        actual = loadtxt_parallel(self.path, self.offset, 2, max_workers=2, range_bytes=500,
+                                  usecols=[0, 3], where=every_other_row, dtype=np.float32)
+
+        self.assertEqual(actual.dtype, np.float32)
+        np.testing.assert_array_equal(actual, self.body[::2][:, [0, 3]])
+
+
+    def test_grows(self):
+        # The first range keeps no rows, so the array is sized by growing.
+        actual = loadtxt_parallel(self.path, self.offset, 6, max_workers=2, range_bytes=200,
+                                  where=second_half)
+        np.testing.assert_array_equal(actual, self.body[250:])
+        self.assertTrue(actual.flags["C_CONTIGUOUS"])
+
+
+    def test_no_trailing_newline(self):
+        with open(self.path, "rb+") as f:
+            f.truncate(os.path.getsize(self.path) - 1)
+
+        actual = loadtxt_parallel(self.path, self.offset, 6, max_workers=2, range_bytes=200)
+        np.testing.assert_array_equal(actual, self.body)
+
+
+    def test_single_worker(self):
+        with patch("os.cpu_count", return_value=1), \
+                patch("orangecontrib.b22.io.utils.utils.ProcessPoolExecutor") as pool:
+            actual = loadtxt_parallel(self.path, self.offset, 6, range_bytes=100)
+            pool.assert_not_called()
+
+        np.testing.assert_array_equal(actual, self.body)
+
+
+
+
+class TestNea2Reader(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+
+    def test_read_v1(self):
+        path = os.path.join(self.tmp.name, "legacy.txt")
+        write_nea_v1(path)
+
+        X, data, meta = Nea2Reader(path).read_spectra()
+
+        # Common axis is the overlap of both runs' mirror ranges.
+        np.testing.assert_allclose(X, np.linspace(1, 10, 8))
+        self.assertEqual(data.shape, (2 * 2 * 4, 8))
+        self.assertEqual(list(meta.metas[:4, 2]), ["O0A", "O1A", "O0P", "O1P"])
+
+        # Channels are linear in the mirror position, so they are exactly
+        # recovered on the common axis.
+        np.testing.assert_allclose(data[1], 2 * X + 1, atol=1e-4)
+        np.testing.assert_allclose(data[3], X - 1, atol=1e-4)
+
+
+    def test_read_v1_missing_run(self):
+        path = os.path.join(self.tmp.name, "legacy.txt")
+        write_nea_v1(path, rows=8, cols=8, runs=3, points=32, power=2)
+
+        # Pixel (0, 0) lacks run 2.
+        with open(path, encoding="utf-8") as f:
+            lines = f.readlines()
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(line for line in lines if not line.startswith("0\t0\t2\t"))
+
+        X, data, meta = Nea2Reader(path).read_spectra()
+
+        others = (meta.metas[:, 0] != 0) | (meta.metas[:, 1] != 0)
+        self.assertFalse(np.isnan(data[others]).any())
+
+        # The mirror positions of each run, as written.
+        for i in np.flatnonzero(others):
+            n = int(meta.metas[i, 2][1])
+            expected = []
+            for run in range(3):
+                mirror = np.linspace(run, 10 + run, 32)
+                values = 2 * mirror ** 2 + n if meta.metas[i, 2][2] == "A" else mirror - n
+                expected.append(np.interp(X, mirror, values))
+            np.testing.assert_allclose(data[i], np.mean(expected, axis=0), rtol=1e-4)
+
+
+    def test_interp_rows(self):
+        rng = np.random.default_rng(0)
+        xp = np.sort(rng.uniform(0, 100, (200, 30)), axis=1)
+        xp[:, [0, -1]] = 0, 100
+        fp = rng.normal(size=(200, 2, 30))
+        xp[rng.choice(200, 20, replace=False)] = np.nan
+        x = np.linspace(10, 90, 50)
+
+        actual = Nea2Reader._interp_rows(xp, fp, x)
+
+        for i in range(len(xp)):
+            if np.isnan(xp[i]).all():
+                continue
+            for j in range(2):
+                np.testing.assert_allclose(actual[i, j], np.interp(x, xp[i], fp[i, j]))
+
+
+    def test_read_v2_wavenumbers(self):
+        path = os.path.join(self.tmp.name, "map.txt")
+        body = write_nea_v2(path)
+
+        wavenumbers, X, meta = Nea2Reader(path).read_spectra()
+
+        np.testing.assert_array_equal(wavenumbers, [1000, 1001, 1002, 1003])
+        self.assertEqual(X.shape, (2 * 3 * 3, 4))
+
+        # Pixel (row 1, col 2), channel 'O1P'.
+        j = 1 * 3 + 2
+        np.testing.assert_array_equal(X[3 * j + 1], body[4 * j:4 * (j + 1), 5])
+
+        self.assertEqual(meta.domain.metas[2].values, ("O1A", "O1P", "O2A"))
+        np.testing.assert_array_equal(meta.metas[:3, 2], [0, 1, 2])
+        self.assertEqual(meta.attributes["Project"], "Tests")
+
+
+    def test_read_v2_interferograms(self):
+        path = os.path.join(self.tmp.name, "ifg.txt")
+        body = write_nea_v2(path, runs=2, interferogram=True)
+
+        depth, X, meta = Nea2Reader(path).read_spectra()
+
+        np.testing.assert_array_equal(depth, [0, 1, 2, 3])
+        self.assertEqual(X.shape, (2 * 3 * 2 * 3, 4))
+        self.assertEqual([m.name for m in meta.domain.metas],
+                         ["map_x", "map_y", "run", "channel"])
+
+        # Pixel (row 0, col 1), run 1, channel 'O2A'.
+        j = 1 * 2 + 1
+        np.testing.assert_array_equal(X[3 * j + 2], body[4 * j:4 * (j + 1), 6])
+        np.testing.assert_array_equal(meta.metas[3 * j:3 * (j + 1), 2], [1, 1, 1])
+
+
+    def test_read_v1_selection(self):
+        path = os.path.join(self.tmp.name, "legacy.txt")
+        write_nea_v1(path)
+
+        full_X, full, _ = Nea2Reader(path).read_spectra()
+
+        reader = Nea2Reader(path)
+        reader.channels = ["O1P", "O1A"]
+        X, data, meta = reader.read_spectra()
+
+        np.testing.assert_array_equal(X, full_X)
+        self.assertEqual(list(meta.metas[:, 2]), ["O1A", "O1P"] * 4)
+        np.testing.assert_allclose(data, full.reshape(4, 4, -1)[:, [1, 3]].reshape(8, -1))
+
+        reader.runs = [1]
+        X, data, _ = reader.read_spectra()
+        np.testing.assert_allclose(X, np.linspace(1, 11, 8))
+        np.testing.assert_allclose(data[1], X - 1, atol=1e-4)
+
+        reader.channels = ["O3A"]
+        with self.assertRaises(ValueError):
+            reader.read_spectra()
+
+
+    def test_read_v2_channels(self):
+        path = os.path.join(self.tmp.name, "map.txt")
+        body = write_nea_v2(path)
+
+        reader = Nea2Reader(path)
+        reader.channels = ["O2A", "O1A"]
+        _, X, meta = reader.read_spectra()
+
+        self.assertEqual(X.shape, (2 * 3 * 2, 4))
+        self.assertEqual(meta.domain.metas[2].values, ("O2A", "O1A"))
+        np.testing.assert_array_equal(X[0], body[:4, 6])
+        np.testing.assert_array_equal(X[1], body[:4, 4])
+
+        reader.channels = ["O5A"]
+        with self.assertRaises(ValueError):
+            reader.read_spectra()
+
+
+    def test_read_v2_runs(self):
+        path = os.path.join(self.tmp.name, "ifg.txt")
+        body = write_nea_v2(path, runs=3, interferogram=True)
+
+        reader = Nea2Reader(path)
+        reader.runs = [2]
+        _, X, meta = reader.read_spectra()
+
+        self.assertEqual(X.shape, (2 * 3 * 3, 4))
+        np.testing.assert_array_equal(meta.metas[:, 2], 2)
+        np.testing.assert_array_equal(X[0], body[8:12, 4])
+
+
+    def test_channel_sheets(self):
+        path = os.path.join(self.tmp.name, "map.txt")
+        body = write_nea_v2(path)
+
+        reader = Nea2Reader(path)
+        self.assertEqual(reader.sheets, [Nea2Reader.ALL_CHANNELS, "O1A, O1P",
+                                         "O1A", "O1P", "O2A"])
+
+        reader.select_sheet("O1A, O1P")
+        table = reader.read()
+        self.assertEqual(table.domain.metas[2].values, ("O1A", "O1P"))
+        np.testing.assert_array_equal(table.X[1], body[:4, 5])
+
+
+    @patch("orangecontrib.b22.io.utils.utils.RANGE_BYTES", 64)
+    def test_read_v2_processes(self):
+        path = os.path.join(self.tmp.name, "ifg.txt")
+        write_nea_v2(path, runs=3, interferogram=True)
+
+        expected = Nea2Reader(path).read_spectra()
+
+        reader = Nea2Reader(path)
+        reader.processes = 2
+        actual = reader.read_spectra()
+
+        np.testing.assert_array_equal(actual[1], expected[1])
+        np.testing.assert_array_equal(actual[2].metas, expected[2].metas)
+
+        serial = Nea2Reader(path)
+        serial.runs = reader.runs = [1]
+        np.testing.assert_array_equal(reader.read_spectra()[1], serial.read_spectra()[1])
+
+
+    def test_follower(self):
+        path = os.path.join(self.tmp.name, "live.txt")
+        write_nea_v2(path, runs=2, interferogram=True)
+
+        with open(path, "rb") as f:
+            data = f.read()
+
+        expected = Nea2Reader(path).read()
+
+        reader = Nea2Reader(path)
+        reader.channels = ["O1P"]
+        selected = reader.read()
+        follower = reader.follower()
+
+        tables = []
+        # Grow the file in steps that end mid-header, mid-line and mid-block.
+        for end in [20, len(data) // 3, len(data) // 3 + 7, len(data) - 5, len(data)]:
+            with open(path, "wb") as f:
+                f.write(data[:end])
+
+            table = follower.update()
+            if table is not None:
+                tables.append((table, table.X.copy()))
+
+        self.assertGreater(len(tables), 1)
+        self.assertIsNone(follower.update())
+
+        # Every update returns all pixels read so far; earlier tables
+        # are not changed by later updates.
+        for (earlier, X), (later, _) in zip(tables, tables[1:]):
+            self.assertLess(len(earlier), len(later))
+            np.testing.assert_array_equal(earlier.X, X)
+            np.testing.assert_array_equal(later.X[:len(earlier)], X)
+
+        table = follower.data
+        self.assertIs(table, tables[-1][0])
+        self.assertEqual(table.domain, selected.domain)
+        np.testing.assert_array_equal(table.X, selected.X)
+        np.testing.assert_array_equal(table.metas, selected.metas)
+        self.assertEqual(len(selected), len(expected) // 3)
+
+
+    def test_follower_single_pixel(self):
+        path = os.path.join(self.tmp.name, "live.txt")
+        write_nea_v2(path, rows=1, cols=1)
+
+        with open(path, "rb") as f:
+            data = f.read()
+
+        follower = Nea2Reader(path).follower()
+
+        # All but the last line of the only pixel.
+        with open(path, "wb") as f:
+            f.write(data[:data.rstrip(b"\n").rfind(b"\n") + 1])
+        self.assertIsNone(follower.update())
+
+        with open(path, "wb") as f:
+            f.write(data)
+        table = follower.update()
+
+        self.assertIsNotNone(table)
+        np.testing.assert_array_equal(table.X, Nea2Reader(path).read().X)
+        self.assertEqual(len(table), 3)
+
+
+    def assert_chunks(self, reader, rows):
+        wavenumbers, X, meta = reader.read_spectra()
+        chunks = list(reader.iter_chunks(rows=rows))
+
+        self.assertTrue(all(len(chunk[1]) <= rows for chunk in chunks))
+        self.assertEqual({chunk[2].domain for chunk in chunks}, {meta.domain})
+
+        for chunk_wavenumbers, _, _ in chunks:
+            np.testing.assert_array_equal(chunk_wavenumbers, wavenumbers)
+
+        np.testing.assert_allclose(np.vstack([chunk[1] for chunk in chunks]), X)
+        np.testing.assert_array_equal(np.vstack([chunk[2].metas for chunk in chunks]),
+                                      meta.metas)
+
+        return chunks
+
+
+    def test_iter_chunks(self):
+        write_nea_v1(os.path.join(self.tmp.name, "legacy.txt"), runs=3)
+        write_nea_v2(os.path.join(self.tmp.name, "map.txt"))
+        write_nea_v2(os.path.join(self.tmp.name, "ifg.txt"), runs=2, interferogram=True)
+
+        # Batches of a few lines, which split the pixels.
+        with patch("orangecontrib.b22.io.neaspec.CHUNK_LINES", 5):
+            for name in ["legacy.txt", "map.txt", "ifg.txt"]:
+                reader = Nea2Reader(os.path.join(self.tmp.name, name))
+
+                self.assertGreater(len(self.assert_chunks(reader, 4)), 2)
+                self.assertEqual(len(self.assert_chunks(reader, 1000)), 1)
+
+            reader = Nea2Reader(os.path.join(self.tmp.name, "legacy.txt"))
+            reader.runs = [1, 2]
+            reader.channels = ["O1A"]
+            self.assert_chunks(reader, 3)
+
+            reader = Nea2Reader(os.path.join(self.tmp.name, "ifg.txt"))
+            reader.runs = [1]
+            self.assert_chunks(reader, 5)
+
+
+    def test_read_v2_incomplete_block(self):
+        path = os.path.join(self.tmp.name, "map.txt")
+        write_nea_v2(path)
+
+        with open(path, "a") as f:
+            f.write("1\t3\t0\t1000\t0\t0\t0\n")
+
+        with self.assertRaises(ValueError):
+            Nea2Reader(path).read_spectra()
+
+
+
+
+if __name__ == "__main__":
+    unittest.main()
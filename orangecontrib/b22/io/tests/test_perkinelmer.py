@@ -0,0 +1,282 @@
+import os
+import struct
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from orangecontrib.b22.io import PerkinElmerReader
+from orangecontrib.b22.io.perkinelmer import PerkinElmer, read_sp_batch
+
+
+
+
+def block(block_id, payload):
+    return struct.pack("<Hi", block_id, len(payload)) + payload
+
+
+def payload5104(values):
+    """Encode a list of str/int values as the tagged 5104 block."""
+    data = b""
+
+    for value in values:
+        data += b"\x01"  # padding between entries, skipped by the scanner
+
+        if isinstance(value, str):
+            encoded = value.encode("utf-8")
+            data += b"#u" + struct.pack("<h", len(encoded)) + encoded + b"\x00" * 6
+        elif value >= 0:
+            data += b"$u" + struct.pack("<h", value) + b"\x00" * 6
+        else:
+            data += b",u" + struct.pack("<h", value)
+
+    return data + b"\x00\x00"
+
+
+META_VALUES = ["analyst", 1, "2024-01-02", -2, "image", "model", "serial", "software",
+               8, 16, 10, "detector", "source", "splitter", 14, "apodization"]
+
+
+def write_sp(path, spectrum, min_w=4000.0, max_w=400.0):
+    body = block(122, payload5104(META_VALUES))
+    body = block(121, body)
+
+    body += block(25739, struct.pack("<HH", 29987, 4) + b"C:/x")
+    body += block(35698, struct.pack("<Hdd", 29981, min_w, max_w))
+    body += block(35699, struct.pack("<Hdd", 29981, np.min(spectrum), np.max(spectrum)))
+    body += block(35700, struct.pack("<Hd", 29979, (max_w - min_w) / (len(spectrum) - 1)))
+    body += block(35701, struct.pack("<HI", 29995, len(spectrum)))
+    body += block(35708, struct.pack("<HI", 29974, 8 * len(spectrum))
+                  + np.asarray(spectrum, dtype="<f8").tobytes())
+
+    with open(path, "wb") as f:
+        f.write(b"PEPE" + b"spectrum".ljust(40, b" "))
+        f.write(block(120, body))
+
+
+def write_fsm(path, n_x=3, n_y=2, n_z=5, z_start=4000.0, z_delta=-2.0):
+    """Write a synthetic FSM image, returning its (n_x * n_y, n_z) spectra."""
+    z_end = z_start + z_delta * (n_z - 1)
+    name = b"map"
+
+    header = struct.pack("<ddddddddddiiihBhBhBhB",
+                         1.5, 2.5, z_delta, z_start, z_end, 0, 0, 10.0, 20.0, 0,
+                         n_x, n_y, n_z, 0, 1, 0, 2, 4, 3, 5, 6)
+    spectra = np.arange(n_x * n_y * n_z, dtype=np.float32).reshape(n_x * n_y, n_z)
+
+    with open(path, "wb") as f:
+        f.write(b"PEFE" + b"image".ljust(40, b" "))
+        f.write(block(5100, struct.pack("<h", len(name)) + name + header))
+        f.write(block(5104, payload5104(META_VALUES)))
+
+        for spectrum in spectra:
+            f.write(block(5105, spectrum.astype("<f4").tobytes()))
+
+    return spectra
+
+
+
+
+class TestPerkinElmer(unittest.TestCase):
+    def test_decode5104(self):
+        meta = PerkinElmer.decode5104(payload5104(META_VALUES))
+
+        self.assertEqual(meta["analyst"], "analyst")
+        self.assertEqual(meta["date"], "2024-01-02")
+        self.assertEqual(meta["image_name"], "image")
+        self.assertEqual(meta["accumulations"], 16)
+        self.assertEqual(meta["detector"], "detector")
+        self.assertEqual(meta["apodization"], "apodization")
+        self.assertIsNone(meta["ir_laser_wave_number_unit"])
+
+
+    def test_decode5104_tag_in_string(self):
+        # A tag inside a string value is skipped along with the string.
+        meta = PerkinElmer.decode5104(payload5104(["a#u$u", 3, "b"]))
+        self.assertEqual((meta["analyst"], meta["date"]), ("a#u$u", "b"))
+
+
+
+
+class TestPerkinElmerReader(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+
+    def test_read_sp(self):
+        path = os.path.join(self.tmp.name, "point.sp")
+        spectrum = np.linspace(0, 1, 11)
+        write_sp(path, spectrum)
+
+        wavenumbers, X, meta = PerkinElmerReader(path).read_spectra()
+
+        np.testing.assert_allclose(wavenumbers, np.linspace(4000, 400, 11))
+        np.testing.assert_array_equal(X, spectrum[None, :])
+        self.assertEqual(meta.attributes["signature"], "PEPE")
+        self.assertEqual(meta.attributes["analyst"], "analyst")
+        self.assertEqual(meta.attributes["file_path"], "C:/x")
+        self.assertEqual(meta.attributes["n_points"], 11)
+
+
+    def test_read_fsm(self):
+        path = os.path.join(self.tmp.name, "image.fsm")
+        spectra = write_fsm(path)
+
+        wavenumbers, X, meta = PerkinElmerReader(path).read_spectra()
+
+        np.testing.assert_allclose(wavenumbers, [4000, 3998, 3996, 3994, 3992])
+        np.testing.assert_array_equal(X, spectra)
+        self.assertEqual(len(meta), 6)
+        self.assertEqual((meta.attributes["n_x"], meta.attributes["n_y"]), (3, 2))
+        self.assertEqual(meta.attributes["name"], "map")
+        self.assertEqual(meta.attributes["analyst"], "analyst")
+
+
+    def test_read_fsm_strided_view(self):
+        path = os.path.join(self.tmp.name, "image.fsm")
+        write_fsm(path)
+
+        _, X, _ = PerkinElmerReader(path).read_spectra()
+
+        self.assertEqual(X.dtype, np.float32)
+        self.assertFalse(X.flags["OWNDATA"])
+        self.assertEqual(X.strides[0], 6 + 4 * 5)
+
+
+    def test_read_fsm_irregular(self):
+        path = os.path.join(self.tmp.name, "image.fsm")
+        spectra = write_fsm(path)
+
+        # An extra block breaks the regular layout.
+        with open(path, "ab") as f:
+            f.write(block(5106, b"\x00" * 3))
+
+        _, X, _ = PerkinElmerReader(path).read_spectra()
+        np.testing.assert_array_equal(X, spectra)
+
+
+    def test_read_fsm_positions(self):
+        path = os.path.join(self.tmp.name, "image.fsm")
+        write_fsm(path)
+
+        _, _, meta = PerkinElmerReader(path).read_spectra()
+
+        np.testing.assert_allclose(meta.get_column("map_x"), [10, 11.5, 13] * 2)
+        np.testing.assert_allclose(meta.get_column("map_y"), [20] * 3 + [22.5] * 3)
+
+
+    def test_read_fsm_selection(self):
+        path = os.path.join(self.tmp.name, "image.fsm")
+        spectra = write_fsm(path, n_x=5, n_y=4, n_z=6)
+        image = spectra.reshape(4, 5, 6)
+
+        reader = PerkinElmerReader(path)
+        reader.region = (1, 1, 5, 4)
+        reader.stride = 2
+        reader.wavenumber_range = (3994, 3998)
+        wavenumbers, X, meta = reader.read_spectra()
+
+        np.testing.assert_allclose(wavenumbers, [3998, 3996, 3994])
+        np.testing.assert_array_equal(X, image[1:4:2, 1:5:2, 1:4].reshape(-1, 3))
+        np.testing.assert_allclose(meta.get_column("map_x"), [11.5, 14.5] * 2)
+        np.testing.assert_allclose(meta.get_column("map_y"), [22.5] * 2 + [27.5] * 2)
+
+        reader.region = (0, 0, 6, 4)
+        with self.assertRaises(ValueError):
+            reader.read_spectra()
+
+
+    def test_read_fsm_sheets(self):
+        path = os.path.join(self.tmp.name, "image.fsm")
+        spectra = write_fsm(path, n_x=4, n_y=4)
+
+        reader = PerkinElmerReader(path)
+        self.assertEqual(reader.sheets, list(PerkinElmerReader.FSM_SHEETS))
+
+        reader.select_sheet("Preview (every 2nd pixel)")
+        table = reader.read()
+        np.testing.assert_array_equal(table.X, spectra.reshape(4, 4, -1)[::2, ::2].reshape(4, -1))
+
+        # Sheets of wavenumber ranges.
+        path = os.path.join(self.tmp.name, "fingerprint.fsm")
+        spectra = write_fsm(path, z_start=1790.0, z_delta=5.0)
+        reader = PerkinElmerReader(path)
+        reader.select_sheet("Fingerprint region (900-1800 cm-1)")
+        self.assertEqual(reader.cache_options()["wavenumber_range"], (900, 1800))
+        wavenumbers, X, _ = reader.read_spectra()
+        np.testing.assert_allclose(wavenumbers, [1790, 1795, 1800])
+        np.testing.assert_array_equal(X, spectra[:, :3])
+
+        sp = os.path.join(self.tmp.name, "point.sp")
+        write_sp(sp, np.linspace(0, 1, 11))
+        self.assertEqual(PerkinElmerReader(sp).sheets,
+                         [PerkinElmerReader.SP_SINGLE, PerkinElmerReader.SP_FOLDER])
+
+
+    def test_read_sp_batch(self):
+        spectra = np.random.RandomState(0).rand(5, 11)
+        for i, spectrum in enumerate(spectra):
+            write_sp(os.path.join(self.tmp.name, f"point{i}.sp"), spectrum)
+
+        for max_workers in [1, 2]:
+            wavenumbers, X, meta = read_sp_batch(self.tmp.name, max_workers=max_workers)
+
+            np.testing.assert_allclose(wavenumbers, np.linspace(4000, 400, 11))
+            np.testing.assert_array_equal(X, spectra)
+            self.assertEqual(list(meta.get_column("filename")),
+                             [f"point{i}.sp" for i in range(5)])
+            self.assertEqual(list(meta.get_column("analyst")), ["analyst"] * 5)
+            np.testing.assert_array_equal(meta.get_column("accumulations"), [16] * 5)
+
+        reader = PerkinElmerReader(os.path.join(self.tmp.name, "point0.sp"))
+        reader.select_sheet(PerkinElmerReader.SP_FOLDER)
+        np.testing.assert_array_equal(reader.read().X, spectra)
+
+        # With a single CPU the files are read without a process pool.
+        with patch("os.cpu_count", return_value=1), \
+                patch("orangecontrib.b22.io.perkinelmer.ProcessPoolExecutor") as pool:
+            np.testing.assert_array_equal(read_sp_batch(self.tmp.name)[1], spectra)
+            pool.assert_not_called()
+
+
+    def test_iter_chunks(self):
+        path = os.path.join(self.tmp.name, "image.fsm")
+        write_fsm(path, n_x=4, n_y=3)
+
+        for sp in range(5):
+            write_sp(os.path.join(self.tmp.name, f"point{sp}.sp"), np.random.RandomState(sp).rand(11))
+
+        folder = PerkinElmerReader(os.path.join(self.tmp.name, "point0.sp"))
+        folder.select_sheet(PerkinElmerReader.SP_FOLDER)
+
+        for reader, expected in [(PerkinElmerReader(path), PerkinElmerReader(path).read_spectra()),
+                                 (folder, read_sp_batch(self.tmp.name, max_workers=1))]:
+            wavenumbers, X, meta = expected
+            chunks = list(reader.iter_chunks(rows=2))
+
+            self.assertEqual(len(chunks), (len(X) + 1) // 2)
+            self.assertEqual({chunk[2].domain for chunk in chunks}, {meta.domain})
+            np.testing.assert_allclose(chunks[-1][0], wavenumbers)
+            np.testing.assert_array_equal(np.vstack([chunk[1] for chunk in chunks]), X)
+            # As strings, since the missing metas are nan.
+            np.testing.assert_array_equal(np.vstack([chunk[2].metas for chunk in chunks]).astype(str),
+                                          meta.metas.astype(str))
+
+
+    def test_read_sp_batch_mismatch(self):
+        write_sp(os.path.join(self.tmp.name, "a.sp"), np.linspace(0, 1, 11))
+        write_sp(os.path.join(self.tmp.name, "b.sp"), np.linspace(0, 1, 11), max_w=500)
+
+        with self.assertRaises(ValueError):
+            read_sp_batch(self.tmp.name, max_workers=1)
+
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from orangecontrib.b22.io import PerkinElmerReader
+from orangecontrib.b22.io.scan import read_header, scan_metadata
+from orangecontrib.b22.io.tests.test_gwyddion import write_gsf
+from orangecontrib.b22.io.tests.test_neaspec import write_nea_v2, write_nea_v1
+from orangecontrib.b22.io.tests.test_perkinelmer import write_fsm, write_sp
+
+
+
+
+class TestReadHeader(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+
+    def test_nea(self):
+        write_nea_v2(self.path("map.txt"))
+
+        with patch("orangecontrib.b22.io.neaspec.loadtxt_chunked") as loadtxt:
+            meta = read_header(self.path("map.txt"))
+            loadtxt.assert_not_called()
+
+        self.assertEqual(meta["Project"], "Tests")
+        self.assertEqual(meta["Real Area"]["X"], 3.0)
+        self.assertEqual(meta["Channels"], ["O1A", "O1P", "O2A"])
+
+        write_nea_v1(self.path("legacy.txt"))
+        self.assertEqual(read_header(self.path("legacy.txt")), {})
+
+
+    def test_gsf(self):
+        write_gsf(self.path("scan.gsf"), np.zeros((4, 5)), title="O2A")
+
+        meta = read_header(self.path("scan.gsf"))
+        self.assertEqual((meta["XRes"], meta["YRes"], meta["Title"]), (5, 4, "O2A"))
+
+
+    def test_perkinelmer(self):
+        write_fsm(self.path("image.fsm"))
+        write_sp(self.path("point.sp"), np.linspace(0, 1, 11))
+
+        with patch.object(PerkinElmerReader, "fsm_spectra") as fsm_spectra:
+            meta = read_header(self.path("image.fsm"))
+            fsm_spectra.assert_not_called()
+
+        self.assertEqual((meta["n_x"], meta["n_y"], meta["name"]), (3, 2, "map"))
+
+        meta = read_header(self.path("point.sp"))
+        self.assertEqual((meta["n_points"], meta["analyst"]), (11, "analyst"))
+
+
+    def test_scan_metadata(self):
+        os.mkdir(self.path("sub"))
+        write_nea_v2(self.path("map.txt"))
+        write_gsf(self.path("sub/scan.gsf"), np.zeros((4, 5)))
+        write_sp(self.path("point.sp"), np.linspace(0, 1, 11))
+
+        with open(self.path("notes.md"), "w") as f:
+            f.write("not data")
+
+        with open(self.path("broken.gsf"), "wb") as f:
+            f.write(b"garbage")
+
+        headers = scan_metadata(self.tmp.name)
+        self.assertEqual(sorted(headers), [self.path(name) for name in
+                                           ["broken.gsf", "map.txt", "point.sp"]])
+        self.assertIsNone(headers[self.path("broken.gsf")])
+        self.assertEqual(headers[self.path("map.txt")]["Project"], "Tests")
+
+        headers = scan_metadata(self.tmp.name, recursive=True)
+        self.assertEqual(headers[self.path("sub/scan.gsf")]["XRes"], 5)
+
+
+
+
+if __name__ == "__main__":
+    unittest.main()
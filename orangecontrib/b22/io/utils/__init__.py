@@ -1,2 +1,3 @@
 from .metaformatter import MetaFormatter, MetaKeyException
-from .utils import *
\ No newline at end of file
+from .utils import *
+from .cache import SpectraCache, spectra_cache, cached_spectra
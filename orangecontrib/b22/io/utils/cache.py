@@ -0,0 +1,231 @@
+import functools
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+
+from Orange.misc.environ import cache_dir
+
+
+
+
+class SpectraCache:
+    """An on-disk cache of parsed spectral files.
+
+    Each entry stores the (wavenumbers, X, meta table) triplet returned
+    by 'read_spectra' in its own directory; the arrays are saved as
+    '.npy' files and opened memory-mapped on a hit. Entries are keyed by
+    the reader, its 'CACHE_VERSION', the file path, size and mtime (and
+    any reader options), so a changed file or reader is never served
+    from the cache. Once the cache grows past 'max_size' bytes, the
+    least recently used entries are removed.
+
+    The cache is disabled by default. It is enabled either by calling
+    'enable' or by setting the 'B22_SPECTRA_CACHE' environment variable
+    (to "1" for the default directory, or to a directory path).
+    """
+
+    VERSION = 1
+
+    KEY_FILE = "key.json"
+    WAVENUMBERS_FILE = "wavenumbers.npy"
+    X_FILE = "X.npy"
+    META_FILE = "meta.pkl"
+
+    def __init__(self, directory=None, max_size=8 * 1024**3, enabled=False):
+        self.directory = directory
+        self.max_size = max_size
+        self.enabled = enabled
+
+        env = os.environ.get("B22_SPECTRA_CACHE", "")
+        if env:
+            self.enabled = True
+            if env != "1":
+                self.directory = env
+
+
+    def enable(self, directory=None, max_size=None):
+        self.enabled = True
+
+        if directory is not None:
+            self.directory = directory
+
+        if max_size is not None:
+            self.max_size = max_size
+
+
+    def disable(self):
+        self.enabled = False
+
+
+    @property
+    def root(self):
+        if self.directory is None:
+            return os.path.join(cache_dir(), "b22-spectra")
+        return self.directory
+
+
+    @staticmethod
+    def key(reader, **options):
+        filename = os.path.abspath(reader.filename)
+        stat = os.stat(filename)
+
+        return {
+            "cache": SpectraCache.VERSION,
+            "reader": type(reader).__module__ + "." + type(reader).__qualname__,
+            "version": getattr(reader, "CACHE_VERSION", 0),
+            "filename": filename,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "options": {k: repr(v) for k, v in sorted(options.items())},
+        }
+
+
+    def _entry(self, key):
+        digest = hashlib.sha1(json.dumps(key, sort_keys=True).encode("utf-8"))
+        return os.path.join(self.root, digest.hexdigest())
+
+
+    def load(self, key):
+        """Return the cached triplet for 'key', or None.
+
+        Stale or unreadable entries are removed.
+        """
+        entry = self._entry(key)
+
+        if not os.path.isdir(entry):
+            return None
+
+        try:
+            with open(os.path.join(entry, SpectraCache.KEY_FILE), "r") as f:
+                if json.load(f) != key:
+                    raise ValueError("Stale cache entry.")
+
+            wavenumbers = np.load(os.path.join(entry, SpectraCache.WAVENUMBERS_FILE))
+            # Copy-on-write, so the data is only read as it is used and
+            # changes made downstream never reach the file.
+            X = np.load(os.path.join(entry, SpectraCache.X_FILE), mmap_mode="c")
+
+            with open(os.path.join(entry, SpectraCache.META_FILE), "rb") as f:
+                meta = pickle.load(f)
+
+            if X.ndim != 2 or X.shape[1] != len(wavenumbers) \
+                    or (meta is not None and len(meta) != X.shape[0]):
+                raise ValueError("Corrupt cache entry.")
+
+        except Exception:  # pylint: disable=broad-except
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+
+        # Record the access for the LRU eviction.
+        os.utime(os.path.join(entry, SpectraCache.KEY_FILE))
+
+        return wavenumbers, X, meta
+
+
+    def store(self, key, wavenumbers, X, meta):
+        os.makedirs(self.root, exist_ok=True)
+
+        entry = self._entry(key)
+        tmp = tempfile.mkdtemp(dir=self.root, prefix=".tmp-")
+
+        try:
+            np.save(os.path.join(tmp, SpectraCache.WAVENUMBERS_FILE),
+                    np.asarray(wavenumbers))
+            np.save(os.path.join(tmp, SpectraCache.X_FILE), np.asarray(X))
+
+            with open(os.path.join(tmp, SpectraCache.META_FILE), "wb") as f:
+                pickle.dump(meta, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+            # The key is written last; an entry without it is incomplete.
+            with open(os.path.join(tmp, SpectraCache.KEY_FILE), "w") as f:
+                json.dump(key, f)
+
+            shutil.rmtree(entry, ignore_errors=True)
+            os.replace(tmp, entry)
+
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+
+        self.evict()
+
+
+    def entries(self):
+        """Return (last access, size, path) for each complete entry."""
+        if not os.path.isdir(self.root):
+            return []
+
+        entries = []
+
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+
+            if name.startswith(".") or not os.path.isdir(path):
+                continue
+
+            try:
+                accessed = os.stat(os.path.join(path, SpectraCache.KEY_FILE)).st_mtime
+                size = sum(e.stat().st_size for e in os.scandir(path))
+            except OSError:
+                accessed, size = 0, 0
+
+            entries.append((accessed, size, path))
+
+        return entries
+
+
+    def evict(self):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+    def clear(self):
+        for _, _, path in self.entries():
+            shutil.rmtree(path, ignore_errors=True)
+
+
+
+
+spectra_cache = SpectraCache()
+
+
+def cached_spectra(read_spectra):
+    """Serve 'read_spectra' from 'spectra_cache' when it is enabled.
+
+    Reader options that change the parsed output should be returned by
+    the reader's 'cache_options' method, so they become part of the key.
+    """
+    @functools.wraps(read_spectra)
+    def wrapper(self):
+        if not spectra_cache.enabled:
+            return read_spectra(self)
+
+        options = getattr(self, "cache_options", dict)()
+
+        try:
+            key = SpectraCache.key(self, **options)
+        except OSError:
+            return read_spectra(self)
+
+        cached = spectra_cache.load(key)
+        if cached is not None:
+            return cached
+
+        wavenumbers, X, meta = read_spectra(self)
+        spectra_cache.store(key, wavenumbers, X, meta)
+
+        return wavenumbers, X, meta
+
+    return wrapper
@@ -169,7 +169,6 @@ class MetaFormatter:
                 raise MetaKeyException(f"MetaFormatter has no method to convert '{key}'")
 
         if callable(func):
-            print(key, values)
             return func(*values)
         
         raise MetaKeyException(f"MetaFormatter has no method to convert '{key}'")
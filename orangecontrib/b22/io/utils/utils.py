@@ -1,9 +1,35 @@
+import io
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
 import numpy as np
 
+from Orange.data import Table, Domain, ContinuousVariable
 
 
 
-def transform_row_col(row_col_coords, meta):
+
+# Number of lines tokenized at once by 'loadtxt_chunked'.
+CHUNK_LINES = 65536
+
+# Rows of spectra in each chunk yielded by the readers' 'iter_chunks'.
+CHUNK_ROWS = 10000
+
+# Bytes of text tokenized by each task of 'loadtxt_parallel'.
+RANGE_BYTES = 64 * 1024**2
+
+# The dtype of the spectra in the tables made by the readers, unless a
+# reader sets its own 'dtype'. Set with 'set_spectra_dtype' or with the
+# 'B22_SPECTRA_DTYPE' environment variable (e.g. "float32").
+_SPECTRA_DTYPE = np.dtype(os.environ.get("B22_SPECTRA_DTYPE") or np.float64)
+
+
+
+
+def _geometry(meta):
+    # The scan centre, angle (radians), real area and pixel counts.
     real_center = meta.get("Real Center", {})
     rl_center = np.array([
         real_center.get("X", 0.0),
@@ -25,15 +51,354 @@ def transform_row_col(row_col_coords, meta):
         pixel_area.get("Y", 1.0),
     ])
 
-    px_center = px_area / 2.0
+    return rl_center, theta, rl_area, px_area
 
-    rotation_matrix = np.array([
+
+def _rotation_matrix(theta):
+    return np.array([
         [np.cos(theta), -np.sin(theta)],
         [np.sin(theta),  np.cos(theta)]
     ])
 
 
+def transform_row_col(row_col_coords, meta):
+    rl_center, theta, rl_area, px_area = _geometry(meta)
+
+    px_center = px_area / 2.0
+
+    rotation_matrix = _rotation_matrix(theta)
+
+
     values = rl_area * (row_col_coords - px_center) / px_area
     values = (rotation_matrix @ values.T).T
 
     return rl_center + values
+
+
+def grid_descriptor(meta):
+    """Describe the pixel lattice that 'transform_row_col' maps onto.
+
+    The descriptor is stored in the "Grid" attribute of the readers'
+    tables, so that image code can place the pixels without detecting
+    the raster from the coordinates (see 'utils.plots.gridIndex').
+
+    Returns
+    -------
+    dict
+        The "origin" (the position of pixel (0, 0)), the "step" between
+        pixels along the scan axes, the "shape" (columns, rows) of the
+        scan and its "angle" (degrees, counterclockwise). Pixel (i, j)
+        is at origin + R(angle) @ (step * (i, j)).
+    """
+    rl_center, theta, rl_area, px_area = _geometry(meta)
+
+    step = rl_area / px_area
+    origin = rl_center - _rotation_matrix(theta) @ (rl_area / 2.0)
+
+    return {
+        "origin" : tuple(float(v) for v in origin),
+        "step"   : tuple(float(v) for v in step),
+        "shape"  : tuple(int(v) for v in px_area),
+        "angle"  : float(meta.get("Angle", {}).get("Theta", 0.0)),
+    }
+
+
+
+
+def iter_triplet(wavenumbers, X, meta, rows=CHUNK_ROWS):
+    """Yield a (wavenumbers, spectra, metas) triplet in chunks of 'rows' rows.
+
+    The spectra and the metas (a table or an array) are sliced, so chunks
+    of memory-mapped spectra are views that are only read when used.
+    """
+    for start in range(0, len(X), rows):
+        yield wavenumbers, X[start:start + rows], \
+            None if meta is None else meta[start:start + rows]
+
+
+
+
+def _remaining_bytes(f):
+    try:
+        return os.fstat(f.fileno()).st_size - f.tell()
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def loadtxt_chunked(f, n_cols=None, chunk_size=CHUNK_LINES, dtype=float,
+                    converters=None, usecols=None, where=None):
+    """Read a whitespace separated numeric body in fixed-size blocks.
+
+    Lines are read from 'f' in blocks of 'chunk_size', each block is
+    tokenized by numpy's C parser and copied straight into a
+    preallocated output array. The output is sized from the average
+    line length of the first block, so the peak memory stays close to
+    the size of the returned array (instead of the several copies made
+    by a single 'np.loadtxt' call over the whole file).
+
+    Parameters
+    ----------
+    f : file
+        An open text file, positioned at the first line of the body.
+    n_cols : int | None
+        The number of values on each line. If None, it is taken from
+        the first line.
+    chunk_size : int
+        The number of lines tokenized at once.
+    dtype : type
+        The dtype of the returned array.
+    converters : dict | None
+        Converters for individual columns, passed to 'np.loadtxt'.
+    usecols : sequence | None
+        The columns to read, passed to 'np.loadtxt'; the others are
+        never converted or stored.
+    where : callable | None
+        A function that takes a block of (read) columns and returns a
+        mask of the rows to keep.
+
+    Returns
+    -------
+    np.ndarray
+        An (n, n_cols) array of the values in the body (or in 'usecols').
+    """
+    remaining = _remaining_bytes(f)
+
+    out = None
+    n = 0
+
+    while True:
+        lines = list(itertools.islice(f, chunk_size))
+
+        if not lines:
+            break
+
+        block = np.loadtxt(lines, dtype=dtype, ndmin=2, converters=converters,
+                           usecols=usecols)
+
+        if where is not None:
+            block = block[where(block)]
+
+        if block.shape[0] == 0:
+            continue
+
+        if n_cols is None:
+            n_cols = block.shape[1]
+
+        if block.shape[1] != n_cols:
+            raise ValueError(f"Expected {n_cols} columns, but got {block.shape[1]}.")
+
+        if out is None:
+            capacity = block.shape[0]
+
+            if remaining is not None and len(lines) == chunk_size:
+                line_size = sum(len(line) for line in lines) / len(lines)
+                # Scaled by the fraction of the lines that 'where' keeps.
+                kept = block.shape[0] / len(lines)
+                capacity = max(capacity, int(1.05 * kept * remaining / line_size) + 1)
+
+            out = np.empty((capacity, n_cols), dtype=dtype)
+
+        elif n + block.shape[0] > out.shape[0]:
+            capacity = max(n + block.shape[0], int(1.5 * out.shape[0]))
+            out.resize((capacity, n_cols), refcheck=False)
+
+        out[n:n + block.shape[0]] = block
+        n += block.shape[0]
+
+    if out is None:
+        return np.empty((0, n_cols or 0), dtype=dtype)
+
+    if n != out.shape[0]:
+        out.resize((n, n_cols), refcheck=False)
+
+    return out
+
+
+
+
+def _line_ranges(path, offset, n_ranges):
+    # Split the file from 'offset' into byte ranges that end at newlines.
+    size = os.path.getsize(path)
+    bounds = [offset]
+
+    with open(path, "rb") as f:
+        for i in range(1, n_ranges):
+            position = offset + (size - offset) * i // n_ranges
+
+            if position <= bounds[-1]:
+                continue
+
+            f.seek(position - 1)
+            f.readline()
+
+            if bounds[-1] < f.tell() < size:
+                bounds.append(f.tell())
+
+    bounds.append(size)
+
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _read_range(path, start, end):
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+def _parse_range(path, start, end, n_cols, dtype, kwargs):
+    text = _read_range(path, start, end).decode("utf-8")
+    return loadtxt_chunked(io.StringIO(text), n_cols, dtype=dtype, **kwargs)
+
+
+def loadtxt_parallel(path, offset, n_cols, max_workers=None, dtype=float,
+                     range_bytes=None, **kwargs):
+    """Read a whitespace separated numeric body in a process pool.
+
+    The body of 'path' (from byte 'offset' on) is split into ranges that
+    end at newlines. Each range is tokenized by 'loadtxt_chunked' in a
+    worker process, and the blocks of rows are copied, in the order of
+    the file, into one array as they arrive. The body is read once, and
+    besides the array only the blocks in transit take memory. The array
+    is sized from the rows of the first range (as 'loadtxt_chunked'
+    does from its first chunk) and trimmed at the end.
+
+    Parameters
+    ----------
+    path : str
+        The file name.
+    offset : int
+        The byte offset of the first line of the body.
+    n_cols : int
+        The number of values on each line (or in 'usecols').
+    max_workers : int | None
+        The number of worker processes; all cores if None.
+    dtype : type
+        The dtype of the returned array.
+    range_bytes : int | None
+        The approximate size of the ranges ('RANGE_BYTES' if None);
+        small bodies are read without starting any processes.
+    **kwargs
+        Passed to 'loadtxt_chunked' ('converters', 'usecols', 'where');
+        they must be picklable.
+
+    Returns
+    -------
+    np.ndarray
+        An (n, n_cols) array of the values in the body.
+    """
+    range_bytes = range_bytes or RANGE_BYTES
+    size = os.path.getsize(path) - offset
+    workers = max_workers or os.cpu_count() or 1
+
+    n_ranges = max(min(-(-size // range_bytes), 64 * workers), 1)
+
+    # Use at least a few ranges per worker, so the work is balanced.
+    ranges = [] if workers == 1 or n_ranges == 1 else \
+        _line_ranges(path, offset, max(n_ranges, 4 * workers))
+    workers = min(workers, len(ranges))
+
+    if workers <= 1:
+        with open(path, "r", encoding="utf-8") as f:
+            f.seek(offset)
+            return loadtxt_chunked(f, n_cols, dtype=dtype, **kwargs)
+
+    starts, ends = zip(*ranges)
+    k = len(ranges)
+
+    out = None
+    n = 0
+
+    # Spawned workers do not inherit the threads and Qt state of the
+    # (widget) process, unlike forked ones.
+    with ProcessPoolExecutor(workers, mp_context=get_context("spawn")) as executor:
+        blocks = executor.map(_parse_range, [path] * k, starts, ends, [n_cols] * k,
+                              [dtype] * k, [kwargs] * k)
+
+        for start, end, block in zip(starts, ends, blocks):
+            if out is None:
+                # Rows of the body at the density of the first range; the
+                # pages of rows that are never written take no memory.
+                rows = block.shape[0] / (end - start) * (size - (start - offset))
+                capacity = max(block.shape[0], int(1.05 * rows) + 1)
+                out = np.empty((capacity, n_cols), dtype=dtype)
+
+            elif n + block.shape[0] > out.shape[0]:
+                capacity = max(n + block.shape[0], int(1.5 * out.shape[0]))
+                out.resize((capacity, n_cols), refcheck=False)
+
+            out[n:n + block.shape[0]] = block
+            n += block.shape[0]
+
+    if n != out.shape[0]:
+        out.resize((n, n_cols), refcheck=False)
+
+    return out
+
+
+
+def set_spectra_dtype(dtype):
+    """Set the default dtype of the spectra read by all readers."""
+    global _SPECTRA_DTYPE
+    _SPECTRA_DTYPE = np.dtype(dtype)
+
+
+def spectra_dtype(reader=None):
+    """Return the dtype of the spectra read by 'reader'.
+
+    This is the reader's 'dtype' attribute if it is set, and the default
+    set by 'set_spectra_dtype' otherwise.
+    """
+    dtype = getattr(reader, "dtype", None)
+    return _SPECTRA_DTYPE if dtype is None else np.dtype(dtype)
+
+
+def table_from_numpy(domain, X, dtype=None, **kwargs):
+    """Like 'Table.from_numpy', but keep 'X' in 'dtype' (float64 if None).
+
+    'Table.from_numpy' always converts 'X' to float64, so for other
+    dtypes the table is made around a placeholder that takes no memory,
+    and 'X' is set afterwards. Data that already is of 'dtype' is not
+    copied.
+    """
+    dtype = np.dtype(np.float64 if dtype is None else dtype)
+
+    if dtype == np.float64:
+        return Table.from_numpy(domain, X, **kwargs)
+
+    X = np.ascontiguousarray(X, dtype=dtype)
+
+    if np.issubdtype(dtype, np.floating):
+        infinite = np.isinf(X)
+        if infinite.any():
+            if not X.flags.writeable:
+                X = X.copy()
+            X[infinite] = np.nan
+
+    table = Table.from_numpy(domain, np.broadcast_to(np.float64(0), X.shape), **kwargs)
+
+    with table.unlocked_reference():
+        table.X = X
+
+    return table
+
+
+def build_spec_table(domvals, data, additional_table=None, dtype=None):
+    """Create a table from a (wavenumbers, spectra, meta table) triplet.
+
+    As 'orangecontrib.spectroscopy.io.util.build_spec_table', but the
+    spectra are kept in 'dtype' (float64 if None).
+    """
+    data = np.atleast_2d(data)
+    features = [ContinuousVariable.make("%f" % f) for f in domvals]
+
+    if additional_table is None:
+        return table_from_numpy(Domain(features, None), data, dtype=dtype)
+
+    domain = Domain(features,
+                    class_vars=additional_table.domain.class_vars,
+                    metas=additional_table.domain.metas)
+
+    return table_from_numpy(domain, data, dtype=dtype,
+                            Y=additional_table.Y,
+                            metas=additional_table.metas,
+                            attributes=additional_table.attributes)
@@ -1 +1,4 @@
-from .chiptransition import ChipTransition
\ No newline at end of file
+from .chiptransition import ChipTransition
+from .interferogram import InterferogramFFT
+from .cumulative import CumulativeIntegral
+from .shared import SharedSpectra
@@ -0,0 +1,227 @@
+import threading
+from collections.abc import Iterable
+
+import numpy as np
+import scipy.sparse as sp
+
+from Orange.data import Table
+
+from orangecontrib.spectroscopy.data import getx
+from orangecontrib.spectroscopy.preprocess import Integrate
+from orangecontrib.spectroscopy.utils import split_to_size
+
+
+# Memory the cumulative sums, with the sorted copy of the spectra if one
+# is needed, may take by default, relative to the spectra; tables that
+# would need more use 'Integrate'.
+CUMULATIVE_RATIO = 2
+
+
+
+
+class CumulativeIntegral:
+    """Window integrals of all spectra of a table from cumulative sums.
+
+    The trapezoid areas between neighbouring points of every spectrum
+    are summed cumulatively once; the integral of any window is then the
+    difference of two columns of the sums, without a pass over the
+    spectra. This gives the same values as 'Integrate' for the
+    "Integral from 0" method and, subtracting the (exact) trapezoid of
+    the linear edge baseline, for "Integral from baseline". Other
+    methods, and tables with missing values or repeated wavenumbers,
+    are left to 'Integrate' (see 'supports').
+
+    The sums are stored in the dtype of the spectra (summed in float64),
+    so they take as much memory as the spectra, and the spectra are
+    copied too if their wavenumbers are neither ascending nor
+    descending. They are computed on the first use, so an object can be
+    made for every table that may be integrated, and only if they fit in
+    'max_bytes'; otherwise nothing is supported. 'release' frees them
+    for good once the table is replaced.
+
+    Parameters
+    ----------
+    data : Orange.data.Table
+        The spectra.
+    max_bytes : int | None
+        The memory the sums (and the sorted copy) may take; if None,
+        'CUMULATIVE_RATIO' times the memory of the spectra.
+    """
+
+    METHODS = (Integrate.Simple, Integrate.Baseline)
+
+    def __init__(self, data, max_bytes=None):
+        self.data = data
+        self.max_bytes = max_bytes
+
+        self._valid = None
+        self._x = None
+        self._y = None
+        self._cumulative = None
+        self._released = False
+        # Tasks of the widgets may prepare the sums from several threads.
+        self._lock = threading.Lock()
+
+
+    @staticmethod
+    def _method(integrate):
+        # The method and the limits of a single integral, or None.
+        if not isinstance(integrate, Integrate) or integrate.metas \
+                or not integrate.limits or len(integrate.limits) != 1:
+            return None
+
+        method = integrate.methods
+        if isinstance(method, Iterable):
+            method = list(method)
+            if len(method) != 1:
+                return None
+            method = method[0]
+
+        limits = integrate.limits[0]
+        if len(limits) != 2 or any(l is None for l in limits):
+            return None
+
+        return method, limits
+
+
+    def dtype(self):
+        """Return the dtype of the cumulative sums."""
+        dtype = self.data.X.dtype
+        return dtype if np.issubdtype(dtype, np.floating) else np.dtype(np.float64)
+
+
+    def nbytes(self):
+        """Return the memory the cumulative sums would take, in bytes."""
+        X = self.data.X
+        x = getx(self.data)
+        nbytes = X.shape[0] * X.shape[1] * self.dtype().itemsize
+
+        # Unordered wavenumbers need a sorted copy of the spectra.
+        if not (np.all(np.diff(x) > 0) or np.all(np.diff(x) < 0)):
+            nbytes += X.shape[0] * X.shape[1] * X.dtype.itemsize
+
+        return nbytes
+
+
+    def valid(self):
+        """Return True if the spectra can be integrated from cumulative sums."""
+        if self._released:
+            return False
+
+        if self._valid is None:
+            X = self.data.X
+            x = np.sort(getx(self.data))
+
+            max_bytes = self.max_bytes
+            if max_bytes is None:
+                max_bytes = CUMULATIVE_RATIO * X.shape[0] * X.shape[1] * X.dtype.itemsize
+
+            self._valid = not sp.issparse(X) and X.shape[1] > 0 \
+                and self.nbytes() <= max_bytes \
+                and bool(np.all(np.diff(x) > 0)) and bool(np.isfinite(X).all())
+
+        return self._valid
+
+
+    def supports(self, integrate):
+        """Return True if 'integrate' can be computed from cumulative sums."""
+        method = self._method(integrate)
+        return method is not None and method[0] in self.METHODS and self.valid()
+
+
+    def prepared(self):
+        """Return True if the cumulative sums are computed."""
+        return self._cumulative is not None
+
+
+    def prepare(self, callback=None):
+        """Compute the cumulative sums, if not yet computed.
+
+        Return the sorted wavenumbers, the spectra in their order and the
+        sums. 'callback' is called with the progress (0 to 1) after each
+        part of the spectra; it may raise an exception to interrupt.
+        Raise ValueError if the sums were released.
+        """
+        with self._lock:
+            if self._released:
+                raise ValueError("The cumulative sums were released")
+            if self._cumulative is not None:
+                return self._x, self._y, self._cumulative
+
+            X = self.data.X
+            x = getx(self.data)
+            sorter = np.argsort(x)
+
+            # Views of the spectra where the wavenumbers are sorted.
+            if np.array_equal(sorter, np.arange(len(x))):
+                y = X
+            elif np.array_equal(sorter, np.arange(len(x))[::-1]):
+                y = X[:, ::-1]
+            else:
+                y = X[:, sorter]
+            x = x[sorter]
+
+            dx = np.diff(x)
+            cumulative = np.zeros(X.shape, dtype=self.dtype())
+
+            step = 100000 if len(X) > 1e6 else 10000
+            for part in split_to_size(len(X), step):
+                yp = np.asarray(y[part], dtype=np.float64)
+                cumulative[part, 1:] = np.cumsum(dx * (yp[:, :-1] + yp[:, 1:]) / 2, axis=1)
+
+                if callback is not None:
+                    callback(part.stop / len(X))
+
+            self._x, self._y, self._cumulative = x, y, cumulative
+            return x, y, cumulative
+
+
+    def release(self):
+        """Free the cumulative sums; the object supports nothing after."""
+        with self._lock:
+            self._released = True
+            self._x = self._y = self._cumulative = None
+
+
+    def compute(self, integrate, callback=None):
+        """Return the values of 'integrate' for all spectra, as a column.
+
+        'integrate' must be supported (see 'supports').
+        """
+        method, limits = self._method(integrate)
+        # Keep references, as 'release' may be called from another thread.
+        x, y, cumulative = self.prepare(callback)
+
+        # The points in the limits, as in 'Integrate' (inclusive).
+        start = np.searchsorted(x, min(limits), side="left")
+        end = np.searchsorted(x, max(limits), side="right") - 1
+
+        if end - start < 1:
+            return np.zeros((len(cumulative), 1))
+
+        values = np.asarray(cumulative[:, end], dtype=np.float64) - cumulative[:, start]
+
+        if method is Integrate.Baseline:
+            values -= (x[end] - x[start]) * (np.asarray(y[:, start], dtype=np.float64)
+                                             + np.asarray(y[:, end], dtype=np.float64)) / 2
+
+        return values[:, None]
+
+
+    def wrap(self, integrate):
+        """Return a function computing 'integrate' of a table.
+
+        The function uses the cumulative sums for the table of this
+        object, if 'integrate' is supported, and calls 'integrate'
+        otherwise. Either way it returns a table like 'integrate' does.
+        """
+        def image_values(data):
+            if data is self.data and self.supports(integrate):
+                # The domain of 'integrate', from a table without rows.
+                domain = integrate(data[:0]).domain
+                return Table.from_numpy(domain, self.compute(integrate),
+                                        data.Y, data.metas, data.W,
+                                        attributes=data.attributes, ids=data.ids)
+            return integrate(data)
+
+        return image_values
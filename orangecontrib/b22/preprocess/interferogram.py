@@ -0,0 +1,209 @@
+import re
+
+import numpy as np
+
+from Orange.data import Table, Domain, ContinuousVariable, DiscreteVariable
+from Orange.preprocess.preprocess import Preprocess
+
+from orangecontrib.spectroscopy.irfft import ApodFunc, apodize, zero_fill
+
+
+
+
+class InterferogramFFT(Preprocess):
+    """Turn NeaSPEC interferograms into amplitude and phase spectra.
+
+    The input is a table of interferograms as read by 'Nea2Reader' (one
+    row per pixel, run and channel, with 'map_x', 'map_y', 'run' and
+    'channel' metas). For each pixel the O<n>A/O<n>P channels of every
+    run are combined into the complex signal O<n>A * exp(i O<n>P) and
+    averaged over the runs. The average is apodized around its zero path
+    difference, zero-filled and Fourier transformed, in one batch for
+    all pixels of a chunk. The output has one O<n>A (amplitude) and one
+    O<n>P (phase) spectrum per pixel and harmonic.
+
+    Parameters
+    ----------
+    dx : float | None
+        The optical path difference between points (cm). If None, it is
+        calculated from the "Interferometer Center/Distance" (and the
+        "Wavenumber Scaling") header.
+    apod_func : ApodFunc
+        The apodization function.
+    zff : int
+        The zero-filling factor.
+    chunk_bytes : int
+        The approximate memory used for each chunk of pixels.
+    """
+
+    CHANNEL = re.compile(r"O(\d+)([AP])$")
+
+    def __init__(self, dx=None, apod_func=ApodFunc.BLACKMAN_HARRIS_3, zff=2,
+                 chunk_bytes=256 * 1024**2):
+        self.dx = dx
+        self.apod_func = apod_func
+        self.zff = zff
+        self.chunk_bytes = chunk_bytes
+
+
+    # Lengths of the units of the interferometer distance, in cm.
+    UNITS = {"m": 1e2, "cm": 1.0, "mm": 1e-1, "µm": 1e-4, "μm": 1e-4, "um": 1e-4,
+             "nm": 1e-7}
+
+    @staticmethod
+    def step(attributes, n_points):
+        """Return the optical path difference step (cm) from the headers.
+
+        The distance is in its "Units" (µm if not given). Raise
+        ValueError if the step can not be computed or is not positive.
+        """
+        try:
+            header = attributes["Interferometer Center/Distance"]
+            distance = float(header["Distance"])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("The data has no interferometer distance; set 'dx'.")
+
+        units = header.get("Units") or "µm"
+        if units not in InterferogramFFT.UNITS:
+            raise ValueError(f"Unknown units of the interferometer distance: '{units}'.")
+
+        if n_points < 2:
+            raise ValueError("Interferograms need at least two points.")
+
+        # The optical path is twice as long as the mirror travel.
+        dx = 2 * distance * InterferogramFFT.UNITS[units] / (n_points - 1)
+
+        try:
+            dx /= float(attributes["Wavenumber Scaling"])
+        except (KeyError, TypeError, ValueError, ZeroDivisionError):
+            pass
+
+        if not (np.isfinite(dx) and dx > 0):
+            raise ValueError(f"The interferometer distance ({distance} {units}) "
+                             f"gives a step of {dx} cm; set a positive 'dx'.")
+
+        return dx
+
+
+    @staticmethod
+    def fft(ifg, apod_func, zff):
+        """Apodize, zero-fill and transform rows of complex interferograms.
+
+        Each row is centred on its own zero path difference (its largest
+        absolute value). Returns the complex spectra.
+        """
+        ifg = ifg - ifg.mean(axis=1, keepdims=True)
+        zpd = np.abs(ifg).argmax(axis=1)
+
+        n_fft = zero_fill(ifg[:1], zff).shape[1]
+        out = np.empty((len(ifg), n_fft), dtype=complex)
+
+        # Rows are usually aligned, so this is one batch per chunk.
+        for z in np.unique(zpd):
+            rows = np.flatnonzero(zpd == z)
+
+            batch = zero_fill(apodize(ifg[rows], z, apod_func), zff)
+            # Rotate the interferograms so that the centerburst is at the edges.
+            out[rows] = np.fft.fft(np.roll(batch, -z, axis=1), axis=1)
+
+        return out
+
+
+    def __call__(self, data):
+        for name in ["map_x", "map_y", "channel"]:
+            if name not in data.domain:
+                raise ValueError(f"The data has no '{name}' meta.")
+
+        n_points = len(data.domain.attributes)
+        dx = self.dx if self.dx is not None else self.step(data.attributes, n_points)
+        if not dx > 0:
+            raise ValueError(f"The step 'dx' must be positive, not {dx}.")
+
+        coords = np.column_stack((data.get_column("map_x"),
+                                  data.get_column("map_y"))).astype(float)
+        pixels, pixel_i = np.unique(coords, axis=0, return_inverse=True)
+        pixel_i = pixel_i.ravel()
+
+        if "run" in data.domain:
+            _, run_i = np.unique(data.get_column("run"), return_inverse=True)
+            run_i = run_i.ravel()
+        else:
+            run_i = np.zeros(len(data), dtype=int)
+
+        n_runs = run_i.max() + 1 if len(data) else 1
+
+        # The harmonics with both an amplitude and a phase channel.
+        channel = data.domain["channel"]
+        matches = [self.CHANNEL.match(str(value)) for value in channel.values]
+        parts = {(int(m.group(1)), m.group(2)) for m in matches if m}
+        harmonics = sorted(n for n, part in parts if part == "A" and (n, "P") in parts)
+
+        if not harmonics:
+            raise ValueError("The data has no pairs of O<n>A and O<n>P channels.")
+
+        # Harmonic index and part (0: amplitude, 1: phase) of each channel value.
+        lookup = np.full((len(matches), 2), -1)
+        for i, m in enumerate(matches):
+            if m and int(m.group(1)) in harmonics:
+                lookup[i] = harmonics.index(int(m.group(1))), "AP".index(m.group(2))
+
+        codes = data.get_column("channel")
+        valid = ~np.isnan(codes)
+        harmonic_i = np.full(len(data), -1)
+        part_i = np.full(len(data), -1)
+        harmonic_i[valid], part_i[valid] = lookup[codes[valid].astype(int)].T
+
+        order = np.argsort(pixel_i, kind="stable")
+        order = order[harmonic_i[order] >= 0]
+        bounds = np.searchsorted(pixel_i[order], np.arange(len(pixels) + 1))
+
+        n_harmonics = len(harmonics)
+        n_fft = zero_fill(np.zeros((1, n_points)), self.zff).shape[1]
+        wavenumbers = np.fft.rfftfreq(n_fft, dx)
+
+        per_pixel = 16 * n_harmonics * (2 * n_runs * n_points + 2 * n_fft)
+        chunk = max(1, self.chunk_bytes // per_pixel)
+
+        X = np.empty((len(pixels), n_harmonics, 2, len(wavenumbers)))
+
+        for p0 in range(0, len(pixels), chunk):
+            p1 = min(p0 + chunk, len(pixels))
+            rows = order[bounds[p0]:bounds[p1]]
+
+            index = (pixel_i[rows] - p0, run_i[rows], harmonic_i[rows])
+
+            amplitude = np.zeros((p1 - p0, n_runs, n_harmonics, n_points))
+            phase = np.zeros_like(amplitude)
+            present = np.zeros(amplitude.shape[:3], dtype=bool)
+
+            is_a = part_i[rows] == 0
+            amplitude[tuple(i[is_a] for i in index)] = data.X[rows[is_a]]
+            phase[tuple(i[~is_a] for i in index)] = data.X[rows[~is_a]]
+            present[tuple(i[is_a] for i in index)] = True
+
+            # Average the complex signal over the runs.
+            signal = (amplitude * np.exp(1j * phase)).sum(axis=1)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                signal /= present.sum(axis=1)[:, :, None]
+
+            spectra = self.fft(signal.reshape(-1, n_points), self.apod_func, self.zff)
+            spectra = spectra[:, :len(wavenumbers)].reshape(p1 - p0, n_harmonics, -1)
+
+            X[p0:p1, :, 0] = np.abs(spectra)
+            X[p0:p1, :, 1] = np.angle(spectra)
+
+        names = [f"O{n}{part}" for n in harmonics for part in "AP"]
+        n_channels = len(names)
+
+        metas = np.empty((len(pixels) * n_channels, 3), dtype=object)
+        metas[:, 0] = np.repeat(pixels[:, 0], n_channels)
+        metas[:, 1] = np.repeat(pixels[:, 1], n_channels)
+        metas[:, 2] = np.tile(np.arange(n_channels), len(pixels))
+
+        domain = Domain([ContinuousVariable.make("%f" % w) for w in wavenumbers], None,
+                        metas=[data.domain["map_x"], data.domain["map_y"],
+                               DiscreteVariable.make("channel", values=names)])
+
+        return Table.from_numpy(domain, X=X.reshape(len(metas), -1), metas=metas,
+                                attributes=dict(data.attributes, **{
+                                    "Calculated Datapoint Spacing (Δx)": ["[cm]", dx]}))
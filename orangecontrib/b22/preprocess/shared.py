@@ -0,0 +1,84 @@
+import threading
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from Orange.data import Table, Domain
+
+
+
+
+class SharedSpectra:
+    """The spectra of a table, copied to shared memory for worker processes.
+
+    The copy is made on the first call of 'get' and kept until 'close',
+    so that repeated computations on the same table copy it only once.
+    The copy takes as much memory as the spectra.
+    'close' is final: 'get' raises ValueError afterwards, so a task still
+    running can not make a new copy that nothing would free.
+
+    Parameters
+    ----------
+    data : Orange.data.Table
+        The spectra; only its attributes are shared.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.shm = None
+        self.closed = False
+        self._lock = threading.Lock()
+
+
+    def get(self):
+        """Return the (name, shape, dtype) of the shared spectra."""
+        with self._lock:
+            if self.closed:
+                raise ValueError("The shared spectra are closed")
+
+            if self.shm is None:
+                X = np.asarray(self.data.X)
+
+                # Workers must share the parent's resource tracker; with
+                # trackers of their own, they would remove the shared
+                # memory when they exit.
+                resource_tracker.ensure_running()
+
+                shm = SharedMemory(create=True, size=max(X.nbytes, 1))
+                shared = np.ndarray(X.shape, dtype=X.dtype, buffer=shm.buf)
+                shared[:] = X
+                del shared
+
+                self.shm, self.shape, self.dtype = shm, X.shape, X.dtype
+
+            return self.shm.name, self.shape, self.dtype
+
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            if self.shm is not None:
+                self.shm.close()
+                self.shm.unlink()
+                self.shm = None
+
+
+def apply_shared(shm_name, shape, dtype, attributes, start, stop, transform):
+    """Return transform(table).X of rows start:stop of shared spectra.
+
+    Run in a worker process; 'attributes' are the variables of the
+    columns of the spectra and 'transform' (e.g. 'Integrate') must be
+    picklable.
+    """
+    shm = SharedMemory(shm_name)
+    try:
+        X = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        data = Table.from_numpy(Domain(attributes), X[start:stop])
+        values = np.array(transform(data).X, dtype=np.float64)
+        # The shared memory can not be closed while viewed.
+        del data, X
+    finally:
+        shm.close()
+
+    return values
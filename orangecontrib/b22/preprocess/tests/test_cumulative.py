@@ -0,0 +1,151 @@
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from Orange.data import Table, Domain, ContinuousVariable
+
+from orangecontrib.spectroscopy.preprocess import Integrate
+
+from orangecontrib.b22.io.utils import table_from_numpy
+from orangecontrib.b22.preprocess import CumulativeIntegral
+
+
+
+
+def spectra(x, n=7, seed=0):
+    X = np.random.default_rng(seed).random((n, len(x)))
+    return Table.from_numpy(Domain([ContinuousVariable(str(v)) for v in x]), X)
+
+
+LIMITS = [(1100, 1900), (1900, 1100), (0, 5000), (0, 10), (1500, 1500.1)]
+
+
+
+
+class TestCumulativeIntegral(unittest.TestCase):
+    def test_integrate(self):
+        x = np.sort(np.random.default_rng(1).uniform(1000, 2000, 30))
+
+        # Ascending, descending and unordered wavenumbers.
+        for order in [x, x[::-1], np.random.default_rng(2).permutation(x)]:
+            data = spectra(order)
+            cumulative = CumulativeIntegral(data)
+
+            for method in CumulativeIntegral.METHODS:
+                for limits in LIMITS + [(x[0], x[0]), (x[0], x[1])]:
+                    integrate = Integrate(methods=method, limits=[list(limits)])
+
+                    self.assertTrue(cumulative.supports(integrate))
+                    np.testing.assert_allclose(cumulative.compute(integrate),
+                                               integrate(data).X, atol=1e-12)
+
+
+    def test_supports(self):
+        data = spectra(np.linspace(1000, 2000, 20))
+        cumulative = CumulativeIntegral(data)
+
+        self.assertFalse(cumulative.supports(Integrate(methods=Integrate.PeakMax,
+                                                       limits=[[1000, 2000]])))
+        self.assertFalse(cumulative.supports(Integrate(methods=Integrate.Simple,
+                                                       limits=[[1000, 2000], [1200, 1300]])))
+        self.assertFalse(cumulative.supports(Integrate(methods=Integrate.Simple,
+                                                       limits=[[None, 2000]])))
+        self.assertFalse(cumulative.supports(lambda data: data))
+
+        with data.unlocked():
+            data.X[0, 3] = np.nan
+        self.assertFalse(CumulativeIntegral(data).supports(
+            Integrate(methods=Integrate.Simple, limits=[[1000, 2000]])))
+
+
+    def test_wrap(self):
+        data = spectra(np.linspace(1000, 2000, 20))
+        cumulative = CumulativeIntegral(data)
+        integrate = Integrate(methods=Integrate.Baseline, limits=[[1200, 1700]])
+
+        self.assertFalse(cumulative.prepared())
+        values = cumulative.wrap(integrate)(data)
+        self.assertTrue(cumulative.prepared())
+        expected = integrate(data)
+        self.assertIsInstance(values, Table)
+        self.assertEqual(values.domain, expected.domain)
+        np.testing.assert_allclose(values.X, expected.X)
+        np.testing.assert_equal(values.ids, data.ids)
+
+        # Other tables are integrated as before.
+        with patch.object(CumulativeIntegral, "compute") as compute:
+            self.assertIsInstance(cumulative.wrap(integrate)(data[:3]), Table)
+            compute.assert_not_called()
+
+
+    def test_max_bytes(self):
+        data = spectra(np.linspace(1000, 2000, 20))
+        integrate = Integrate(methods=Integrate.Simple, limits=[[1200, 1700]])
+
+        cumulative = CumulativeIntegral(data, max_bytes=data.X.size * 8)
+        self.assertTrue(cumulative.supports(integrate))
+
+        # Above the limit the tables are integrated with 'Integrate'.
+        cumulative = CumulativeIntegral(data, max_bytes=data.X.size * 8 - 1)
+        self.assertFalse(cumulative.supports(integrate))
+        values = cumulative.wrap(integrate)(data)
+        self.assertFalse(cumulative.prepared())
+        np.testing.assert_allclose(values.X, integrate(data).X)
+
+        # Unordered wavenumbers also need a sorted copy of the spectra.
+        x = np.random.default_rng(2).permutation(np.linspace(1000, 2000, 20))
+        data = spectra(x)
+        self.assertEqual(CumulativeIntegral(data).nbytes(), 2 * data.X.size * 8)
+
+
+    def test_large_float32(self):
+        # A map of a million spectra is supported by default, and the sums
+        # take no more memory than its float32 spectra.
+        x = np.linspace(1000, 2000, 16)
+        X = np.random.default_rng(0).random((10**6, len(x)), dtype=np.float32)
+        data = table_from_numpy(Domain([ContinuousVariable(str(v)) for v in x]), X,
+                                dtype=np.float32)
+        integrate = Integrate(methods=Integrate.Baseline, limits=[[1100, 1800]])
+
+        cumulative = CumulativeIntegral(data)
+        self.assertTrue(cumulative.supports(integrate))
+        self.assertEqual(cumulative.nbytes(), X.nbytes)
+
+        values = cumulative.compute(integrate)
+        self.assertEqual(cumulative.prepare()[2].dtype, np.float32)
+        np.testing.assert_allclose(values[:1000], integrate(data[:1000]).X,
+                                   rtol=1e-5, atol=1e-4)
+
+
+    def test_release(self):
+        data = spectra(np.linspace(1000, 2000, 20))
+        cumulative = CumulativeIntegral(data)
+        integrate = Integrate(methods=Integrate.Simple, limits=[[1200, 1700]])
+
+        cumulative.prepare()
+        cumulative.release()
+        self.assertFalse(cumulative.prepared())
+        self.assertFalse(cumulative.supports(integrate))
+        with self.assertRaises(ValueError):
+            cumulative.prepare()
+        np.testing.assert_allclose(cumulative.wrap(integrate)(data).X,
+                                   integrate(data).X)
+
+
+    def test_prepare_interrupted(self):
+        data = spectra(np.linspace(1000, 2000, 20))
+        cumulative = CumulativeIntegral(data)
+
+        def interrupt(_):
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            cumulative.prepare(interrupt)
+        self.assertFalse(cumulative.prepared())
+
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import unittest
+
+import numpy as np
+
+from Orange.data import Table, Domain, ContinuousVariable, DiscreteVariable
+
+from orangecontrib.spectroscopy.irfft import ApodFunc
+
+from orangecontrib.b22.preprocess import InterferogramFFT
+
+
+
+
+CHANNELS = ("O1A", "O1P", "O2A", "O2P", "M")
+
+
+def interferograms(n_pixels=3, n_runs=2, n_points=128, dx=1e-4, wavenumber=1500.0):
+    """A table of interferograms, as read by Nea2Reader.
+
+    O1 is a cosine of 'wavenumber' (with the centerburst at a quarter of
+    the scan), O2 the same at half the amplitude and a constant phase.
+    """
+    x = (np.arange(n_points) - n_points // 4) * dx
+    signal = np.cos(2 * np.pi * wavenumber * x) * np.exp(-(x / (20 * dx))**2)
+
+    channels = {
+        "O1A": np.abs(signal), "O1P": np.where(signal < 0, np.pi, 0.0),
+        "O2A": np.abs(signal) / 2, "O2P": np.where(signal < 0, np.pi, 0.0) + 0.5,
+        "M": x,
+    }
+
+    X, metas = [], []
+    for pixel in range(n_pixels):
+        for run in range(n_runs):
+            for c, name in enumerate(CHANNELS):
+                # Only the amplitudes scale with the pixel.
+                scale = pixel + 1 if name.endswith("A") else 1
+                X.append(scale * channels[name])
+                metas.append([pixel, 2 * pixel, run, c])
+
+    domain = Domain([ContinuousVariable.make("%f" % i) for i in range(n_points)], None,
+                    metas=[ContinuousVariable.make("map_x"),
+                           ContinuousVariable.make("map_y"),
+                           ContinuousVariable.make("run"),
+                           DiscreteVariable.make("channel", values=CHANNELS)])
+
+    return Table.from_numpy(domain, X=np.array(X), metas=np.array(metas, dtype=object),
+                            attributes={"Interferometer Center/Distance": {
+                                "Units": "µm", "Center": 0.0,
+                                "Distance": (n_points - 1) * dx / 2 * 1e4}})
+
+
+
+
+class TestInterferogramFFT(unittest.TestCase):
+    def test_spectra(self):
+        data = interferograms()
+        out = InterferogramFFT()(data)
+
+        wavenumbers = np.array([float(a.name) for a in out.domain.attributes])
+        self.assertAlmostEqual(wavenumbers[1], 1 / (256 * 1e-4), places=3)
+
+        self.assertEqual(len(out), 3 * 4)
+        self.assertEqual(out.domain["channel"].values, ("O1A", "O1P", "O2A", "O2P"))
+        np.testing.assert_array_equal(out.get_column("map_x"), np.repeat([0, 1, 2], 4))
+
+        amplitude = out.X[0::4]
+        peak = wavenumbers[amplitude.argmax(axis=1)]
+        np.testing.assert_allclose(peak, 1500, atol=wavenumbers[1])
+
+        # Amplitudes scale with the pixel; O2 is half of O1, phase shifted by 0.5.
+        np.testing.assert_allclose(amplitude / amplitude[:1], [[1], [2], [3]] * np.ones_like(amplitude),
+                                   rtol=1e-6)
+        np.testing.assert_allclose(out.X[2::4], out.X[0::4] / 2, rtol=1e-6, atol=1e-12)
+
+        i = amplitude[0].argmax()
+        self.assertAlmostEqual(out.X[3, i] - out.X[1, i], 0.5, places=6)
+
+
+    def test_chunks(self):
+        data = interferograms(n_pixels=5)
+
+        expected = InterferogramFFT()(data)
+        actual = InterferogramFFT(chunk_bytes=1, apod_func=ApodFunc.BLACKMAN_HARRIS_3)(data)
+
+        np.testing.assert_allclose(actual.X, expected.X)
+
+
+    def test_run_average(self):
+        data = interferograms(n_runs=1)
+        doubled = interferograms(n_runs=2)
+
+        np.testing.assert_allclose(InterferogramFFT(dx=1e-4)(doubled).X,
+                                   InterferogramFFT(dx=1e-4)(data).X)
+
+
+    def test_no_distance(self):
+        data = interferograms()
+        data.attributes = {}
+
+        with self.assertRaises(ValueError):
+            InterferogramFFT()(data)
+
+        self.assertEqual(len(InterferogramFFT(dx=1e-4)(data)), 12)
+
+
+    def test_step(self):
+        def attributes(distance, units):
+            return {"Interferometer Center/Distance": {"Units": units, "Center": 0.0,
+                                                       "Distance": distance}}
+
+        # Twice the mirror travel, in cm.
+        for distance, units in [(50, "µm"), (50, "um"), (50000, "nm"), (0.05, "mm"),
+                                (50e-6, "m"), (50, None)]:
+            self.assertAlmostEqual(InterferogramFFT.step(attributes(distance, units), 101),
+                                   1e-4)
+
+        for args in [(attributes(0, "µm"), 101), (attributes(-50, "µm"), 101),
+                     (attributes(50, "µm"), 1), (attributes(50, "furlong"), 101)]:
+            with self.assertRaises(ValueError):
+                InterferogramFFT.step(*args)
+
+        with self.assertRaises(ValueError):
+            InterferogramFFT(dx=0)(interferograms())
+
+
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+
+import numpy as np
+
+from Orange.data import Table, Domain, ContinuousVariable
+
+from orangecontrib.spectroscopy.preprocess import Integrate
+
+from orangecontrib.b22.preprocess import SharedSpectra
+from orangecontrib.b22.preprocess.shared import apply_shared
+
+
+
+
+class TestSharedSpectra(unittest.TestCase):
+    def test_apply_shared(self):
+        domain = Domain([ContinuousVariable(str(w)) for w in range(1000, 1010)])
+        data = Table.from_numpy(domain, np.random.default_rng(0).random((20, 10)))
+        integrate = Integrate(methods=Integrate.PeakMax, limits=[[1002, 1007]])
+
+        shared = SharedSpectra(data)
+        try:
+            name, shape, dtype = shared.get()
+            self.assertEqual(shared.get(), (name, shape, dtype))
+
+            # As in a worker process.
+            values = apply_shared(name, shape, dtype, domain.attributes, 5, 12, integrate)
+            np.testing.assert_array_equal(values, integrate(data[5:12]).X)
+        finally:
+            shared.close()
+
+        self.assertIsNone(shared.shm)
+        shared.close()
+
+        # Closing is final.
+        with self.assertRaises(ValueError):
+            shared.get()
+        self.assertIsNone(shared.shm)
+
+
+
+
+if __name__ == "__main__":
+    unittest.main()
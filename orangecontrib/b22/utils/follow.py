@@ -0,0 +1,58 @@
+import time
+
+from AnyQt.QtCore import QObject, QTimer, pyqtSignal as Signal
+
+
+
+
+class FollowTimer(QObject):
+    """Call a follower's 'update' from a Qt timer, without blocking.
+
+    The follower (e.g. 'io.neaspec.Nea2Follower') is updated every
+    'interval' seconds in the thread of the timer; 'updated' is emitted
+    with each table 'update' returns, and 'finished' once no table has
+    been returned for 'timeout' seconds (never, if 'timeout' is None).
+    """
+
+    updated = Signal(object)
+    finished = Signal()
+
+    def __init__(self, follower, interval=1.0, timeout=None, parent=None):
+        super().__init__(parent)
+        self.follower = follower
+        self.timeout = timeout
+        self.last = None
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(int(interval * 1000))
+        self.timer.timeout.connect(self.update)
+
+
+    def start(self):
+        self.last = time.monotonic()
+        self.timer.start()
+        # The first update is not delayed by the interval.
+        QTimer.singleShot(0, self.update)
+
+
+    def stop(self):
+        self.timer.stop()
+
+
+    def is_active(self):
+        return self.timer.isActive()
+
+
+    def update(self):
+        if not self.timer.isActive():
+            return
+
+        table = self.follower.update()
+
+        if table is not None:
+            self.last = time.monotonic()
+            self.updated.emit(table)
+
+        elif self.timeout is not None and time.monotonic() - self.last >= self.timeout:
+            self.stop()
+            self.finished.emit()
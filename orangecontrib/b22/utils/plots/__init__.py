@@ -274,6 +274,118 @@ def findRaster(coords : np.array):
 
 
 
+# The largest distance (in pixels) of a coordinate from its grid point.
+GRID_TOLERANCE = 0.01
+
+
+def _gridGeometry(grid):
+    try:
+        origin = np.array(grid["origin"], dtype=float)
+        step = np.array(grid["step"], dtype=float)
+        shape = np.array(grid["shape"], dtype=int)
+        theta = np.radians(float(grid["angle"]))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+    if np.any(step == 0):
+        return None
+
+    rotation = np.array([
+        [np.cos(theta), -np.sin(theta)],
+        [np.sin(theta),  np.cos(theta)],
+    ])
+
+    return origin, step, shape, rotation
+
+
+def gridIndex(grid, coords : np.array):
+    """Find the pixel of each coordinate on a reader's grid.
+
+    Parameters
+    ----------
+    grid : dict
+        A grid descriptor, as in the "Grid" attribute of the tables
+        made by the b22 readers (see 'io.utils.grid_descriptor').
+    coords : np.array
+        An (n, 2) numpy array of x and y coordinates.
+
+    Returns
+    -------
+    np.array | None
+        An (n, 2) array of the (column, row) index of each coordinate,
+        or None if any coordinate is not on the grid. Rows of filtered
+        or reordered tables are still found.
+    """
+    geometry = _gridGeometry(grid)
+    coords = np.asarray(coords, dtype=float)
+
+    if geometry is None or coords.ndim != 2 or coords.shape[1] != 2:
+        return None
+
+    origin, step, shape, rotation = geometry
+
+    # Coordinates in pixels along the scan axes.
+    local = (coords - origin) @ rotation / step
+
+    index = np.rint(local)
+
+    with np.errstate(invalid="ignore"):
+        on_grid = np.all(np.abs(local - index) <= GRID_TOLERANCE) \
+            and np.all((index >= 0) & (index < shape))
+
+    if not on_grid:
+        return None
+
+    return index.astype(np.int64)
+
+
+def gridRaster(grid, coords : np.array):
+    """As 'findRaster', but from a reader's grid descriptor.
+
+    Returns
+    -------
+    tuple | None
+        The linspaces and rotations (as returned by 'findRaster') and
+        the pixel index of each coordinate (see 'gridIndex'), or None if
+        the coordinates are not on the grid.
+    """
+    index = gridIndex(grid, coords)
+
+    if index is None:
+        return None
+
+    origin, step, shape, rotation = _gridGeometry(grid)
+
+    # The raster is rotated about its centre.
+    half = step * (shape - 1) / 2
+    center = origin + rotation @ half
+
+    lss = [(c - h, c + h, int(n)) for c, h, n in zip(center, half, shape)]
+
+    return lss, np.array([np.radians(float(grid["angle"]))]), index
+
+
+
+def gridLinspaces(grid, coords : np.array):
+    """Return the x and y linspaces of an unrotated reader's grid.
+
+    As 'values_to_linspace' on each column of 'coords', but from the
+    grid descriptor. Returns None if the grid is rotated or the
+    coordinates are not on it.
+    """
+    raster = gridRaster(grid, coords)
+
+    if raster is None or not np.isclose(float(grid["angle"]) % 360, 0):
+        return None
+
+    lss, _, _ = raster
+
+    return [(min(x0, x1), max(x0, x1), n) for x0, x1, n in lss]
+
+
+
+
+
 
 
 
@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from AnyQt.QtTest import QSignalSpy
+
+from Orange.widgets.tests.base import GuiTest
+
+from orangecontrib.b22.io import Nea2Reader
+from orangecontrib.b22.io.tests.test_neaspec import write_nea_v2
+
+
+
+
+class TestFollowTimer(GuiTest):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "live.txt")
+
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+
+    def test_follow(self):
+        write_nea_v2(self.path)
+
+        follower = Nea2Reader(self.path).follower()
+        timer = follower.follow(interval=0.01, timeout=0.05)
+        # Following does not block.
+        self.assertTrue(timer.is_active())
+
+        updated = QSignalSpy(timer.updated)
+        finished = QSignalSpy(timer.finished)
+        self.assertTrue(finished.wait(5000))
+
+        self.assertFalse(timer.is_active())
+        self.assertEqual(len(updated), 1)
+        np.testing.assert_array_equal(updated[0][0].X, Nea2Reader(self.path).read().X)
+        self.assertIs(updated[0][0], follower.data)
+
+
+    def test_stop(self):
+        write_nea_v2(self.path)
+
+        timer = Nea2Reader(self.path).follower().follow(interval=0.01)
+        timer.stop()
+
+        updated = QSignalSpy(timer.updated)
+        self.assertFalse(updated.wait(100))
+        self.assertFalse(timer.is_active())
+
+
+
+
+if __name__ == "__main__":
+    unittest.main()
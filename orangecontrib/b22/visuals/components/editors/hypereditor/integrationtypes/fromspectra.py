@@ -7,6 +7,7 @@ from Orange.widgets.utils import itemmodels
 
 from orangecontrib.spectroscopy.preprocess import Integrate
 
+from orangecontrib.b22.preprocess import CumulativeIntegral
 from orangecontrib.b22.visuals.components.editors.hypereditor.integrationtypes.base import Base
 
 from orangecontrib.spectroscopy.widgets.gui import MovableVline
@@ -22,11 +23,16 @@ class FromSpectra(Base):
     lowlimb = settings.Setting(None)
     highlimb = settings.Setting(None)
 
+    # Memory for the cumulative sums of the integrals (bytes), or None
+    # for the default of 'CumulativeIntegral' (relative to the spectra).
+    cumulative_max_bytes = None
+
 
     def __init__(self, parent):
         Base.__init__(self, parent)
 
         self.box_values_spectra = None
+        self.cumulative = None
 
         self.line1 = MovableVline(position=self.lowlim, label="", report=self.parent.curveplot)
         self.line1.sigMoved.connect(lambda v: setattr(self, "lowlim", v))
@@ -42,6 +48,7 @@ class FromSpectra(Base):
         self.line5.sigMoved.connect(lambda v: setattr(self, "highlimb", v))
 
         for line in [self.line1, self.line2, self.line3, self.line4, self.line5]:
+            line.sigMoved.connect(self.moved_integral_range)
             line.sigMoveFinished.connect(self.changed_integral_range)
             self.parent.curveplot.add_marking(line)
             line.hide()
@@ -62,6 +69,10 @@ class FromSpectra(Base):
         
 
     def init_values(self, data):
+        if self.cumulative is not None:
+            self.cumulative.release()
+        self.cumulative = CumulativeIntegral(data, self.cumulative_max_bytes) \
+            if data is not None else None
         self._init_integral_boundaries()
 
     
@@ -69,15 +80,21 @@ class FromSpectra(Base):
         imethod = self.integration_methods[self.integration_method]
 
         if imethod == Integrate.Separate:
-            return Integrate(methods=imethod,
-                                limits=[[self.lowlim, self.highlim,
-                                        self.lowlimb, self.highlimb]])
+            integrate = Integrate(methods=imethod,
+                                  limits=[[self.lowlim, self.highlim,
+                                           self.lowlimb, self.highlimb]])
         elif imethod != Integrate.PeakAt:
-            return Integrate(methods=imethod,
-                                limits=[[self.lowlim, self.highlim]])
+            integrate = Integrate(methods=imethod,
+                                  limits=[[self.lowlim, self.highlim]])
         else:
-            return Integrate(methods=imethod,
-                                limits=[[self.choose, self.choose]])
+            integrate = Integrate(methods=imethod,
+                                  limits=[[self.choose, self.choose]])
+
+        # Integrals of the editor's data from cumulative sums, where exact.
+        if self.cumulative is not None:
+            return self.cumulative.wrap(integrate)
+
+        return integrate
         
     
 
@@ -92,6 +109,19 @@ class FromSpectra(Base):
         self.redraw_data()
 
 
+    def moved_integral_range(self):
+        # While dragging, redraw only integrals that need no pass over
+        # the spectra.
+        if self.disable_integral_range or self.cumulative is None \
+                or not self.cumulative.prepared():
+            return
+
+        imethod = self.integration_methods[self.integration_method]
+        integrate = Integrate(methods=imethod, limits=[[self.lowlim, self.highlim]])
+        if self.cumulative.supports(integrate):
+            self.redraw_data()
+
+
     def _change_integral_type(self):
         self._change_integration()
         
@@ -6,7 +6,7 @@ from AnyQt import QtCore, QtGui, QtWidgets
 from scipy import spatial
 
 
-from orangecontrib.b22.utils.plots import ImageTypes, ChannelNormalisationTypes, getPixelSize, findRaster, generateCoords, rotateCoords
+from orangecontrib.b22.utils.plots import ImageTypes, ChannelNormalisationTypes, getPixelSize, findRaster, gridRaster, generateCoords, rotateCoords
 
 
 
@@ -16,7 +16,7 @@ class ImageItem(pg.GraphicsObject):
     MATCHING_REQUIRED = 0.8
 
 
-    def __init__(self, coords=None, values=None, **kwargs):
+    def __init__(self, coords=None, values=None, grid=None, **kwargs):
         pg.GraphicsObject.__init__(self)
 
         self._coords = None
@@ -25,6 +25,7 @@ class ImageItem(pg.GraphicsObject):
         self._lsx = None
         self._lsy = None
         self._rotation = 0
+        self._grid_index = None
 
         self._lut = None
 
@@ -40,7 +41,7 @@ class ImageItem(pg.GraphicsObject):
 
         self._poor_lss = False
 
-        self.setCoords(coords)
+        self.setCoords(coords, grid=grid)
         self.setColours(values)
 
         self.setOpts(**{
@@ -87,12 +88,21 @@ class ImageItem(pg.GraphicsObject):
             self.update()
 
     
-    def setCoords(self, coords: np.array, **kwargs) -> None:
+    def setCoords(self, coords: np.array, grid=None, **kwargs) -> None:
         self._poor_lss = False
 
         self._coords = coords
 
-        lss, rot = findRaster(coords)
+        # With a reader's grid descriptor, the raster and the pixel of
+        # each coordinate are known without searching for them.
+        raster = None if grid is None else gridRaster(grid, coords)
+
+        if raster is None:
+            lss, rot = findRaster(coords)
+            self._grid_index = None
+
+        else:
+            lss, rot, self._grid_index = raster
 
         self._lsx, self._lsy = lss
         self._rotation = rot
@@ -245,15 +255,22 @@ class ImageItem(pg.GraphicsObject):
         tol = np.array(getPixelSize(*self._pixel_size)) * ImageItem.PIXEL_TOLERANCE
 
         g_coords = generateCoords(self._lsx, self._lsy)
-        r_coords = rotateCoords(g_coords, -self._rotation)
-        tree = spatial.cKDTree(r_coords)
 
-        _, indices = tree.query(self._coords, k=1)
+        if self._grid_index is not None:
+            # Rows of 'g_coords' run along x.
+            indices = self._grid_index[:, 1] * self._lsx[2] + self._grid_index[:, 0]
+            valid = np.ones(len(indices), dtype=bool)
+
+        else:
+            r_coords = rotateCoords(g_coords, -self._rotation)
+            tree = spatial.cKDTree(r_coords)
+
+            _, indices = tree.query(self._coords, k=1)
 
-        valid = np.logical_and(
-            np.isclose(r_coords[indices][:,0], self._coords[:,0], atol=tol[0]),
-            np.isclose(r_coords[indices][:,1], self._coords[:,1], atol=tol[1]),
-        )
+            valid = np.logical_and(
+                np.isclose(r_coords[indices][:,0], self._coords[:,0], atol=tol[0]),
+                np.isclose(r_coords[indices][:,1], self._coords[:,1], atol=tol[1]),
+            )
 
         if self._image_type == ImageTypes.LINESCAN and np.sum(valid) / indices.shape[0] < ImageItem.MATCHING_REQUIRED:
             self._poor_lss = True
@@ -69,12 +69,12 @@ class MultiImage(pg.GraphicsLayout):
 
 
 
-    def setData(self, index, values, coords=None, **kwargs):
+    def setData(self, index, values, coords=None, grid=None, **kwargs):
         # If new index, append instead of changing existing plot.
         if index == len(self.plots):
             # Coords are required if adding new data
             assert(not coords is None)
-            self._appendPlot(values, coords, **kwargs)
+            self._appendPlot(values, coords, grid=grid, **kwargs)
             self.order.append(index)
             return
         
@@ -83,7 +83,7 @@ class MultiImage(pg.GraphicsLayout):
 
         # If new coords, set coords.
         if not coords is None:
-            img.setCoords(coords)
+            img.setCoords(coords, grid=grid)
 
         # Set pixel values and options.
         img.setColours(values)
@@ -93,9 +93,9 @@ class MultiImage(pg.GraphicsLayout):
 
 
     
-    def insertData(self, index, values, coords, **kwargs):
+    def insertData(self, index, values, coords, grid=None, **kwargs):
         # Create a new image and LUT.
-        img = self._initItems(values, coords, **kwargs)
+        img = self._initItems(values, coords, grid=grid, **kwargs)
 
         # Insert plots.
         self.plots.insert(index, img)
@@ -115,22 +115,22 @@ class MultiImage(pg.GraphicsLayout):
         self.refresh()
 
     
-    def _appendPlot(self, values, coords, **kwargs):
+    def _appendPlot(self, values, coords, grid=None, **kwargs):
         # Create a new image and LUT.
-        img = self._initItems(values, coords, **kwargs)
+        img = self._initItems(values, coords, grid=grid, **kwargs)
 
         self.plots.append(img)
 
         self.refresh()
 
     
-    def _initItems(self, values, coords, **kwargs):
+    def _initItems(self, values, coords, grid=None, **kwargs):
         img_kwargs = {
             "composition_mode"  : self._composition_mode,
         } | kwargs
 
         # Initialise image and LUT.
-        img = ImageItem(coords, values, **img_kwargs)
+        img = ImageItem(coords, values, grid=grid, **img_kwargs)
 
         return img
     
@@ -51,13 +51,13 @@ class MultiPlotLayout(pg.GraphicsLayout):
             self.multilegend.move_data(from_, to_, self)
 
 
-    def setData(self, index, values, coords=None, **kwargs):
-        self.multiimage.setData(index, values, coords, **kwargs)
+    def setData(self, index, values, coords=None, grid=None, **kwargs):
+        self.multiimage.setData(index, values, coords, grid=grid, **kwargs)
         self.multilegend.setData(index, values, coords, **kwargs)
 
     
-    def insertData(self, index, values, coords, **kwargs):
-        self.multiimage.insertData(index, values, coords, **kwargs)
+    def insertData(self, index, values, coords, grid=None, **kwargs):
+        self.multiimage.insertData(index, values, coords, grid=grid, **kwargs)
         self.multilegend.insertData(index, values, coords, **kwargs)
 
 
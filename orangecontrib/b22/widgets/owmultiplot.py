@@ -62,6 +62,16 @@ def getCoords(table, attr_x, attr_y):
     ]).T
 
 
+def getGrid(table, attr_x, attr_y):
+    # The readers' grid descriptors are for their map_x and map_y.
+    names = [attr if isinstance(attr, str) else attr.name for attr in (attr_x, attr_y)]
+
+    if names != ["map_x", "map_y"]:
+        return None
+
+    return table.attributes.get("Grid")
+
+
 
 def newAction(title, parent, checked=None, callback=None, shortcuts=None):
     action = QtWidgets.QAction(title, parent)
@@ -368,7 +378,7 @@ class OWMultiPlot(widget.OWWidget):
     def __task_complete(self, result):
         assert QtCore.QThread.currentThread() is self.thread()
 
-        index, coords = result
+        index, coords, grid = result
 
         assert isinstance(self.status[index], Task)
 
@@ -385,7 +395,7 @@ class OWMultiPlot(widget.OWWidget):
         if isinstance(colours, Orange.data.Table):
             colours = colours.X
 
-        self.multiplot_layout.setData(index, colours, coords)
+        self.multiplot_layout.setData(index, colours, coords, grid=grid)
 
 
     def __task_finished(self):
@@ -409,9 +419,9 @@ class OWMultiPlot(widget.OWWidget):
     @staticmethod
     def _compute_coords(index, data, attr_x, attr_y):
         if data is None or attr_x is None or attr_y is None:
-            return index, None
+            return index, None, None
 
-        return index, getCoords(data, attr_x, attr_y)
+        return index, getCoords(data, attr_x, attr_y), getGrid(data, attr_x, attr_y)
     
 
 
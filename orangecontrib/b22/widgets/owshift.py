@@ -1,5 +1,9 @@
 import collections.abc
+import copy
 import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from collections import OrderedDict
 from xml.sax.saxutils import escape
 from decimal import Decimal
@@ -51,8 +55,24 @@ from orangecontrib.spectroscopy.widgets.line_geometry import in_polygon
 from orangecontrib.spectroscopy.widgets.utils import \
     SelectionGroupMixin, SelectionOutputsMixin
 
+from orangecontrib.b22.io.utils import table_from_numpy
+from orangecontrib.b22.preprocess import CumulativeIntegral, SharedSpectra
+from orangecontrib.b22.preprocess.shared import apply_shared
+from orangecontrib.b22.utils.plots import gridLinspaces
+
 IMAGE_TOO_BIG = 1024*1024*100
 
+# Memory for the image values kept by 'IntegralCache' (bytes).
+INTEGRAL_CACHE_BYTES = 256*1024*1024
+
+# Spectra above which integrals are computed in a process pool, if the
+# (opt-in) parallel integration is on.
+PARALLEL_ROWS = 200000
+
+# Largest number of worker processes; each is a Python interpreter with
+# Orange loaded.
+PARALLEL_WORKERS = 4
+
 
 class InterruptException(Exception):
     pass
@@ -66,6 +86,47 @@ class UndefinedImageException(Exception):
     pass
 
 
+class IntegralCache:
+    """A least recently used cache of computed image values.
+
+    Values are kept for keys of the data version, integration method and
+    limits, up to 'max_bytes' in total. Cached arrays are made read-only.
+    """
+
+    def __init__(self, max_bytes=INTEGRAL_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        values = self._entries.get(key) if key is not None else None
+        if values is not None:
+            self._entries.move_to_end(key)
+        return values
+
+    def put(self, key, values):
+        if key is None or values.nbytes > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self.nbytes -= self._entries.pop(key).nbytes
+
+        values.setflags(write=False)
+        self._entries[key] = values
+        self.nbytes += values.nbytes
+
+        while self.nbytes > self.max_bytes:
+            _, old = self._entries.popitem(last=False)
+            self.nbytes -= old.nbytes
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+
 def refresh_integral_markings(dis, markings_list, curveplot):
     for m in markings_list:
         if m in curveplot.markings:
@@ -627,6 +688,13 @@ class ImagePlot(QWidget, OWComponent, SelectionGroupMixin,
     attr_x = ContextSetting(None, exclude_attributes=True)
     attr_y = ContextSetting(None, exclude_attributes=True)
     gamma = Setting(0)
+    # Off by default: the spectra are copied to shared memory for the
+    # workers, so a map takes twice its memory while it is shown.
+    parallel = Setting(False)
+
+    # Memory for the cumulative sums of the integrals (bytes), or None
+    # for the default of 'CumulativeIntegral' (relative to the spectra).
+    cumulative_max_bytes = None
 
     image_updated = Signal()
 
@@ -706,6 +774,11 @@ class ImagePlot(QWidget, OWComponent, SelectionGroupMixin,
             box, self, "attr_y", label="Axis y:", callback=self.update_attr,
             model=self.xy_model, **common_options)
         box.setFocusProxy(self.cb_attr_x)
+        gui.checkBox(box, self, "parallel", "Integrate in parallel",
+                     tooltip=f"Integrate maps of at least {PARALLEL_ROWS} spectra in up to "
+                             f"{PARALLEL_WORKERS} worker processes.\nThe spectra are copied "
+                             "to shared memory, which doubles the memory they take.",
+                     callback=self.update_view)
 
         self.color_settings_box = self.setup_color_settings_box()
         self.rgb_settings_box = self.setup_rgb_settings_box()
@@ -722,6 +795,21 @@ class ImagePlot(QWidget, OWComponent, SelectionGroupMixin,
         self.data = None
         self.data_ids = {}
 
+        # Image values of earlier limits and methods; keys start with
+        # 'data_version', which changes with the data.
+        self.integral_cache = IntegralCache()
+        self.data_version = 0
+        self._image_values_key = None
+
+        # Integrals of any limits without a pass over the spectra, for
+        # the methods where this is exact.
+        self.cumulative = None
+
+        # Spectra in shared memory and the worker processes integrating
+        # them, both made on the first parallel computation.
+        self.shared_spectra = None
+        self.executor = None
+
     def init_interface_data(self, data):
         self.init_attr_values(data)
 
@@ -757,6 +845,10 @@ class ImagePlot(QWidget, OWComponent, SelectionGroupMixin,
             else self.attr_x
 
     def set_data(self, data):
+        # The running task may still use the cumulative sums and the
+        # shared spectra released below.
+        self.cancel()
+
         if data:
             self.data = data
             self.data_ids = {e: i for i, e in enumerate(data.ids)}
@@ -764,6 +856,16 @@ class ImagePlot(QWidget, OWComponent, SelectionGroupMixin,
             self.data = None
             self.data_ids = {}
 
+        if self.cumulative is not None:
+            self.cumulative.release()
+        self.cumulative = CumulativeIntegral(data, self.cumulative_max_bytes) \
+            if data else None
+        if self.shared_spectra is not None:
+            self.shared_spectra.close()
+        self.shared_spectra = SharedSpectra(data) if data else None
+        self.data_version += 1
+        self.integral_cache.clear()
+
 
     def _points_at_pos(self, pos):
         if self.data and self.lsx and self.lsy:
@@ -772,28 +874,65 @@ class ImagePlot(QWidget, OWComponent, SelectionGroupMixin,
             sel = (distance[:, 0] < _shift(self.lsx)) * (distance[:, 1] < _shift(self.lsy))
             return sel
 
-    def update_view(self):
+    def update_view(self, clear=True):
+        # With clear=False the current image stays until the new one is
+        # drawn, as for live updates while dragging the limits.
         self.cancel()
         self.parent.Error.image_too_big.clear()
         self.parent.Information.not_shown.clear()
-        self.img.clear()
-        self.img.setSelection(None)
-        self.legend.set_colors(None)
-        self.lsx = None
-        self.lsy = None
-        self.data_points = None
-        self.data_values = None
-        self.data_imagepixels = None
-        self.data_valid_positions = None
+        if clear:
+            self.img.clear()
+            self.img.setSelection(None)
+            self.legend.set_colors(None)
+            self.lsx = None
+            self.lsy = None
+            self.data_points = None
+            self.data_values = None
+            self.data_imagepixels = None
+            self.data_valid_positions = None
+
+        key = self.parent.image_values_key()
+        self._image_values_key = None if key is None else (self.data_version,) + key
+
+        image_values = self.parent.image_values()
+
+        # Only integrals are worth (and can be) sent to other processes.
+        executor = None
+        if self.parallel and self.data is not None and len(self.data) >= PARALLEL_ROWS \
+                and isinstance(image_values, Integrate):
+            executor = self.get_executor()
 
         self.start(self.compute_image, self.data, self.attr_x, self.attr_y,
-                    self.parent.image_values(),
-                    self.parent.image_values_fixed_levels())
+                    image_values,
+                    self.parent.image_values_fixed_levels(),
+                    cached=self.integral_cache.get(self._image_values_key),
+                    cumulative=self.cumulative,
+                    executor=executor, shared=self.shared_spectra)
+
+    def get_executor(self):
+        if self.executor is None:
+            # Forking the (multithreaded) Qt process is unsafe.
+            self.executor = ProcessPoolExecutor(
+                min(os.cpu_count() or 1, PARALLEL_WORKERS),
+                mp_context=multiprocessing.get_context("spawn"))
+        return self.executor
+
+    def shutdown(self):
+        super().shutdown()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        if self.shared_spectra is not None:
+            self.shared_spectra.close()
 
     def set_visible_image(self, img: np.ndarray, rect: QRectF):
         self.vis_img.setImage(img)
         self.vis_img.setRect(rect)
 
+    def set_visible_image_offset(self, offset_x: float, offset_y: float):
+        """Move the visible image by -offset, keeping the loaded image"""
+        self.vis_img.setPos(-offset_x, -offset_y)
+
     def show_visible_image(self):
         if self.vis_img not in self.plot.items:
             self.plot.addItem(self.vis_img)
@@ -810,7 +949,8 @@ class ImagePlot(QWidget, OWComponent, SelectionGroupMixin,
 
     @staticmethod
     def compute_image(data: Orange.data.Table, attr_x, attr_y,
-                      image_values, image_values_fixed_levels, state: TaskState):
+                      image_values, image_values_fixed_levels, state: TaskState,
+                      cached=None, cumulative=None, executor=None, shared=None):
 
         if data is None or attr_x is None or attr_y is None:
             raise UndefinedImageException
@@ -836,8 +976,16 @@ class ImagePlot(QWidget, OWComponent, SelectionGroupMixin,
         res.coorx = extract_col(data, xat)
         res.coory = extract_col(data, yat)
         res.data_points = np.hstack([res.coorx.reshape(-1, 1), res.coory.reshape(-1, 1)])
-        res.lsx = lsx = values_to_linspace(res.coorx)
-        res.lsy = lsy = values_to_linspace(res.coory)
+
+        # Tables from the readers describe their grid, which saves
+        # searching the coordinates for it.
+        grid = data.attributes.get("Grid") if (xat.name, yat.name) == ("map_x", "map_y") else None
+        lss = None if grid is None else gridLinspaces(grid, res.data_points)
+
+        if lss is None:
+            lss = values_to_linspace(res.coorx), values_to_linspace(res.coory)
+
+        res.lsx, res.lsy = lsx, lsy = lss
         res.image_values_fixed_levels = image_values_fixed_levels
         progress_interrupt(0)
 
@@ -845,13 +993,40 @@ class ImagePlot(QWidget, OWComponent, SelectionGroupMixin,
                 and lsx[-1] * lsy[-1] > IMAGE_TOO_BIG:
             raise ImageTooBigException((lsx[-1], lsy[-1]))
 
+        if cached is not None:
+            # computed before, for the same data, method and limits
+            res.d = cached
+            return res
+
+        if cumulative is not None and lsx is not None and lsy is not None \
+                and cumulative.supports(image_values):
+            # from the cumulative sums (computed on the first use)
+            res.d = cumulative.compute(image_values, callback=progress_interrupt)
+            return res
+
         ims = image_values(data[:1]).X
         d = np.full((data.X.shape[0], ims.shape[1]), float("nan"))
         res.d = d
 
         step = 100000 if len(data) > 1e6 else 10000
 
-        if lsx is not None and lsy is not None:
+        if lsx is not None and lsy is not None and executor is not None:
+            # the parts are integrated in worker processes, which read
+            # the spectra from shared memory
+            shm_name, shape, dtype = shared.get()
+            futures = {executor.submit(apply_shared, shm_name, shape, dtype,
+                                       data.domain.attributes, slice.start, slice.stop,
+                                       image_values): slice
+                       for slice in split_to_size(len(data), step)}
+            try:
+                for future in as_completed(futures):
+                    d[futures[future], :] = future.result()
+                    progress_interrupt(0)
+                    state.set_partial_result(res)
+            finally:
+                for future in futures:
+                    future.cancel()
+        elif lsx is not None and lsy is not None:
             # the code below does this, but part-wise:
             # d = image_values(data).X[:, 0]
             for slice in split_to_size(len(data), step):
@@ -908,6 +1083,8 @@ class ImagePlot(QWidget, OWComponent, SelectionGroupMixin,
             self.image_updated.emit()
 
     def on_done(self, res):
+        if res.lsx is not None and res.lsy is not None:
+            self.integral_cache.put(self._image_values_key, res.d)
         self.draw(res, finished=True)
 
     def on_partial_result(self, res):
@@ -1213,6 +1390,7 @@ class OWShift(OWWidget):
                                   color=(255, 140, 26))
         self.line5.sigMoved.connect(lambda v: setattr(self, "highlimb", v))
         for line in [self.line1, self.line2, self.line3, self.line4, self.line5]:
+            line.sigMoved.connect(self.moved_integral_range)
             line.sigMoveFinished.connect(self.changed_integral_range)
             self.curveplot.add_marking(line)
             line.hide()
@@ -1375,6 +1553,16 @@ class OWShift(OWWidget):
             return lambda data: \
                     data.transform(Domain([red, green, blue]))
 
+    def image_values_key(self):
+        """Return a key of the integral computed by 'image_values', or
+        None for other image values, which are not cached."""
+        if self.value_type != 0:
+            return None
+
+        imethod = self.integration_methods[self.integration_method]
+        limits = self.image_values().limits[0]
+        return (imethod.__name__,) + tuple(None if l is None else float(l) for l in limits)
+
     def image_values_fixed_levels(self):
         if self.value_type == 1 and isinstance(self.attr_value, DiscreteVariable):
             return 0, len(self.attr_value.values) - 1
@@ -1432,6 +1620,16 @@ class OWShift(OWWidget):
             return
         self.redraw_data()
 
+    def moved_integral_range(self):
+        # While dragging, redraw only integrals that need no pass over
+        # the spectra.
+        cumulative = self.imageplot.cumulative
+        if self.disable_integral_range or cumulative is None or not cumulative.prepared() \
+                or not cumulative.supports(self.image_values()):
+            return
+        self.redraw_integral_info()
+        self.imageplot.update_view(clear=False)
+
     def _change_integral_type(self):
         self._change_integration()
 
@@ -1457,6 +1655,7 @@ class OWShift(OWWidget):
         self._init_integral_boundaries()
         self.imageplot.update_view()
         self.update_visible_image()
+        self.update_visible_image_offset()
         self.commit.deferred()
 
     
@@ -1469,11 +1668,15 @@ class OWShift(OWWidget):
     def getOffsetData(self):
         if self.data is None:
             return None
-        
-        new_data = self.data.copy()
 
-        if self.offset_x != 0 or self.offset_y != 0:
-            images = new_data.attributes["visible_images"]
+        # The output shares the X, Y and metas arrays with the input; only
+        # the attributes and the shifted visible image records are copied.
+        attributes = dict(self.data.attributes)
+        images = attributes.get("visible_images")
+
+        if images is not None and (self.offset_x != 0 or self.offset_y != 0):
+            images = [dict(image) if isinstance(image, dict) else copy.copy(image)
+                      for image in images]
 
             for image in images:
                 if isinstance(image, dict):
@@ -1483,19 +1686,36 @@ class OWShift(OWWidget):
                     image.pos_x -= float(self.offset_x)
                     image.pos_y -= float(self.offset_y)
 
+            attributes["visible_images"] = images
+
+        # 'Table.from_numpy' would convert float32 spectra to float64.
+        new_data = table_from_numpy(
+            self.data.domain, self.data.X, dtype=self.data.X.dtype, Y=self.data.Y,
+            metas=self.data.metas, W=self.data.W, attributes=attributes, ids=self.data.ids)
+        new_data.name = self.data.name
+
         return new_data
     
 
     def offsetChanged(self):
-        data = self.getOffsetData()
-        self.imageplot.set_data(data)
-        self.init_visible_images(data)
+        # The offset only moves the visible images: the computed image
+        # is kept, the shown visible image is translated and the data is
+        # only copied (with the shifted positions) on commit.
+        self.update_visible_image_offset()
 
-        # Not entirely sure why this is needed, but it is.
-        if data is not None:
+        if self.data is not None:
             self.commit.deferred()
 
 
+    def update_visible_image_offset(self):
+        try:
+            offset_x, offset_y = float(self.offset_x), float(self.offset_y)
+        except (TypeError, ValueError):  # while typing, e.g. "-"
+            return
+
+        self.imageplot.set_visible_image_offset(offset_x, offset_y)
+
+
     def set_visual_settings(self, key, value):
         im_setter = self.imageplot.parameter_setter
         cv_setter = self.curveplot.parameter_setter
@@ -1 +1,2 @@
-from . import chiptransition
\ No newline at end of file
+from . import chiptransition
+from . import interferogram
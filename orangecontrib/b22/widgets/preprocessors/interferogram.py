@@ -0,0 +1,63 @@
+from AnyQt.QtWidgets import QFormLayout
+
+from Orange.widgets import gui
+from orangecontrib.spectroscopy.irfft import ApodFunc
+from orangecontrib.spectroscopy.widgets.preprocessors.registry import preprocess_editors
+from orangecontrib.spectroscopy.widgets.preprocessors.utils import BaseEditorOrange
+
+from orangecontrib.b22.preprocess import InterferogramFFT
+
+
+
+
+class InterferogramFFTEditor(BaseEditorOrange):
+    name = "Interferogram FFT"
+    qualname = "preprocessors.interferogramfft"
+
+    APOD_DEFAULT = ApodFunc.BLACKMAN_HARRIS_3
+    ZFF_DEFAULT = 1
+
+    # The same options as the FFT widget.
+    apod_opts = (
+        "Boxcar (None)",
+        "Blackman-Harris (3-term)",
+        "Blackman-Harris (4-term)",
+        "Blackman Nuttall (EP)",
+    )
+
+
+    def __init__(self, parent=None, **kwargs):
+        super().__init__(parent, **kwargs)
+
+        self.apod_func = int(self.APOD_DEFAULT)
+        self.zff = self.ZFF_DEFAULT
+
+        layout = QFormLayout()
+        self.controlArea.setLayout(layout)
+
+        apod = gui.comboBox(None, self, "apod_func", items=self.apod_opts,
+                            callback=self.edited.emit)
+        # An exponent, as in the FFT widget.
+        zff = gui.comboBox(None, self, "zff", items=[str(2**n) for n in range(10)],
+                           callback=self.edited.emit)
+
+        layout.addRow("Apodization function", apod)
+        layout.addRow("Zero filling factor", zff)
+
+
+    def setParameters(self, params):
+        self.apod_func = params.get("apod_func", int(self.APOD_DEFAULT))
+        self.zff = params.get("zff", self.ZFF_DEFAULT)
+
+
+    @classmethod
+    def createinstance(cls, params):
+        apod_func = params.get("apod_func", int(cls.APOD_DEFAULT))
+        zff = params.get("zff", cls.ZFF_DEFAULT)
+
+        return InterferogramFFT(apod_func=ApodFunc(apod_func), zff=2**zff)
+
+
+
+
+preprocess_editors.register(InterferogramFFTEditor, 202)
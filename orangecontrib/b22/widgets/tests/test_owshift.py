@@ -0,0 +1,235 @@
+# Test methods with long descriptive names can omit docstrings
+# pylint: disable=missing-docstring, abstract-method, protected-access
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+from PIL import Image
+
+from Orange.data import Table, Domain, ContinuousVariable
+from Orange.widgets.tests.base import WidgetTest
+
+from orangecontrib.b22.io.utils import table_from_numpy
+from orangecontrib.b22.widgets.owshift import OWShift, IntegralCache, PARALLEL_WORKERS
+
+
+
+
+def shift_data(image_ref, n_x=4, n_y=3, n_points=5):
+    """A map of spectra with one visible image."""
+    xs, ys = np.meshgrid(np.arange(n_x, dtype=float), np.arange(n_y, dtype=float))
+    X = np.random.RandomState(0).rand(n_x * n_y, n_points)
+
+    domain = Domain([ContinuousVariable(str(w)) for w in range(n_points)],
+                    metas=[ContinuousVariable("map_x"), ContinuousVariable("map_y")])
+    data = Table.from_numpy(domain, X, metas=np.column_stack((xs.ravel(), ys.ravel())))
+    data.attributes["visible_images"] = [{
+        "name": "camera", "image_ref": image_ref,
+        "pos_x": 1.0, "pos_y": 2.0, "pixel_size_x": 0.5, "pixel_size_y": 0.5,
+    }]
+
+    return data
+
+
+
+
+class TestOWShift(WidgetTest):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.image_ref = os.path.join(self.tmp.name, "camera.png")
+        Image.fromarray(np.zeros((4, 6, 3), dtype=np.uint8)).save(self.image_ref)
+
+        self.data = shift_data(self.image_ref)
+        self.widget = self.create_widget(OWShift)
+
+
+    def tearDown(self):
+        self.widget.onDeleteWidget()
+        self.tmp.cleanup()
+
+
+    def wait_for_image(self):
+        self.process_events(until=lambda: self.widget.imageplot.task is None)
+
+
+    def test_integral_cache(self):
+        self.send_signal(self.widget.Inputs.data, self.data)
+        self.wait_for_image()
+        first = self.widget.imageplot.data_values
+
+        self.widget.lowlim = 2
+        self.widget.redraw_data()
+        self.wait_for_image()
+        self.assertEqual(len(self.widget.imageplot.integral_cache), 2)
+
+        # Back to the first limits: the values are not computed again.
+        self.widget.lowlim = 0
+        self.widget.redraw_data()
+        self.wait_for_image()
+        self.assertIs(self.widget.imageplot.data_values, first)
+        self.assertFalse(first.flags.writeable)
+
+        # New data clears the cache.
+        self.send_signal(self.widget.Inputs.data, self.data[:5])
+        self.wait_for_image()
+        self.assertEqual(len(self.widget.imageplot.integral_cache), 1)
+        self.assertEqual(len(self.widget.imageplot.data_values), 5)
+
+
+    def test_cumulative_integral(self):
+        self.send_signal(self.widget.Inputs.data, self.data)
+        self.wait_for_image()
+        self.assertTrue(self.widget.imageplot.cumulative.prepared())
+        expected = self.widget.image_values()(self.data).X
+        np.testing.assert_allclose(self.widget.imageplot.data_values, expected)
+
+        # Dragging a limit redraws without integrating the spectra.
+        with patch("orangecontrib.spectroscopy.preprocess.Integrate.__call__") as integrate:
+            self.widget.line1.setValue(1)
+            self.widget.line1.sigMoved.emit(1)
+            self.wait_for_image()
+            integrate.assert_not_called()
+        self.assertEqual(self.widget.lowlim, 1)
+        np.testing.assert_allclose(self.widget.imageplot.data_values,
+                                   self.widget.image_values()(self.data).X)
+        self.assertFalse(np.allclose(self.widget.imageplot.data_values, expected))
+
+        # Peaks are integrated.
+        self.widget.integration_method = 2
+        self.widget._change_integral_type()
+        self.wait_for_image()
+        np.testing.assert_allclose(self.widget.imageplot.data_values,
+                                   self.widget.image_values()(self.data).X)
+
+        # Above the configured memory the spectra are integrated.
+        self.widget.imageplot.cumulative_max_bytes = 0
+        self.send_signal(self.widget.Inputs.data, self.data)
+        self.wait_for_image()
+        self.assertFalse(self.widget.imageplot.cumulative.valid())
+        self.assertFalse(self.widget.imageplot.cumulative.prepared())
+
+
+    def test_parallel(self):
+        self.assertFalse(self.widget.imageplot.parallel)
+        self.widget.imageplot.parallel = True
+        self.widget.integration_method = 2  # not from cumulative sums
+        self.send_signal(self.widget.Inputs.data, self.data)
+        self.wait_for_image()
+        serial = self.widget.imageplot.data_values
+
+        with patch("orangecontrib.b22.widgets.owshift.PARALLEL_ROWS", 1), \
+                patch("orangecontrib.b22.widgets.owshift.split_to_size",
+                      lambda n, _: [slice(i, min(i + 5, n)) for i in range(0, n, 5)]):
+            self.widget.imageplot.integral_cache.clear()
+            self.widget.redraw_data()
+            self.process_events(until=lambda: self.widget.imageplot.task is None, timeout=60000)
+
+        self.assertIsNotNone(self.widget.imageplot.executor)
+        self.assertLessEqual(self.widget.imageplot.executor._max_workers, PARALLEL_WORKERS)
+        self.assertIsNotNone(self.widget.imageplot.shared_spectra.shm)
+        self.assertIsNot(self.widget.imageplot.data_values, serial)
+        np.testing.assert_array_equal(self.widget.imageplot.data_values, serial)
+
+        # New data cancels the task and releases the old spectra for good.
+        shared = self.widget.imageplot.shared_spectra
+        cumulative = self.widget.imageplot.cumulative
+        with patch.object(self.widget.imageplot, "cancel",
+                          wraps=self.widget.imageplot.cancel) as cancel:
+            self.send_signal(self.widget.Inputs.data, self.data[:10])
+            cancel.assert_called()
+        self.assertTrue(shared.closed)
+        self.assertIsNone(shared.shm)
+        self.assertRaises(ValueError, shared.get)
+        self.assertFalse(cumulative.valid())
+        self.wait_for_image()
+
+
+    def test_integral_cache_budget(self):
+        cache = IntegralCache(max_bytes=3 * 80)
+
+        for i in range(4):
+            cache.put(i, np.zeros((10, 1)))
+        self.assertEqual(len(cache), 3)
+        self.assertIsNone(cache.get(0))
+
+        cache.get(1)
+        cache.put(4, np.zeros((10, 1)))
+        self.assertIsNotNone(cache.get(1))
+        self.assertIsNone(cache.get(2))
+
+        cache.put(5, np.zeros((100, 1)))
+        self.assertIsNone(cache.get(5))
+        self.assertEqual(cache.nbytes, 3 * 80)
+
+
+    def test_offset_moves_visible_image(self):
+        self.send_signal(self.widget.Inputs.data, self.data)
+        self.wait_for_image()
+
+        with patch.object(Table, "copy") as copy, \
+                patch.object(self.widget.imageplot, "start") as start, \
+                patch("orangecontrib.b22.widgets.owshift.Image.open") as open_image:
+            self.widget.offset_x, self.widget.offset_y = 0.5, -1.0
+            self.widget.offsetChanged()
+
+            copy.assert_not_called()
+            start.assert_not_called()
+            open_image.assert_not_called()
+
+        pos = self.widget.imageplot.vis_img.pos()
+        self.assertEqual((pos.x(), pos.y()), (-0.5, 1.0))
+        self.assertIs(self.widget.imageplot.data, self.data)
+
+
+    def test_offset_output(self):
+        self.widget.autocommit = True
+        self.send_signal(self.widget.Inputs.data, self.data)
+
+        self.widget.offset_x, self.widget.offset_y = 0.5, -1.0
+        self.widget.offsetChanged()
+        self.widget.commit.now()
+
+        out = self.get_output(self.widget.Outputs.data)
+        image = out.attributes["visible_images"][0]
+        self.assertEqual((image["pos_x"], image["pos_y"]), (0.5, 3.0))
+
+        # The input is not changed.
+        image = self.data.attributes["visible_images"][0]
+        self.assertEqual((image["pos_x"], image["pos_y"]), (1.0, 2.0))
+        np.testing.assert_array_equal(out.X, self.data.X)
+
+
+    def test_offset_output_shares_arrays(self):
+        self.send_signal(self.widget.Inputs.data, self.data)
+        self.widget.offset_x = 0.5
+
+        out = self.widget.getOffsetData()
+
+        self.assertTrue(np.shares_memory(out.X, self.data.X))
+        self.assertTrue(np.shares_memory(out.metas, self.data.metas))
+        np.testing.assert_array_equal(out.ids, self.data.ids)
+        self.assertIsNot(out.attributes, self.data.attributes)
+        self.assertEqual(out.attributes["visible_images"][0]["pos_x"], 0.5)
+        self.assertEqual(self.data.attributes["visible_images"][0]["pos_x"], 1.0)
+
+        # float32 spectra, as read in the float32 output mode.
+        data = table_from_numpy(self.data.domain, self.data.X, dtype=np.float32,
+                                metas=self.data.metas, attributes=self.data.attributes)
+        self.send_signal(self.widget.Inputs.data, data)
+        out = self.widget.getOffsetData()
+
+        self.assertEqual(out.X.dtype, np.float32)
+        self.assertTrue(np.shares_memory(out.X, data.X))
+
+        # Without visible images.
+        self.data.attributes = {}
+        self.send_signal(self.widget.Inputs.data, self.data)
+        self.assertEqual(self.widget.getOffsetData().attributes, {})
+
+
+
+
+if __name__ == "__main__":
+    unittest.main()